@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Gerador de carga para o serviço de reconhecimento facial.
+
+Reproduz tráfego de `/recognize`, `/enroll` e `/enrolled-users` com
+concorrência configurável e reporta latência p50/p95/p99 e RPS por endpoint.
+Opcionalmente sobe, no mesmo processo, um stub do serviço de autenticação
+(`src/auth_stub.py`) com latência configurável, dispensando a stack Java.
+
+Exemplo (com o servidor apontando para o stub):
+
+    AUTH_API_URL=http://127.0.0.1:8082 python src/api_server.py
+    python load_test.py --auth-stub --concurrency 8 --duration 30 --images amostras/
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+DEFAULT_MIX = "recognize=0.8,enroll=0.05,enrolled-users=0.15"
+
+
+def parse_mix(text):
+    """Converte 'recognize=0.8,enroll=0.1' em lista de (endpoint, peso)."""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ('recognize', 'enroll', 'enrolled-users'):
+            raise ValueError(f"Endpoint desconhecido no mix: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def load_images(images_dir):
+    """Carrega as imagens do diretório como base64 (JPEG/PNG)."""
+    images = []
+    for fname in sorted(os.listdir(images_dir)):
+        if fname.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(os.path.join(images_dir, fname), 'rb') as f:
+                images.append(base64.b64encode(f.read()).decode('utf-8'))
+    return images
+
+
+def synthetic_image(size=(480, 640)):
+    """Gera um quadro sintético (sem rosto) para medir o custo de decode/detecção."""
+    pixels = np.random.randint(0, 255, (size[0], size[1], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return float(np.percentile(values, p))
+
+
+class LoadStats:
+    """Acumula latências e erros por endpoint de forma thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, latency, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        report = {}
+        with self._lock:
+            for endpoint, values in sorted(self.latencies.items()):
+                report[endpoint] = {
+                    "requests": len(values),
+                    "errors": self.errors.get(endpoint, 0),
+                    "rps": len(values) / elapsed if elapsed > 0 else 0.0,
+                    "p50_ms": percentile(values, 50) * 1000,
+                    "p95_ms": percentile(values, 95) * 1000,
+                    "p99_ms": percentile(values, 99) * 1000,
+                }
+            total = sum(len(v) for v in self.latencies.values())
+        report["total"] = {"requests": total, "rps": total / elapsed if elapsed > 0 else 0.0}
+        return report
+
+
+class LoadGenerator:
+    """Dispara requisições contra o serviço facial seguindo um mix de endpoints."""
+
+    def __init__(self, base_url, images, user_ids, mix, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.images = images
+        self.user_ids = user_ids
+        self.endpoints = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.timeout = timeout
+        self.stats = LoadStats()
+        self._local = threading.local()
+
+    def _session(self):
+        # Uma sessão por thread para reaproveitar conexões keep-alive
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request_once(self):
+        endpoint = random.choices(self.endpoints, weights=self.weights)[0]
+        session = self._session()
+        start = time.perf_counter()
+        try:
+            if endpoint == 'recognize':
+                response = session.post(f"{self.base_url}/recognize",
+                                        json={"image": random.choice(self.images)},
+                                        timeout=self.timeout)
+            elif endpoint == 'enroll':
+                response = session.post(f"{self.base_url}/enroll",
+                                        json={"image": random.choice(self.images),
+                                              "user_id": random.choice(self.user_ids)},
+                                        timeout=self.timeout)
+            else:
+                response = session.get(f"{self.base_url}/enrolled-users", timeout=self.timeout)
+            # 400/404 são respostas de negócio válidas (ex.: nenhuma face detectada)
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        self.stats.record(endpoint, time.perf_counter() - start, ok)
+
+    def run(self, concurrency, duration=None, total_requests=None):
+        """Executa a carga por `duration` segundos ou até `total_requests` requisições."""
+        deadline = time.perf_counter() + duration if duration else None
+        counter = {"sent": 0}
+        counter_lock = threading.Lock()
+
+        def worker():
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if total_requests is not None:
+                    with counter_lock:
+                        if counter["sent"] >= total_requests:
+                            return
+                        counter["sent"] += 1
+                self.request_once()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        return self.stats.summary(time.perf_counter() - start)
+
+
+def print_report(report):
+    print()
+    print(f"{'endpoint':<16}{'reqs':>8}{'erros':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in report.items():
+        if endpoint == 'total':
+            continue
+        print(f"{endpoint:<16}{row['requests']:>8}{row['errors']:>8}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    total = report['total']
+    print(f"{'total':<16}{total['requests']:>8}{'':>8}{total['rps']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do serviço de reconhecimento facial")
+    parser.add_argument('--url', default="http://localhost:5000", help="URL do serviço facial")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30.0, help="Duração do teste (s)")
+    parser.add_argument('--requests', type=int, default=None,
+                        help="Número total de requisições (substitui --duration)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Pesos por endpoint")
+    parser.add_argument('--images', default=None, help="Diretório com imagens de rostos")
+    parser.add_argument('--auth-stub', action='store_true',
+                        help="Sobe o stub do serviço de autenticação neste processo")
+    parser.add_argument('--auth-port', type=int, default=8082)
+    parser.add_argument('--auth-latency', type=float, default=0.0)
+    parser.add_argument('--auth-jitter', type=float, default=0.0)
+    parser.add_argument('--auth-users', type=int, default=10)
+    parser.add_argument('--json', dest='json_out', default=None, help="Salva o relatório em JSON")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📈 TESTE DE CARGA - RECONHECIMENTO FACIAL")
+    print("=" * 60)
+
+    stub = None
+    if args.auth_stub:
+        from src.auth_stub import start_auth_stub, make_users
+        stub = start_auth_stub(port=args.auth_port, users=make_users(args.auth_users),
+                               latency=args.auth_latency, jitter=args.auth_jitter)
+        print(f"🔐 Stub de autenticação em {stub.url} (latência {args.auth_latency}s)")
+        print("   O servidor facial deve usar AUTH_API_URL apontando para este endereço")
+
+    if args.images:
+        images = load_images(args.images)
+        if not images:
+            print(f"❌ Nenhuma imagem encontrada em {args.images}")
+            sys.exit(1)
+    else:
+        print("⚠️  Sem --images: usando quadro sintético sem rosto (mede só decode/detecção)")
+        images = [synthetic_image()]
+
+    user_ids = list(range(1, args.auth_users + 1))
+    generator = LoadGenerator(args.url, images, user_ids, parse_mix(args.mix))
+    print(f"🚀 Concorrência {args.concurrency}, "
+          + (f"{args.requests} requisições" if args.requests else f"{args.duration:.0f}s"))
+
+    try:
+        report = generator.run(args.concurrency,
+                               duration=None if args.requests else args.duration,
+                               total_requests=args.requests)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Relatório salvo em {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
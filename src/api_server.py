@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, Response, send_from_directory, stream_with_context
 from flask_cors import CORS
 import cv2
 import yaml
@@ -6,12 +6,27 @@ import time
 import os
 import numpy as np
 import base64
+import functools
 import io
+import threading
 from PIL import Image
-import requests
 import logging
-from src.detectors import HaarDetector
-from src.utils import draw_box_and_label, load_encodings, save_encodings, enroll_face_in_memory
+from src.detectors import DetectorPool
+from src.quality import QualityGate
+from src.utils import draw_box_and_label
+from src.encoding import EncodingProfiles
+from src.gallery import Gallery
+from src.matching import identity_margin, match_faces, top_k_identities, verify_identity
+from src.sharding import ShardedGallery
+from src.tiered import TieredGallery
+from src.unknown_cache import UnknownFaceCache
+from src.compaction import EnrollmentPolicy
+from src.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.profiling import SamplingProfiler, check_admin_token, profile_call
+from src.streaming import StreamManager, expand_box, read_frames
+from src.persistence import GalleryPersister
+from src.image_store import ImageStore
+from src.user_directory import StaleDirectoryError, UserDirectory, normalize_name
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -26,19 +41,169 @@ with open('config.yaml') as f:
 
 FACES_DIR = 'faces'
 ENC_FILE = 'encodings/encodings.pkl'
-AUTH_API_URL = 'http://localhost:8082'  # URL do serviço de autenticação
-
-# Inicializa detector Haar Cascade
-haar_cfg = cfg.get('haar', {})
-haar = HaarDetector(
-    cascade_path='src/models/haarcascade_frontalface_default.xml',
-    scaleFactor=haar_cfg.get('scaleFactor', 1.1),
-    minNeighbors=haar_cfg.get('minNeighbors', 5),
-    minSize=tuple(haar_cfg.get('minSize', (30, 30)))
-)
+AUTH_API_URL = os.environ.get('AUTH_API_URL', 'http://localhost:8082')  # URL do serviço de autenticação
+
+# Pool de detectores do `method` configurado (haar, lbp ou hog), um por requisição concorrente
+detector = DetectorPool.from_config(cfg)
+
+# Filtro de qualidade aplicado antes do encoding
+quality_gate = QualityGate.from_config(cfg)
+
+# Perfis de encoding (landmarks, jitter, tamanho do recorte) por endpoint
+encoders = EncodingProfiles.from_config(cfg)
+
+# Carrega encodings cadastrados e a política de cadastro (deduplicação/limite)
+# Com `sharding.enabled`, a galeria fica particionada em shards HTTP (src/sharding.py)
+if cfg.get('sharding', {}).get('enabled', False):
+    gallery = ShardedGallery.from_config(cfg)
+else:
+    gallery = Gallery.from_config(cfg, ENC_FILE)
+# Com `gallery.hot_tier.enabled`, as identidades frequentes são buscadas primeiro (src/tiered.py)
+if cfg.get('gallery', {}).get('hot_tier', {}).get('enabled', False):
+    gallery = TieredGallery.from_config(
+        cfg, gallery, on_lookup=lambda hits, misses: (HOT_TIER_LOOKUPS.inc(hits, result='hit'),
+                                                      HOT_TIER_LOOKUPS.inc(misses, result='miss')))
+enrollment_policy = EnrollmentPolicy.from_config(cfg)
+
+# Reconhecimento de múltiplas faces por quadro
+recognition_cfg = cfg.get('recognition', {})
+MULTI_FACE_DEFAULT = recognition_cfg.get('multi_face', False)
+MAX_FACES = recognition_cfg.get('max_faces', 10)
+MAX_TOP_K = recognition_cfg.get('max_top_k', 10)
+# Distância que encerra a varredura em blocos da galeria antes do fim (None = varre tudo)
+EARLY_EXIT_DISTANCE = recognition_cfg.get('early_exit_distance')
+EARLY_EXIT_BLOCK_ROWS = recognition_cfg.get('early_exit_block_rows')
+
+# Métricas de latência por etapa e por endpoint (expostas em /metrics)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'facial_request_duration_seconds', 'Latência total das requisições por endpoint.', ['endpoint'])
+STAGE_SECONDS = REGISTRY.histogram(
+    'facial_stage_duration_seconds', 'Latência de cada etapa do pipeline por endpoint.', ['endpoint', 'stage'])
+FACES_DETECTED = REGISTRY.counter(
+    'facial_faces_detected_total', 'Faces detectadas pelo detector.', ['endpoint'])
+FACES_RECOGNIZED = REGISTRY.counter(
+    'facial_faces_recognized_total', 'Faces reconhecidas na galeria.', ['endpoint'])
+FACES_UNKNOWN = REGISTRY.counter(
+    'facial_faces_unknown_total', 'Faces sem correspondência na galeria.', ['endpoint'])
+ERRORS = REGISTRY.counter(
+    'facial_errors_total', 'Erros de processamento por endpoint.', ['endpoint'])
+GALLERY_SIZE = REGISTRY.gauge('facial_gallery_size', 'Quantidade de embeddings na galeria.')
+GALLERY_SIZE.set_function(lambda: len(gallery))
+IN_FLIGHT = REGISTRY.gauge('facial_requests_in_flight', 'Requisições em processamento (fila).')
+DETECTOR_WAITING = REGISTRY.gauge('facial_detector_pool_waiting', 'Requisições aguardando um detector livre.')
+DETECTOR_WAITING.set_function(lambda: detector.waiting)
+GALLERY_SAVE_SECONDS = REGISTRY.histogram(
+    'facial_gallery_save_duration_seconds', 'Duração de cada gravação da galeria em background.')
+HOT_TIER_LOOKUPS = REGISTRY.counter(
+    'facial_gallery_hot_tier_lookups_total', 'Buscas resolvidas pela camada quente da galeria (hit) ou não (miss).',
+    ['result'])
+UNKNOWN_CACHE_LOOKUPS = REGISTRY.counter(
+    'facial_unknown_cache_lookups_total', 'Faces respondidas pelo cache de desconhecidos (hit) ou não (miss).',
+    ['result'])
+QUALITY_REJECTED = REGISTRY.counter(
+    'facial_quality_rejected_total', 'Recortes descartados pelo filtro de qualidade.', ['endpoint'])
+STREAM_FRAMES = REGISTRY.counter(
+    'facial_stream_frames_total', 'Quadros recebidos nas sessões de streaming, por destino.', ['status'])
+
+# Trabalho fora de uma requisição (workers de streaming) informa o próprio endpoint
+_background = threading.local()
+
+# Desconhecidos recentes: evita varrer a galeria de novo para o mesmo visitante
+unknown_cache = UnknownFaceCache.from_config(
+    cfg, on_lookup=lambda hits, misses: (UNKNOWN_CACHE_LOOKUPS.inc(hits, result='hit'),
+                                         UNKNOWN_CACHE_LOOKUPS.inc(misses, result='miss')))
+
+# Gravação da galeria agrupada em background (uma escrita atômica por intervalo)
+persister = GalleryPersister.from_config(
+    cfg, gallery, ENC_FILE, on_save=GALLERY_SAVE_SECONDS.observe).start()
+persister.install_shutdown_hook()
+
+# Imagens cadastradas: deduplicadas por hash e gravadas em background
+image_store = ImageStore.from_config(cfg, FACES_DIR)
+IMAGE_STORE_PENDING = REGISTRY.gauge('facial_image_store_pending', 'Imagens aguardando gravação em disco.')
+IMAGE_STORE_PENDING.set_function(lambda: image_store.pending)
+
+# Réplica local dos usuários do serviço de auth, sincronizada em lote (GET /auth) em background
+USER_DIRECTORY_STALE_READS = REGISTRY.counter(
+    'facial_user_directory_stale_reads_total', 'Leituras da réplica de usuários feitas com ela desatualizada.')
+
+def _stale_directory_read():
+    USER_DIRECTORY_STALE_READS.inc()
+    if has_request_context():
+        g.user_directory_stale = True
+
+user_directory = UserDirectory.from_config(cfg, AUTH_API_URL, on_stale_read=_stale_directory_read).start()
+ENROLLED_PAGE_DEFAULT = 100
+ENROLLED_PAGE_MAX = 1000
+
+def _endpoint():
+    """Nome do endpoint Flask atual, usado como label das métricas."""
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return getattr(_background, 'endpoint', 'local')
+
+def timed_stage(stage):
+    """Context manager que mede uma etapa do pipeline no endpoint atual."""
+    return STAGE_SECONDS.time(endpoint=_endpoint(), stage=stage)
+
+@app.before_request
+def _start_request_metrics():
+    g.request_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def _flag_stale_directory(response):
+    """Marca respostas montadas com a réplica de usuários desatualizada (`on_stale: flag`)."""
+    if g.get('user_directory_stale'):
+        response.headers['X-User-Directory-Stale'] = 'true'
+        if response.is_json and isinstance(response.get_json(), dict):
+            response.set_data(app.json.dumps({**response.get_json(), "user_directory_stale": True}))
+    return response
+
+@app.errorhandler(StaleDirectoryError)
+def _stale_directory(e):
+    """`on_stale: fail`: a réplica passou de `max_staleness` e as leituras são recusadas."""
+    return jsonify({"success": False, "error": str(e)}), 503
 
-# Carrega encodings cadastrados
-known_encodings, known_names = load_encodings(ENC_FILE)
+@app.after_request
+def _finish_request_metrics(response):
+    endpoint = _endpoint()
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    if response.status_code >= 500:
+        ERRORS.inc(endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def _release_in_flight(exc):
+    IN_FLIGHT.dec()
+
+# Profiling sob demanda (protegido por token de administrador)
+profiling_cfg = cfg.get('profiling', {})
+PROFILE_DIR = profiling_cfg.get('output_dir', 'profiles')
+ADMIN_TOKEN = os.environ.get('FACE_ADMIN_TOKEN')
+sampler = SamplingProfiler(PROFILE_DIR, interval=profiling_cfg.get('sample_interval', 0.005))
+
+def _admin_authorized():
+    return check_admin_token(request.headers.get('X-Admin-Token'), ADMIN_TOKEN)
+
+def profiled(view):
+    """Executa a view sob cProfile quando pedido via `X-Profile` ou `?profile=`.
+
+    Com valor `return` o resumo do pstats volta no corpo da resposta; em
+    qualquer caso o `.prof` é gravado e seu nome vai no header `X-Profile-File`.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        flag = request.headers.get('X-Profile') or request.args.get('profile')
+        if not flag or not _admin_authorized():
+            return view(*args, **kwargs)
+        result, path, summary = profile_call(PROFILE_DIR, request.endpoint, view, *args, **kwargs)
+        response = app.make_response(result)
+        if flag == 'return' and response.is_json:
+            response.set_data(app.json.dumps({**response.get_json(), "profile": summary}))
+        response.headers['X-Profile-File'] = os.path.basename(path)
+        return response
+    return wrapper
 
 def base64_to_image(base64_string):
     """Converte string base64 para imagem OpenCV."""
@@ -61,52 +226,113 @@ def base64_to_image(base64_string):
         logger.error(f"Erro ao converter base64 para imagem: {e}")
         return None
 
-def recognize_face(image):
-    """Reconhece face na imagem e retorna o nome se encontrado."""
+def _largest_face(boxes):
+    """Maior caixa `(x, y, w, h)`: a mesma face escolhida no cadastro e na verificação."""
+    return max((tuple(int(v) for v in b) for b in boxes), key=lambda b: b[2] * b[3])
+
+def _best_matches(candidates, tolerance):
+    """`(nome ou None, distância)` da melhor identidade de cada lista de candidatos."""
+    return [(c[0][0] if c and c[0][1] <= tolerance else None, c[0][1] if c else None) for c in candidates]
+
+def _match_early_exit(probes, gallery, tolerance):
+    """Como `match_faces`, encerrando a varredura em blocos em `EARLY_EXIT_DISTANCE`."""
+    return match_faces(probes, gallery, tolerance, early_exit=EARLY_EXIT_DISTANCE, block_rows=EARLY_EXIT_BLOCK_ROWS)
+
+def recognize_faces(image, max_faces=1, roi=None, top_k=0):
+    """Reconhece até `max_faces` faces da imagem (maiores primeiro).
+
+    Todas as faces aprovadas no filtro de qualidade são encodadas numa única
+    chamada ao dlib e comparadas com a galeria numa única operação matricial.
+    Com `roi`, a detecção roda primeiro só nessa região e cai para o quadro
+    inteiro se nada for encontrado. Com `top_k`, cada face traz também as
+    `candidates` (melhores identidades) e a `margin` entre a primeira e a segunda.
+    Retorna `(faces, mensagem)`, onde cada face é um dict com `box`, `name`,
+    `distance` e `message`.
+    """
+    endpoint = _endpoint()
     try:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        faces = haar.detect(gray)
+        with timed_stage('detect'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            boxes = detector.detect(gray, roi=roi) if roi is not None else []
+            if len(boxes) == 0:
+                boxes = detector.detect(gray)
         
-        if len(faces) == 0:
-            return None, "Nenhuma face detectada"
+        if len(boxes) == 0:
+            return [], "Nenhuma face detectada"
+        FACES_DETECTED.inc(len(boxes), endpoint=endpoint)
         
-        # Pega a primeira face detectada
-        (x, y, w, h) = faces[0]
-        face_crop = image[y:y+h, x:x+w]
+        boxes = sorted((tuple(int(v) for v in b) for b in boxes), key=lambda b: b[2] * b[3], reverse=True)
+        faces = [{"box": box, "name": None, "distance": None, "message": None} for box in boxes[:max_faces]]
         
-        # Reconhecimento via face_recognition
-        face_rgb = face_crop[:, :, ::-1]
-        import face_recognition
-        encodings = face_recognition.face_encodings(face_rgb)
+        # Descarta recortes ruins antes do encoder (mais caro)
+        accepted = []
+        with timed_stage('quality'):
+            for face in faces:
+                x, y, w, h = face["box"]
+                ok, reason, _ = quality_gate.check(image[y:y+h, x:x+w])
+                if ok:
+                    accepted.append(face)
+                else:
+                    face["message"] = reason
+                    QUALITY_REJECTED.inc(endpoint=endpoint)
+        if not accepted:
+            return faces, faces[0]["message"]
         
-        if not encodings:
-            return None, "Não foi possível extrair características da face"
+        # Reconhecimento via face_recognition (uma chamada para todas as faces)
+        with timed_stage('encode'):
+            encodings = encoders.for_endpoint(endpoint).encode(image, [face["box"] for face in accepted])
         
-        distances = face_recognition.face_distance(known_encodings, encodings[0])
-        if len(distances) > 0:
-            min_idx = np.argmin(distances)
-            if distances[min_idx] <= cfg['face_recog']['tolerance']:
-                return known_names[min_idx], "Face reconhecida"
+        tolerance = cfg['face_recog']['tolerance']
+        with timed_stage('match'):
+            if top_k:
+                candidates = top_k_identities(encodings, gallery, top_k, early_exit=EARLY_EXIT_DISTANCE,
+                                              block_rows=EARLY_EXIT_BLOCK_ROWS)
+                matches = _best_matches(candidates, tolerance)
+                for face, c in zip(accepted, candidates):
+                    face["candidates"] = [{"nome": name, "distance": distance} for name, distance in c]
+                    face["margin"] = identity_margin(c)
+            else:
+                matcher = _match_early_exit if EARLY_EXIT_DISTANCE is not None else match_faces
+                if unknown_cache is not None:
+                    # Desconhecidos repetidos (visitantes) são respondidos sem varrer a galeria
+                    matches = unknown_cache.match(encodings, gallery, tolerance, matcher)
+                else:
+                    matches = matcher(encodings, gallery, tolerance)
+        for face, (name, distance) in zip(accepted, matches):
+            face["name"], face["distance"] = name, distance
+            if name:
+                face["message"] = "Face reconhecida"
+                FACES_RECOGNIZED.inc(endpoint=endpoint)
+            else:
+                face["message"] = "Face não reconhecida"
+                FACES_UNKNOWN.inc(endpoint=endpoint)
         
-        return None, "Face não reconhecida"
+        return faces, faces[0]["message"]
         
     except Exception as e:
+        ERRORS.inc(endpoint=endpoint)
         logger.error(f"Erro no reconhecimento facial: {e}")
-        return None, f"Erro no processamento: {str(e)}"
+        return [], f"Erro no processamento: {str(e)}"
+
+def recognize_face(image):
+    """Reconhece face na imagem e retorna o nome se encontrado."""
+    faces, message = recognize_faces(image, max_faces=1)
+    if faces and faces[0]["name"]:
+        return faces[0]["name"], message
+    return None, message
 
 def get_user_by_name(name):
-    """Busca usuário no sistema de autenticação pelo nome."""
-    try:
-        response = requests.get(f"{AUTH_API_URL}/auth")
-        if response.status_code == 200:
-            users = response.json()
-            for user in users:
-                if user.get('nome', '').lower() == name.lower():
-                    return user
-        return None
-    except Exception as e:
-        logger.error(f"Erro ao buscar usuário: {e}")
-        return None
+    """Busca usuário pelo nome na réplica local do serviço de autenticação."""
+    with timed_stage('auth'):
+        return user_directory.get_by_name(name)
+
+def get_users_by_names(names):
+    """Busca vários usuários na réplica local, sem chamar o serviço de autenticação.
+
+    Retorna um dict indexado pelo nome normalizado (`normalize_name`).
+    """
+    with timed_stage('auth'):
+        return user_directory.get_by_names(names)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -114,10 +340,26 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "facial-recognition-api",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "gallery": {
+            "generation": gallery.generation,
+            "persisted_generation": persister.persisted_generation,
+            "pending": persister.pending,
+            "writes": persister.writes,
+            "last_error": persister.last_error,
+            "hot_tier": gallery.stats() if isinstance(gallery, TieredGallery) else None,
+            "unknown_cache": unknown_cache.stats() if unknown_cache is not None else None
+        },
+        "user_directory": user_directory.status()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposição das métricas no formato texto do Prometheus."""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/recognize', methods=['POST'])
+@profiled
 def recognize():
     """Endpoint para reconhecimento facial."""
     try:
@@ -129,15 +371,31 @@ def recognize():
             }), 400
         
         # Converte base64 para imagem
-        image = base64_to_image(data['image'])
+        with timed_stage('decode'):
+            image = base64_to_image(data['image'])
         if image is None:
             return jsonify({
                 "success": False,
                 "error": "Erro ao processar imagem"
             }), 400
         
-        # Reconhece a face
-        name, message = recognize_face(image)
+        # Reconhece as faces (por padrão apenas a maior)
+        # `top_k` > 0 inclui as melhores identidades candidatas e a margem
+        try:
+            top_k = min(max(int(data.get('top_k', 0)), 0), MAX_TOP_K)
+        except (TypeError, ValueError):
+            return jsonify({
+                "success": False,
+                "error": "top_k inválido"
+            }), 400
+        multi = data.get('multi', MULTI_FACE_DEFAULT)
+        if multi:
+            return jsonify(_multi_face_response(image, top_k))
+        faces, message = recognize_faces(image, max_faces=1, top_k=top_k)
+        name = faces[0]["name"] if faces else None
+        ranking = {}
+        if top_k and faces and "candidates" in faces[0]:
+            ranking = {"candidates": faces[0]["candidates"], "margin": faces[0]["margin"]}
         
         if name:
             # Busca dados do usuário no sistema de autenticação
@@ -152,7 +410,8 @@ def recognize():
                         "email": user.get('email'),
                         "perfil": user.get('perfil')
                     },
-                    "message": message
+                    "message": message,
+                    **ranking
                 })
             else:
                 return jsonify({
@@ -161,15 +420,19 @@ def recognize():
                     "user": {
                         "nome": name
                     },
-                    "message": f"Face reconhecida como {name}, mas usuário não encontrado no sistema"
+                    "message": f"Face reconhecida como {name}, mas usuário não encontrado no sistema",
+                    **ranking
                 })
         else:
             return jsonify({
                 "success": True,
                 "recognized": False,
-                "message": message
+                "message": message,
+                **ranking
             })
             
+    except StaleDirectoryError:
+        raise
     except Exception as e:
         logger.error(f"Erro no endpoint /recognize: {e}")
         return jsonify({
@@ -177,7 +440,140 @@ def recognize():
             "error": "Erro interno do servidor"
         }), 500
 
+def _multi_face_response(image, top_k=0):
+    """Monta a resposta do /recognize com todas as faces do quadro."""
+    faces, message = recognize_faces(image, max_faces=MAX_FACES, top_k=top_k)
+    names = [face["name"] for face in faces if face["name"]]
+    users = get_users_by_names(names) if names else {}
+    results = []
+    for face in faces:
+        x, y, w, h = face["box"]
+        entry = {
+            "box": {"x": x, "y": y, "w": w, "h": h},
+            "recognized": face["name"] is not None,
+            "distance": face["distance"],
+            "message": face["message"]
+        }
+        if "candidates" in face:
+            entry["candidates"], entry["margin"] = face["candidates"], face["margin"]
+        if face["name"]:
+            user = users.get(normalize_name(face["name"]))
+            entry["user"] = {
+                "id": user.get('id'),
+                "nome": user.get('nome'),
+                "email": user.get('email'),
+                "perfil": user.get('perfil')
+            } if user else {"nome": face["name"]}
+        results.append(entry)
+    return {
+        "success": True,
+        "recognized": any(r["recognized"] for r in results),
+        "faces": results,
+        "message": message
+    }
+
+@app.route('/verify', methods=['POST'])
+@profiled
+def verify():
+    """Verificação 1:1: confere se a face da imagem é do `user_id` informado.
+
+    Compara apenas com os embeddings daquela identidade, então o custo não
+    depende do tamanho da galeria.
+    """
+    try:
+        data = request.get_json()
+        if not data or 'image' not in data or 'user_id' not in data:
+            return jsonify({
+                "success": False,
+                "error": "Imagem e user_id são obrigatórios"
+            }), 400
+        
+        # Id desconhecido força uma sincronização: o usuário pode ter acabado de ser criado
+        with timed_stage('auth'):
+            user = user_directory.get_by_id(data['user_id'], refresh_on_miss=True)
+        if user is None:
+            return jsonify({
+                "success": False,
+                "error": "Usuário não encontrado"
+            }), 404
+        user_name = user.get('nome')
+        
+        with timed_stage('decode'):
+            image = base64_to_image(data['image'])
+        if image is None:
+            return jsonify({
+                "success": False,
+                "error": "Erro ao processar imagem"
+            }), 400
+        
+        with timed_stage('detect'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            faces = detector.detect(gray)
+        if len(faces) == 0:
+            return jsonify({
+                "success": False,
+                "error": "Nenhuma face detectada na imagem"
+            }), 400
+        FACES_DETECTED.inc(len(faces), endpoint=_endpoint())
+        
+        # Considera a maior face do quadro
+        (x, y, w, h) = _largest_face(faces)
+        with timed_stage('quality'):
+            ok, reason, scores = quality_gate.check(image[y:y+h, x:x+w])
+        if not ok:
+            QUALITY_REJECTED.inc(endpoint=_endpoint())
+            return jsonify({
+                "success": False,
+                "error": reason,
+                "quality": scores
+            }), 400
+        
+        with timed_stage('encode'):
+            encodings = encoders.for_endpoint(_endpoint()).encode(image, [(x, y, w, h)])
+        if not encodings:
+            return jsonify({
+                "success": False,
+                "error": "Não foi possível extrair características da face"
+            }), 400
+        
+        with timed_stage('match'):
+            match, distance, margin = verify_identity(
+                encodings[0], gallery, user_name, cfg['face_recog']['tolerance'])
+        if distance is None:
+            return jsonify({
+                "success": False,
+                "error": f"Usuário {user_name} não possui face cadastrada"
+            }), 404
+        if match:
+            FACES_RECOGNIZED.inc(endpoint=_endpoint())
+        else:
+            FACES_UNKNOWN.inc(endpoint=_endpoint())
+        
+        return jsonify({
+            "success": True,
+            "match": match,
+            "distance": distance,
+            "margin": margin,
+            "user": {
+                "id": user.get('id'),
+                "nome": user_name,
+                "email": user.get('email'),
+                "perfil": user.get('perfil')
+            },
+            "message": "Identidade confirmada" if match else "Face não corresponde ao usuário"
+        })
+        
+    except StaleDirectoryError:
+        raise
+    except Exception as e:
+        logger.error(f"Erro no endpoint /verify: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Erro interno do servidor"
+        }), 500
+
 @app.route('/enroll', methods=['POST'])
+@profiled
 def enroll():
     """Endpoint para cadastro de nova face."""
     try:
@@ -189,18 +585,20 @@ def enroll():
             }), 400
         
         # Busca dados do usuário
-        user_response = requests.get(f"{AUTH_API_URL}/auth/{data['user_id']}")
-        if user_response.status_code != 200:
+        # Id desconhecido força uma sincronização: o usuário pode ter acabado de ser criado
+        with timed_stage('auth'):
+            user = user_directory.get_by_id(data['user_id'], refresh_on_miss=True)
+        if user is None:
             return jsonify({
                 "success": False,
                 "error": "Usuário não encontrado"
             }), 404
         
-        user = user_response.json()
         user_name = user.get('nome')
         
         # Converte base64 para imagem
-        image = base64_to_image(data['image'])
+        with timed_stage('decode'):
+            image = base64_to_image(data['image'])
         if image is None:
             return jsonify({
                 "success": False,
@@ -208,36 +606,62 @@ def enroll():
             }), 400
         
         # Detecta face na imagem
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        faces = haar.detect(gray)
+        with timed_stage('detect'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            faces = detector.detect(gray)
         
         if len(faces) == 0:
             return jsonify({
                 "success": False,
                 "error": "Nenhuma face detectada na imagem"
             }), 400
+        FACES_DETECTED.inc(len(faces), endpoint=_endpoint())
         
-        # Pega a primeira face detectada
-        (x, y, w, h) = faces[0]
+        # Pega a maior face, como /recognize e /verify (com várias pessoas no quadro,
+        # a primeira caixa do detector pode ser de outra pessoa)
+        (x, y, w, h) = _largest_face(faces)
         face_crop = image[y:y+h, x:x+w]
         
-        # Cria diretório do usuário se não existir
-        user_dir = os.path.join(FACES_DIR, user_name)
-        os.makedirs(user_dir, exist_ok=True)
+        # Rejeita recortes de baixa qualidade antes de salvar/encodar
+        with timed_stage('quality'):
+            ok, reason, scores = quality_gate.check(face_crop)
+        if not ok:
+            QUALITY_REJECTED.inc(endpoint=_endpoint())
+            return jsonify({
+                "success": False,
+                "error": reason,
+                "quality": scores
+            }), 400
         
-        # Salva a imagem
-        timestamp = int(time.time())
-        image_path = os.path.join(user_dir, f"{timestamp}.jpg")
-        cv2.imwrite(image_path, face_crop)
+        # Gera o encoding e o adiciona à memória, salvo se redundante
+        with timed_stage('encode'):
+            encodings = encoders.for_endpoint(_endpoint()).encode(image, [(x, y, w, h)])
+        if not encodings:
+            return jsonify({
+                "success": False,
+                "error": "Não foi possível extrair características da face"
+            }), 400
+        if not enrollment_policy.enroll(gallery, encodings[0], user_name):
+            return jsonify({
+                "success": True,
+                "added": False,
+                "message": f"Amostra redundante para {user_name} (muito semelhante a uma já cadastrada ou fora dos representantes mantidos); nada foi adicionado",
+                "user": {
+                    "id": user.get('id'),
+                    "nome": user.get('nome'),
+                    "email": user.get('email')
+                }
+            })
         
-        # Adiciona encoding à memória
-        enroll_face_in_memory(face_crop, user_name, known_encodings, known_names)
+        # Imagem gravada em background, com nome pelo hash do conteúdo
+        image_store.put(user_name, face_crop)
         
-        # Salva encodings atualizados
-        save_encodings(known_encodings, known_names, ENC_FILE)
+        # Gravação dos encodings fica com o persister em background
+        persister.mark_dirty()
         
         return jsonify({
             "success": True,
+            "added": True,
             "message": f"Face cadastrada com sucesso para {user_name}",
             "user": {
                 "id": user.get('id'),
@@ -246,6 +670,8 @@ def enroll():
             }
         })
         
+    except StaleDirectoryError:
+        raise
     except Exception as e:
         logger.error(f"Erro no endpoint /enroll: {e}")
         return jsonify({
@@ -253,31 +679,61 @@ def enroll():
             "error": "Erro interno do servidor"
         }), 500
 
+def _encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
 @app.route('/enrolled-users', methods=['GET'])
 def get_enrolled_users():
-    """Retorna lista de usuários com faces cadastradas."""
+    """Retorna lista paginada de usuários com faces cadastradas.
+
+    Aceita `limit` e `cursor` (o `next_cursor` da página anterior). O ETag
+    muda junto com a galeria, as imagens e os dados de usuários, então
+    `If-None-Match` com o ETag atual recebe 304.
+    """
     try:
+        try:
+            limit = min(max(int(request.args.get('limit', ENROLLED_PAGE_DEFAULT)), 1), ENROLLED_PAGE_MAX)
+            cursor = request.args.get('cursor')
+            after = _decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Parâmetros de paginação inválidos"
+            }), 400
+        
+        etag = f"{gallery.generation}-{image_store.generation}-{user_directory.version}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        # Contagens vêm dos manifestos em memória, sem varrer diretórios
+        items, has_more = image_store.page(limit, after)
         enrolled_users = []
-        if os.path.exists(FACES_DIR):
-            for name in os.listdir(FACES_DIR):
-                user_dir = os.path.join(FACES_DIR, name)
-                if os.path.isdir(user_dir):
-                    # Busca dados do usuário no sistema de autenticação
-                    user = get_user_by_name(name)
-                    if user:
-                        enrolled_users.append({
-                            "id": user.get('id'),
-                            "nome": user.get('nome'),
-                            "email": user.get('email'),
-                            "perfil": user.get('perfil'),
-                            "faces_count": len([f for f in os.listdir(user_dir) if f.endswith('.jpg')])
-                        })
+        for name, faces_count in items:
+            user = user_directory.get_by_name(name)
+            if user:
+                enrolled_users.append({
+                    "id": user.get('id'),
+                    "nome": user.get('nome'),
+                    "email": user.get('email'),
+                    "perfil": user.get('perfil'),
+                    "faces_count": faces_count
+                })
         
-        return jsonify({
+        response = jsonify({
             "success": True,
-            "users": enrolled_users
+            "users": enrolled_users,
+            "next_cursor": _encode_cursor(items[-1][0]) if has_more else None
         })
+        response.set_etag(etag, weak=True)
+        return response
         
+    except StaleDirectoryError:
+        raise
     except Exception as e:
         logger.error(f"Erro no endpoint /enrolled-users: {e}")
         return jsonify({
@@ -289,23 +745,19 @@ def get_enrolled_users():
 def delete_user_face(user_name):
     """Remove face cadastrada de um usuário."""
     try:
-        user_dir = os.path.join(FACES_DIR, user_name)
-        if os.path.exists(user_dir):
-            # Remove arquivos de imagem
-            for f in os.listdir(user_dir):
-                os.remove(os.path.join(user_dir, f))
-            os.rmdir(user_dir)
-            
-            # Remove da memória
-            global known_encodings, known_names
-            indices = [i for i, n in enumerate(known_names) if n == user_name]
-            for i in sorted(indices, reverse=True):
-                del known_names[i]
-                del known_encodings[i]
-            
-            # Salva encodings atualizados
-            save_encodings(known_encodings, known_names, ENC_FILE)
-            
+        # Imagens e embeddings podem existir um sem o outro (ex.: galeria importada)
+        has_images = image_store.has_user(user_name)
+        if has_images:
+            # Remove as imagens (em background)
+            image_store.delete_user(user_name)
+        
+        # Remove da memória
+        removed = gallery.remove(user_name)
+        if removed:
+            # Gravação dos encodings fica com o persister em background
+            persister.mark_dirty()
+        
+        if has_images or removed:
             return jsonify({
                 "success": True,
                 "message": f"Face removida com sucesso para {user_name}"
@@ -323,8 +775,173 @@ def delete_user_face(user_name):
             "error": "Erro interno do servidor"
         }), 500
 
+@app.route('/admin/profiler/start', methods=['POST'])
+def start_sampling_profiler():
+    """Liga o profiler por amostragem de pilhas."""
+    if not _admin_authorized():
+        return jsonify({"success": False, "error": "Não autorizado"}), 403
+    interval = request.args.get('interval', type=float)
+    started = sampler.start(interval=interval)
+    return jsonify({
+        "success": True,
+        "running": True,
+        "message": "Profiler iniciado" if started else "Profiler já estava em execução",
+        "interval": sampler.interval
+    })
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+def stop_sampling_profiler():
+    """Desliga o profiler e grava o arquivo collapsed para flamegraph."""
+    if not _admin_authorized():
+        return jsonify({"success": False, "error": "Não autorizado"}), 403
+    path, samples = sampler.stop()
+    if path is None:
+        return jsonify({"success": False, "error": "Profiler não está em execução"}), 409
+    return jsonify({
+        "success": True,
+        "file": os.path.basename(path),
+        "samples": samples
+    })
+
+@app.route('/admin/profiles/<filename>', methods=['GET'])
+def download_profile(filename):
+    """Baixa um arquivo de profiling (.prof ou .collapsed)."""
+    if not _admin_authorized():
+        return jsonify({"success": False, "error": "Não autorizado"}), 403
+    return send_from_directory(os.path.abspath(PROFILE_DIR), filename, as_attachment=True)
+
+# Reconhecimento em streaming: quadros binários por sessão e resultado via SSE
+streaming_cfg = cfg.get('streaming', {})
+STREAM_CONFIDENT_DISTANCE = streaming_cfg.get('confident_distance', 0.5)
+STREAM_MIN_CONSECUTIVE = streaming_cfg.get('min_consecutive', 1)
+STREAM_ROI_MARGIN = streaming_cfg.get('roi_margin', 0.5)
+STREAM_MAX_FRAME_BYTES = streaming_cfg.get('max_frame_bytes', 8 * 1024 * 1024)
+
+def _process_stream_frame(session, data):
+    """Processa um quadro da sessão; `confident` indica reconhecimento confiável."""
+    _background.endpoint = 'stream_frame'
+    with timed_stage('decode'):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return {"confident": False, "recognized": False, "message": "Erro ao processar imagem"}
+    # A face tende a estar perto de onde estava no quadro anterior
+    roi = expand_box(session.last_box, STREAM_ROI_MARGIN, image.shape) if session.last_box else None
+    faces, message = recognize_faces(image, max_faces=1, roi=roi)
+    face = faces[0] if faces else None
+    session.last_box = face["box"] if face else None
+    if face is None or not face["name"] or face["distance"] > STREAM_CONFIDENT_DISTANCE:
+        session.streak = 0
+        return {
+            "confident": False,
+            "recognized": bool(face and face["name"]),
+            "distance": face["distance"] if face else None,
+            "message": message
+        }
+    session.streak = session.streak + 1 if session.last_name == face["name"] else 1
+    session.last_name = face["name"]
+    if session.streak < STREAM_MIN_CONSECUTIVE:
+        return {"confident": False, "recognized": True, "distance": face["distance"], "message": message}
+    user = get_user_by_name(face["name"])
+    return {
+        "confident": True,
+        "recognized": True,
+        "distance": face["distance"],
+        "user": {
+            "id": user.get('id'),
+            "nome": user.get('nome'),
+            "email": user.get('email'),
+            "perfil": user.get('perfil')
+        } if user else {"nome": face["name"]},
+        "message": message,
+        "frames": session.stats()
+    }
+
+streams = StreamManager(
+    _process_stream_frame,
+    workers=streaming_cfg.get('workers', 4),
+    max_sessions=streaming_cfg.get('max_sessions', 100),
+    idle_timeout=streaming_cfg.get('idle_timeout', 30.0)
+)
+STREAM_SESSIONS = REGISTRY.gauge('facial_stream_sessions', 'Sessões de streaming ativas.')
+STREAM_SESSIONS.set_function(lambda: len(streams))
+
+def _stream_session(session_id):
+    """Sessão de `session_id` com o token de `X-Stream-Token` (ou `?token=`, para EventSource)."""
+    return streams.get(session_id, request.headers.get('X-Stream-Token') or request.args.get('token'))
+
+@app.route('/stream', methods=['POST'])
+def stream_open():
+    """Abre uma sessão de streaming; o token devolvido é exigido nas demais chamadas."""
+    session = streams.create()
+    if session is None:
+        return jsonify({"success": False, "error": "Limite de sessões de streaming atingido"}), 503
+    return jsonify({"success": True, "session": session.session_id, "token": session.token}), 201
+
+@app.route('/stream/<session_id>/frame', methods=['POST'])
+def stream_frame(session_id):
+    """Recebe um quadro binário (JPEG/PNG no corpo) da sessão de streaming."""
+    session = _stream_session(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Sessão não encontrada"}), 404
+    data = request.get_data()
+    if not data:
+        return jsonify({"success": False, "error": "Quadro não fornecido"}), 400
+    status = streams.submit(session, data)
+    STREAM_FRAMES.inc(status=status)
+    body = {"success": True, "status": status, **session.stats()}
+    if status == 'done':
+        body["result"] = session.result
+        return jsonify(body)
+    return jsonify(body), 202
+
+@app.route('/stream/<session_id>/upload', methods=['POST'])
+def stream_upload(session_id):
+    """Recebe os quadros da sessão numa única requisição (corpo chunked, ver `read_frames`).
+
+    Cada quadro é entregue à sessão assim que chega; a resposta sai quando o
+    cliente encerra o corpo ou quando a sessão termina (resultado ou DELETE).
+    """
+    session = _stream_session(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Sessão não encontrada"}), 404
+    try:
+        for data in read_frames(request.stream, STREAM_MAX_FRAME_BYTES):
+            status = streams.submit(session, data)
+            STREAM_FRAMES.inc(status=status)
+            if status == 'done' or session.closed:
+                break
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e), **session.stats()}), 400
+    body = {"success": True, **session.stats()}
+    if session.result is not None:
+        body["result"] = session.result
+    return jsonify(body)
+
+@app.route('/stream/<session_id>/events', methods=['GET'])
+def stream_events(session_id):
+    """Eventos da sessão (SSE): `progress` a cada quadro processado e `result` no reconhecimento."""
+    session = _stream_session(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Sessão não encontrada"}), 404
+    return Response(
+        stream_with_context(streams.events(session, heartbeat=streaming_cfg.get('heartbeat', 15.0))),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/stream/<session_id>', methods=['DELETE'])
+def stream_close(session_id):
+    """Encerra a sessão de streaming."""
+    if _stream_session(session_id) is None:
+        return jsonify({"success": False, "error": "Sessão não encontrada"}), 404
+    session = streams.close(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "Sessão não encontrada"}), 404
+    return jsonify({"success": True, **session.stats()})
+
 if __name__ == '__main__':
     logger.info("Iniciando servidor de reconhecimento facial...")
     logger.info(f"API de autenticação: {AUTH_API_URL}")
-    logger.info(f"Usuários cadastrados: {len(known_names)}")
+    logger.info(f"Usuários cadastrados: {len(gallery)}")
+    logger.info(f"Pool de detectores: {detector.size} instâncias, {detector.opencv_threads} threads OpenCV cada")
     app.run(host='0.0.0.0', port=5000, debug=True)
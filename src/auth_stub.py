@@ -0,0 +1,104 @@
+"""
+Substituto leve do serviço de autenticação Java para testes de carga.
+
+Implementa apenas `GET /auth` e `GET /auth/<id>`, com latência configurável,
+para que o servidor de reconhecimento facial possa ser exercitado sem a stack
+Spring. Pode rodar em thread dentro do mesmo processo (`start_auth_stub`) ou
+isolado via linha de comando:
+
+    python -m src.auth_stub --port 8082 --users 100 --latency 0.02
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from flask import Flask, jsonify
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+def make_users(count):
+    """Gera usuários sintéticos no formato retornado pelo serviço Java."""
+    return [
+        {
+            "id": i,
+            "nome": f"usuario{i}",
+            "email": f"usuario{i}@dwe.local",
+            "perfil": "USER"
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def create_auth_stub(users=None, latency=0.0, jitter=0.0):
+    """Cria o app Flask que imita os endpoints de usuários do serviço de auth.
+
+    `latency` é o atraso base (segundos) de cada resposta e `jitter` um
+    acréscimo aleatório uniforme em [0, jitter].
+    """
+    app = Flask('auth_stub')
+    users = list(users if users is not None else make_users(10))
+    by_id = {str(u['id']): u for u in users}
+
+    def _delay():
+        wait = latency + (random.uniform(0, jitter) if jitter > 0 else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    @app.route('/auth', methods=['GET'])
+    def list_users():
+        _delay()
+        return jsonify(users)
+
+    @app.route('/auth/<user_id>', methods=['GET'])
+    def get_user(user_id):
+        _delay()
+        user = by_id.get(user_id)
+        if user is None:
+            return jsonify({"error": "Usuário não encontrado"}), 404
+        return jsonify(user)
+
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    """Não loga cada requisição (o log por linha distorce a medição de carga)."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class AuthStubServer:
+    """Servidor do stub rodando em thread daemon dentro do processo atual."""
+
+    def __init__(self, app, host='127.0.0.1', port=8082):
+        self.server = make_server(host, port, app, threaded=True, request_handler=_QuietHandler)
+        self.url = f"http://{host}:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self._thread.join(timeout=5)
+
+
+def start_auth_stub(host='127.0.0.1', port=8082, users=None, latency=0.0, jitter=0.0):
+    """Inicia o stub em background e retorna o `AuthStubServer` em execução."""
+    app = create_auth_stub(users=users, latency=latency, jitter=jitter)
+    return AuthStubServer(app, host=host, port=port).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stub do serviço de autenticação")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--users', type=int, default=10, help="Quantidade de usuários sintéticos")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latência base por resposta (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Latência aleatória adicional máxima (s)")
+    args = parser.parse_args()
+    app = create_auth_stub(make_users(args.users), latency=args.latency, jitter=args.jitter)
+    app.run(host=args.host, port=args.port, threaded=True)
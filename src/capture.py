@@ -0,0 +1,229 @@
+"""
+Fontes de quadros para o laço da câmera, configuradas pela seção `capture`.
+
+- `DeviceSource`: câmera (índice ou URL) com resolução, FPS, fourcc (MJPG
+  evita a decodificação YUYV lenta via USB) e buffer mínimo do driver, para
+  não entregar quadros velhos.
+- `FileSource` / `ImageDirectorySource`: reprodução de um vídeo gravado ou de
+  um diretório de imagens, no ritmo original (`pacing: realtime`) ou o mais
+  rápido possível (`fast`), para medir otimizações do laço de forma
+  reprodutível.
+- `LatestFrameGrabber`: thread que lê continuamente e entrega só o quadro
+  mais recente; quadros que chegam enquanto o laço processa são descartados
+  (câmeras; reprodução só com `replay_latest_only`).
+
+Todas expõem `read() -> (ok, quadro)` como `cv2.VideoCapture`, mais
+`timestamp` (tempo do quadro em segundos: relógio para câmeras, posição no
+vídeo para reprodução), usado pelo portão de movimento.
+"""
+
+import abc
+import glob
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+from src.image_store import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+PACINGS = ('realtime', 'fast')
+
+
+class DeviceSource:
+    """Câmera com configurações de baixa latência."""
+
+    def __init__(self, device=0, width=None, height=None, fps=None, fourcc='MJPG', buffer_size=1):
+        self.device = device
+        self.timestamp = None
+        self._cap = cv2.VideoCapture(device)
+        if not self._cap.isOpened():
+            raise ValueError(f"Não foi possível abrir a câmera {device}")
+        # O fourcc precisa vir antes da resolução em vários drivers (V4L2)
+        if fourcc:
+            self._cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if width:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self._cap.set(cv2.CAP_PROP_FPS, fps)
+        if buffer_size:
+            self._cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        logger.info(f"Câmera {device}: {self._cap.get(cv2.CAP_PROP_FRAME_WIDTH):.0f}x"
+                    f"{self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT):.0f} @ {self._cap.get(cv2.CAP_PROP_FPS):.0f} FPS")
+
+    def read(self):
+        ok, frame = self._cap.read()
+        self.timestamp = time.monotonic()
+        return ok, frame
+
+    def release(self):
+        self._cap.release()
+
+
+class _Replay(abc.ABC):
+    """Ritmo da reprodução: espera até o tempo do quadro (`realtime`) ou não espera (`fast`)."""
+
+    def __init__(self, fps, pacing, loop):
+        if pacing not in PACINGS:
+            raise ValueError(f"Ritmo de reprodução inválido: {pacing}")
+        self.fps = fps
+        self.pacing = pacing
+        self.loop = loop
+        self.timestamp = None
+        self._index = 0
+        self._start = None
+
+    @abc.abstractmethod
+    def _next_frame(self):
+        """Próximo quadro gravado: `(ok, quadro)`."""
+
+    @abc.abstractmethod
+    def _rewind(self):
+        """Volta ao primeiro quadro (`loop`)."""
+
+    def read(self):
+        ok, frame = self._next_frame()
+        if not ok and self.loop and self._index > 0:
+            self._rewind()
+            ok, frame = self._next_frame()
+        if not ok:
+            return False, None
+        self.timestamp = self._index / self.fps
+        self._index += 1
+        if self.pacing == 'realtime':
+            if self._start is None:
+                self._start = time.monotonic() - self.timestamp
+            delay = self._start + self.timestamp - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class FileSource(_Replay):
+    """Reprodução de um arquivo de vídeo."""
+
+    def __init__(self, path, pacing='realtime', loop=False, fps=None):
+        self.path = path
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise ValueError(f"Não foi possível abrir o vídeo {path}")
+        super().__init__(fps or self._cap.get(cv2.CAP_PROP_FPS) or 30.0, pacing, loop)
+
+    def _next_frame(self):
+        return self._cap.read()
+
+    def _rewind(self):
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self._cap.release()
+
+
+class ImageDirectorySource(_Replay):
+    """Reprodução das imagens de um diretório, em ordem de nome, a `fps` quadros por segundo."""
+
+    def __init__(self, path, pacing='realtime', loop=False, fps=None):
+        self.path = path
+        self.files = sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise ValueError(f"Nenhuma imagem em {path}")
+        super().__init__(fps or 30.0, pacing, loop)
+        self._position = 0
+
+    def _next_frame(self):
+        while self._position < len(self.files):
+            frame = cv2.imread(self.files[self._position])
+            self._position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def _rewind(self):
+        self._position = 0
+
+
+class LatestFrameGrabber:
+    """Lê a fonte numa thread e entrega só o quadro mais recente ainda não entregue."""
+
+    def __init__(self, source):
+        self.source = source
+        self.timestamp = None
+        self.dropped = 0
+        self._frame = None
+        self._frame_timestamp = None
+        self._sequence = 0
+        self._delivered = 0
+        self._done = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._reader, name='capture-grabber', daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        while not self._stopping:
+            ok, frame = self.source.read()
+            with self._cond:
+                if not ok:
+                    self._done = True
+                    self._cond.notify_all()
+                    return
+                if self._sequence != self._delivered:
+                    self.dropped += 1
+                self._frame, self._frame_timestamp = frame, self.source.timestamp
+                self._sequence += 1
+                self._cond.notify_all()
+
+    def read(self):
+        """Espera um quadro novo; `(False, None)` quando a fonte termina."""
+        with self._cond:
+            while self._sequence == self._delivered:
+                if self._done:
+                    return False, None
+                self._cond.wait()
+            self._delivered = self._sequence
+            self.timestamp = self._frame_timestamp
+            return True, self._frame
+
+    def release(self):
+        self._stopping = True
+        self._thread.join(timeout=2)
+        self.source.release()
+
+
+def open_capture(cfg, source=None, pacing=None):
+    """Abre a fonte descrita na seção `capture` do config.yaml.
+
+    `source` e `pacing` substituem os valores do config (ex.: linha de
+    comando). Uma fonte numérica é um índice de câmera; um diretório é lido
+    como sequência de imagens; qualquer outro caminho é aberto como vídeo.
+    O grabber do quadro mais recente (`latest_only`) vale para câmeras; a
+    reprodução entrega todos os quadros, a menos que `replay_latest_only`
+    peça o mesmo descarte de uma câmera ao vivo.
+    """
+    c = cfg.get('capture', {})
+    source = c.get('source', 0) if source is None else source
+    pacing = pacing or c.get('pacing', 'realtime')
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int) or (isinstance(source, str) and '://' in source):
+        capture = DeviceSource(source, width=c.get('width'), height=c.get('height'), fps=c.get('fps'),
+                               fourcc=c.get('fourcc', 'MJPG'), buffer_size=c.get('buffer_size', 1))
+    elif os.path.isdir(source):
+        capture = ImageDirectorySource(source, pacing=pacing, loop=c.get('loop', False), fps=c.get('replay_fps'))
+    else:
+        capture = FileSource(source, pacing=pacing, loop=c.get('loop', False), fps=c.get('replay_fps'))
+    if isinstance(capture, _Replay):
+        latest_only = c.get('replay_latest_only', False)
+    else:
+        latest_only = c.get('latest_only', True)
+    if latest_only:
+        capture = LatestFrameGrabber(capture)
+    return capture
@@ -0,0 +1,161 @@
+"""
+Política de cadastro que mantém um conjunto compacto de embeddings por pessoa.
+
+Quadros consecutivos da webcam geram embeddings quase idênticos; guardá-los
+todos só aumenta o custo de cada busca. A política descarta amostras muito
+próximas das já cadastradas para a mesma identidade e, ao passar do limite
+por identidade, agrupa as amostras (k-means) e mantém um representante real
+(medoide) por grupo. O comando de manutenção aplica o mesmo à galeria salva:
+
+    python -m src.compaction --encodings encodings/encodings.pkl
+"""
+
+import argparse
+import threading
+
+import numpy as np
+
+from src.gallery import EMBEDDING_DIM, Gallery
+from src.matching import distance_matrix
+
+
+def kmeans_medoids(vectors, k, iterations=20, seed=0):
+    """Agrupa `vectors` em `k` grupos e retorna a amostra mais central de cada um."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    return vectors[medoid_indices(vectors, k, iterations, seed)]
+
+
+def medoid_indices(vectors, k, iterations=20, seed=0):
+    """Como `kmeans_medoids`, mas retorna os índices (ordenados) das amostras mantidas."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if len(vectors) <= k:
+        return np.arange(len(vectors))
+    rng = np.random.default_rng(seed)
+    # Inicialização k-means++
+    centers = [vectors[rng.integers(len(vectors))]]
+    for _ in range(1, k):
+        d2 = np.min(distance_matrix(vectors, np.array(centers)), axis=1) ** 2
+        idx = rng.choice(len(vectors), p=d2 / d2.sum()) if d2.sum() > 0 else rng.integers(len(vectors))
+        centers.append(vectors[idx])
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels = np.argmin(distance_matrix(vectors, centers), axis=1)
+        updated = np.array([vectors[labels == j].mean(axis=0) if np.any(labels == j) else centers[j] for j in range(k)])
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    # Medoides: mantém embeddings reais em vez de médias sintéticas
+    return np.unique(np.argmin(distance_matrix(centers, vectors), axis=1))
+
+
+def deduplicate(vectors, min_distance):
+    """Mantém, na ordem, só as amostras a mais de `min_distance` das já mantidas."""
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, EMBEDDING_DIM)
+    kept = []
+    for i, v in enumerate(vectors):
+        if not kept or np.min(distance_matrix(v, vectors[kept])) >= min_distance:
+            kept.append(i)
+    return vectors[kept]
+
+
+class EnrollmentPolicy:
+    """Decide se um novo embedding entra na galeria e compacta a identidade."""
+
+    def __init__(self, dedup_distance=0.15, max_samples=10):
+        self.dedup_distance = dedup_distance
+        self.max_samples = max_samples
+        # Para galerias sem `lock` próprio (ex.: particionada)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Cria a política a partir da seção `enrollment` do config.yaml."""
+        e = cfg.get('enrollment', {})
+        return cls(
+            dedup_distance=e.get('dedup_distance', 0.15),
+            max_samples=e.get('max_samples_per_identity', 10)
+        )
+
+    def enroll(self, gallery, encoding, name):
+        """Adiciona `encoding` a `name` se não for redundante; retorna True se adicionou.
+
+        No limite de amostras os medoides são escolhidos antes de escrever:
+        se a amostra nova não estiver entre eles nada muda; se estiver, ela
+        ocupa a linha da descartada mais próxima dela, sem refazer a galeria
+        (a identidade continua no limite). Tudo sob o lock da galeria, para
+        cadastros simultâneos do mesmo nome não se perderem.
+        """
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(EMBEDDING_DIM)
+        with getattr(gallery, 'lock', self._lock):
+            existing = gallery.identity_matrix(name)
+            if self.dedup_distance > 0 and len(existing):
+                if np.min(distance_matrix(encoding, existing)) < self.dedup_distance:
+                    return False
+            if not self.max_samples or len(existing) < self.max_samples:
+                gallery.add(encoding, name)
+                return True
+            samples = np.vstack([existing, encoding])
+            kept = medoid_indices(samples, self.max_samples)
+            if len(existing) not in kept:
+                return False
+            dropped = np.setdiff1d(np.arange(len(existing)), kept)
+            if len(existing) <= self.max_samples and hasattr(gallery, 'swap'):
+                # Com mais de um descarte, só a mais redundante sai: trocar uma linha não refaz a matriz
+                closest = dropped[np.argmin(distance_matrix(encoding, existing[dropped]))]
+                gallery.swap(name, int(closest), encoding)
+            else:
+                gallery.replace(name, samples[kept])
+            return True
+
+    def compact(self, vectors):
+        """Aplica deduplicação e limite a um conjunto de amostras de uma identidade."""
+        vectors = np.asarray(vectors, dtype=np.float64)
+        if self.dedup_distance > 0:
+            vectors = deduplicate(vectors, self.dedup_distance)
+        if self.max_samples and len(vectors) > self.max_samples:
+            vectors = kmeans_medoids(vectors, self.max_samples)
+        return vectors
+
+
+def compact_gallery(gallery, policy):
+    """Compacta todas as identidades da galeria; retorna (linhas_antes, linhas_depois)."""
+    before = len(gallery)
+    changes = {}
+    for name in gallery.identities():
+        samples = gallery.identity_matrix(name)
+        compacted = policy.compact(samples)
+        # Deduplicação e medoides só descartam: mesmo tamanho = identidade inalterada
+        if len(compacted) < len(samples):
+            changes[name] = compacted
+    if hasattr(gallery, 'replace_many'):
+        gallery.replace_many(changes)
+    else:
+        for name, compacted in changes.items():
+            gallery.replace(name, compacted)
+    return before, len(gallery)
+
+
+if __name__ == '__main__':
+    import yaml
+    parser = argparse.ArgumentParser(description="Compacta a galeria de embeddings")
+    parser.add_argument('--encodings', default='encodings/encodings.pkl')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--dedup-distance', type=float, default=None)
+    parser.add_argument('--max-samples', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help="Só mostra o resultado, sem salvar")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        policy = EnrollmentPolicy.from_config(yaml.safe_load(f))
+    if args.dedup_distance is not None:
+        policy.dedup_distance = args.dedup_distance
+    if args.max_samples is not None:
+        policy.max_samples = args.max_samples
+
+    gallery = Gallery.load(args.encodings)
+    identities = len(gallery.identities())
+    before, after = compact_gallery(gallery, policy)
+    print(f"[INFO] {identities} identidades: {before} -> {after} embeddings")
+    if not args.dry_run:
+        gallery.save(args.encodings)
+        print(f"[INFO] Galeria salva em {args.encodings}")
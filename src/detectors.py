@@ -1,22 +1,278 @@
+import abc
+import argparse
+import copy
+import glob
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
 import cv2
+import yaml
 
-class HaarDetector:
-    """Detector de faces usando Haar Cascade do OpenCV."""
+# Registro de detectores disponíveis, selecionados pela chave `method` do config.yaml
+DETECTORS = {}
+
+# Cascades LBP não acompanham as wheels do opencv-python. Preferimos o "improved"
+# (opencv/data/lbpcascades) se estiver instalado; senão, o lbpcascade_frontalface.xml
+# original, que acompanha o repositório em src/models
+LBP_CASCADE_FILE = 'lbpcascade_frontalface_improved.xml'
+LBP_BUNDLED_FILE = 'lbpcascade_frontalface.xml'
+LBP_CASCADE_URL = f"https://github.com/opencv/opencv/raw/4.x/data/lbpcascades/{LBP_CASCADE_FILE}"
+LBP_SEARCH_PATHS = [
+    os.path.join('src', 'models', LBP_CASCADE_FILE),
+    os.path.join(cv2.data.haarcascades, LBP_CASCADE_FILE),
+    os.path.join(os.path.dirname(os.path.dirname(cv2.data.haarcascades.rstrip(os.sep))), 'lbpcascades', LBP_CASCADE_FILE),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', LBP_BUNDLED_FILE),
+]
+
+
+def load_haar_profile(path, name):
+    """Lê um perfil de parâmetros Haar gerado por `src.tune_haar`."""
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = yaml.safe_load(f) or {}
+    if name not in profiles:
+        raise ValueError(f"Perfil Haar '{name}' não encontrado em {path}")
+    return profiles[name]
+
+
+def register_detector(*names):
+    """Registra a classe de detector sob um ou mais nomes."""
+    def decorator(cls):
+        for name in names:
+            DETECTORS[name] = cls
+        return cls
+    return decorator
+
+
+def create_detector(cfg, method=None):
+    """Instancia o detector configurado em `method` (padrão: 'haar')."""
+    method = method or cfg.get('method', 'haar')
+    if method not in DETECTORS:
+        raise ValueError(f"Método de detecção desconhecido: {method} (disponíveis: {', '.join(sorted(DETECTORS))})")
+    return DETECTORS[method].from_config(cfg)
+
+
+class BaseDetector(abc.ABC):
+    """Interface comum: `detect(gray, roi=None)` retorna caixas (x, y, w, h)."""
+
+    @classmethod
+    @abc.abstractmethod
+    def from_config(cls, cfg):
+        """Cria o detector a partir do config.yaml."""
+
+    @abc.abstractmethod
+    def _detect(self, gray_frame):
+        """Caixas (x, y, w, h) das faces na imagem inteira."""
+
+    def detect(self, gray_frame, roi=None):
+        """Detecta faces na imagem em tons de cinza, opcionalmente só dentro de `roi`."""
+        if roi is None:
+            return self._detect(gray_frame)
+        rx, ry, rw, rh = roi
+        return [(x + rx, y + ry, w, h) for (x, y, w, h) in self._detect(gray_frame[ry:ry+rh, rx:rx+rw])]
+
+    def detect_rois(self, gray_frame, rois):
+        """Detecta faces em várias regiões e devolve as caixas no quadro inteiro."""
+        boxes = []
+        for roi in rois:
+            boxes.extend(self.detect(gray_frame, roi=roi))
+        return boxes
+
+    def clone(self):
+        """Cria uma instância independente com os mesmos parâmetros (uma por thread)."""
+        return copy.copy(self)
+
+
+def _cascade_from_xml(xml_text):
+    """Constrói um CascadeClassifier a partir do XML já lido em memória."""
+    storage = cv2.FileStorage(xml_text, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+    cascade = cv2.CascadeClassifier()
+    if not cascade.read(storage.getFirstTopLevelNode()):
+        return None
+    return cascade
+
+
+class CascadeDetector(BaseDetector):
+    """Detector baseado em `cv2.CascadeClassifier` (Haar ou LBP)."""
 
     def __init__(self, cascade_path, scaleFactor=1.1, minNeighbors=5, minSize=(30,30)):
+        self.cascade_path = cascade_path
         self.face_cascade = cv2.CascadeClassifier(cascade_path)
         if self.face_cascade.empty():
-            raise ValueError(f"Não foi possível carregar o arquivo Haar Cascade: {cascade_path}")
+            raise ValueError(f"Não foi possível carregar o arquivo cascade: {cascade_path}")
+        self._cascade_xml = None
         self.scaleFactor = scaleFactor
         self.minNeighbors = minNeighbors
         self.minSize = tuple(minSize)
 
-    def detect(self, gray_frame):
-        """Detecta faces na imagem em tons de cinza."""
-        faces = self.face_cascade.detectMultiScale(
+    def clone(self):
+        """Novo classificador a partir do XML lido uma única vez (sem reabrir o arquivo)."""
+        if self._cascade_xml is None:
+            with open(self.cascade_path) as f:
+                self._cascade_xml = f.read()
+        other = copy.copy(self)
+        cascade = _cascade_from_xml(self._cascade_xml)
+        # Cascades no formato antigo não são lidos via FileStorage; recorre ao arquivo
+        other.face_cascade = cascade if cascade is not None else cv2.CascadeClassifier(self.cascade_path)
+        return other
+
+    def _detect(self, gray_frame):
+        return self.face_cascade.detectMultiScale(
             gray_frame,
             scaleFactor=self.scaleFactor,
             minNeighbors=self.minNeighbors,
             minSize=self.minSize
         )
-        return faces
+
+
+@register_detector('haar')
+class HaarDetector(CascadeDetector):
+    """Detector de faces usando Haar Cascade do OpenCV."""
+
+    @classmethod
+    def from_config(cls, cfg):
+        haar_cfg = dict(cfg.get('haar', {}))
+        if haar_cfg.get('profile'):
+            # Perfil ajustado por câmera sobrepõe os valores manuais
+            haar_cfg.update(load_haar_profile(haar_cfg.get('profiles_file', 'haar_profiles.yaml'), haar_cfg['profile']))
+        return cls(
+            cascade_path=haar_cfg.get('cascade_path', 'src/models/haarcascade_frontalface_default.xml'),
+            scaleFactor=haar_cfg.get('scaleFactor', 1.1),
+            minNeighbors=haar_cfg.get('minNeighbors', 5),
+            minSize=tuple(haar_cfg.get('minSize', (30, 30)))
+        )
+
+
+@register_detector('lbp')
+class LBPDetector(CascadeDetector):
+    """Detector LBP do OpenCV: menos recall que o Haar, mas várias vezes mais rápido."""
+
+    @classmethod
+    def from_config(cls, cfg):
+        lbp_cfg = cfg.get('lbp', {})
+        path = lbp_cfg.get('cascade_path') or next((p for p in LBP_SEARCH_PATHS if os.path.exists(p)), None)
+        if path is None:
+            raise ValueError(f"Cascade LBP não encontrado; baixe {LBP_CASCADE_URL} para src/models/ "
+                             "ou defina lbp.cascade_path no config.yaml")
+        return cls(
+            cascade_path=path,
+            scaleFactor=lbp_cfg.get('scaleFactor', 1.1),
+            minNeighbors=lbp_cfg.get('minNeighbors', 4),
+            minSize=tuple(lbp_cfg.get('minSize', (30, 30)))
+        )
+
+
+@register_detector('hog', 'face_recog')
+class HOGDetector(BaseDetector):
+    """Detector HOG do dlib (via face_recognition); `model='cnn'` exige GPU para ser viável."""
+
+    def __init__(self, model='hog', upsample=1):
+        self.model = model
+        self.upsample = upsample
+
+    @classmethod
+    def from_config(cls, cfg):
+        fr_cfg = cfg.get('face_recog', {})
+        return cls(model=fr_cfg.get('model', 'hog'), upsample=fr_cfg.get('upsample', 1))
+
+    def _detect(self, gray_frame):
+        import face_recognition
+        image = gray_frame if self.model == 'hog' else cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2RGB)
+        locations = face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model=self.model)
+        return [(left, top, right - left, bottom - top) for (top, right, bottom, left) in locations]
+
+
+class DetectorPool:
+    """Pool de detectores independentes para requisições concorrentes.
+
+    `cv2.CascadeClassifier` não é garantidamente thread-safe, então cada
+    requisição pega uma instância exclusiva do pool. O número de threads
+    internas do OpenCV é dividido entre as instâncias para não haver
+    sobre-subscrição de núcleos (instâncias x threads <= núcleos).
+    """
+
+    def __init__(self, prototype, size, opencv_threads=None):
+        self.size = size
+        self._pool = queue.LifoQueue()
+        self._pool.put(prototype)
+        for _ in range(size - 1):
+            self._pool.put(prototype.clone())
+        self._waiting = 0
+        self._lock = threading.Lock()
+        if opencv_threads is not None:
+            cv2.setNumThreads(opencv_threads)
+        self.opencv_threads = cv2.getNumThreads()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Cria o pool para o detector de `method` conforme a seção `detector_pool`."""
+        pool_cfg = cfg.get('detector_pool', {})
+        cpus = os.cpu_count() or 1
+        size = pool_cfg.get('size', 'auto')
+        size = cpus if size == 'auto' else int(size)
+        threads = pool_cfg.get('opencv_threads', 'auto')
+        threads = max(1, cpus // size) if threads == 'auto' else int(threads)
+        return cls(create_detector(cfg), size, opencv_threads=threads)
+
+    @property
+    def waiting(self):
+        """Requisições aguardando um detector livre."""
+        return self._waiting
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            self._waiting += 1
+        try:
+            detector = self._pool.get()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            yield detector
+        finally:
+            self._pool.put(detector)
+
+    def detect(self, gray_frame, roi=None):
+        with self.acquire() as detector:
+            return detector.detect(gray_frame, roi=roi)
+
+    def detect_rois(self, gray_frame, rois):
+        with self.acquire() as detector:
+            return detector.detect_rois(gray_frame, rois)
+
+
+def benchmark_detectors(cfg, image_paths, methods):
+    """Mede tempo médio e faces encontradas por imagem para cada detector."""
+    grays = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2GRAY) for p in image_paths]
+    results = {}
+    for method in methods:
+        try:
+            detector = create_detector(cfg, method)
+        except ValueError as e:
+            print(f"[AVISO] {method}: {e}")
+            continue
+        found = 0
+        start = time.perf_counter()
+        for gray in grays:
+            found += len(detector.detect(gray))
+        elapsed = time.perf_counter() - start
+        results[method] = {"ms_per_image": elapsed / len(grays) * 1000, "faces": found}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara os detectores registrados")
+    parser.add_argument('--images', required=True, help="Diretório com imagens .jpg/.png")
+    parser.add_argument('--methods', default='haar,lbp,hog')
+    parser.add_argument('--config', default='config.yaml')
+    args = parser.parse_args()
+    with open(args.config) as f:
+        cfg = yaml.safe_load(f)
+    paths = sorted(glob.glob(os.path.join(args.images, '*.jpg')) + glob.glob(os.path.join(args.images, '*.png')))
+    for method, row in benchmark_detectors(cfg, paths, args.methods.split(',')).items():
+        print(f"{method:<8} {row['ms_per_image']:8.2f} ms/imagem  {row['faces']:5d} faces")
@@ -0,0 +1,193 @@
+"""
+Perfis de encoding: modelo de landmarks, jitter e tamanho do recorte.
+
+Cada perfil define o modelo de landmarks do dlib ('small' = 5 pontos,
+'large' = 68 pontos), `num_jitters` (reamostragens da face; mais lento e
+mais estável) e `crop_size`, o tamanho para o qual a face é redimensionada
+antes do encoder. A seção `encoding` do config.yaml define os perfis e qual
+perfil cada endpoint usa (ex.: cadastro com jitter alto, reconhecimento
+rápido). Os perfis do cadastro e do reconhecimento devem usar o mesmo modelo
+de landmarks: o alinhamento muda o espaço dos embeddings, e a galeria e os
+probes precisam ser comparáveis. O comando abaixo mede, num conjunto
+rotulado (`<dir>/<pessoa>/*.jpg`), a velocidade de cada perfil e a acurácia
+dos seus probes contra a galeria gerada pelo perfil do cadastro:
+
+    python -m src.encoding --dataset dados/rotulado
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from src.utils import encode_face_crops, encode_faces
+
+DEFAULT_PROFILES = {
+    'fast': {'landmark_model': 'small', 'num_jitters': 1, 'crop_size': 150},
+    'quality': {'landmark_model': 'small', 'num_jitters': 10, 'crop_size': None},
+}
+
+
+class EncodingProfile:
+    """Parâmetros do encoder dlib aplicados a um conjunto de caixas."""
+
+    def __init__(self, name, landmark_model='small', num_jitters=1, crop_size=None, padding=0.25):
+        if landmark_model not in ('small', 'large'):
+            raise ValueError(f"Modelo de landmarks inválido: {landmark_model}")
+        self.name = name
+        self.landmark_model = landmark_model
+        self.num_jitters = num_jitters
+        self.crop_size = crop_size
+        self.padding = padding
+
+    def _normalized(self, image, box):
+        """Recorte com margem, redimensionado para a face ter `crop_size` pixels."""
+        x, y, w, h = box
+        pad = int(max(w, h) * self.padding)
+        height, width = image.shape[:2]
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+        scale = self.crop_size / max(w, h)
+        crop = cv2.resize(image[y0:y1, x0:x1], None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        box = (int((x - x0) * scale), int((y - y0) * scale), int(w * scale), int(h * scale))
+        return crop, box
+
+    def encode(self, image, boxes):
+        """Embeddings das faces em `boxes` (x, y, w, h), na mesma ordem."""
+        boxes = [tuple(int(v) for v in b) for b in boxes]
+        if not self.crop_size:
+            return encode_faces(image, boxes, self.num_jitters, self.landmark_model)
+        crops, crop_boxes = zip(*(self._normalized(image, box) for box in boxes)) if boxes else ((), ())
+        return encode_face_crops(crops, crop_boxes, self.num_jitters, self.landmark_model)
+
+
+class EncodingProfiles:
+    """Perfis nomeados e o perfil escolhido por endpoint."""
+
+    def __init__(self, profiles, endpoints=None, default='fast'):
+        self.profiles = profiles
+        self.endpoints = endpoints or {}
+        self.default = default
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Lê a seção `encoding` do config.yaml (perfis `fast` e `quality` por padrão)."""
+        e = cfg.get('encoding', {})
+        definitions = dict(DEFAULT_PROFILES)
+        definitions.update(e.get('profiles', {}))
+        profiles = {name: EncodingProfile(name, **params) for name, params in definitions.items()}
+        endpoints = e.get('endpoints', {})
+        for endpoint, name in endpoints.items():
+            if name not in profiles:
+                raise ValueError(f"Perfil de encoding '{name}' (endpoint {endpoint}) não definido")
+        return cls(profiles, endpoints, default=e.get('default', 'fast'))
+
+    def for_endpoint(self, endpoint):
+        return self.profiles[self.endpoints.get(endpoint, self.default)]
+
+
+def load_labelled_set(dataset_dir):
+    """Imagens de `<dir>/<pessoa>/*` como lista de (pessoa, imagem BGR)."""
+    samples = []
+    for person in sorted(os.listdir(dataset_dir)):
+        for path in sorted(glob.glob(os.path.join(dataset_dir, person, '*'))):
+            image = cv2.imread(path)
+            if image is not None:
+                samples.append((person, image))
+    return samples
+
+
+def _encode_samples(profile, samples, boxes):
+    """Embedding de cada amostra (NaN sem face) e o tempo gasto."""
+    encodings = []
+    start = time.perf_counter()
+    for (_, image), box in zip(samples, boxes):
+        encs = profile.encode(image, [box])
+        encodings.append(encs[0] if encs else np.full(128, np.nan))
+    return np.array(encodings), time.perf_counter() - start
+
+
+def benchmark_profiles(profiles, samples, detector, gallery_profile, tolerance=0.6):
+    """Mede tempo de encoding e acurácia leave-one-out (vizinho mais próximo) por perfil.
+
+    A galeria é codificada com `gallery_profile` (o perfil do cadastro) e os
+    probes com cada perfil de `profiles`, como em produção. `profile_shift` é
+    a distância média entre os embeddings da mesma imagem nos dois perfis.
+    A caixa de cada imagem vem de `detector`; sem detecção, a imagem inteira
+    é tratada como o recorte da face (caso de `faces/<nome>/*.jpg`).
+    """
+    from src.matching import distance_matrix
+    boxes = []
+    for _, image in samples:
+        found = detector.detect(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        if len(found):
+            boxes.append(max((tuple(int(v) for v in b) for b in found), key=lambda b: b[2] * b[3]))
+        else:
+            boxes.append((0, 0, image.shape[1], image.shape[0]))
+    labels = np.array([person for person, _ in samples], dtype=object)
+    gallery, gallery_elapsed = _encode_samples(gallery_profile, samples, boxes)
+    results = {}
+    for profile in profiles:
+        if profile is gallery_profile:
+            probes, elapsed = gallery, gallery_elapsed
+        else:
+            probes, elapsed = _encode_samples(profile, samples, boxes)
+        valid = ~(np.isnan(probes).any(axis=1) | np.isnan(gallery).any(axis=1))
+        distances = distance_matrix(probes[valid], gallery[valid])
+        shift = np.diag(distances).copy()
+        # Leave-one-out: a própria imagem não está na galeria
+        np.fill_diagonal(distances, np.inf)
+        valid_labels = labels[valid]
+        nearest = np.argmin(distances, axis=1)
+        same = valid_labels[:, None] == valid_labels[None, :]
+        np.fill_diagonal(same, False)
+        genuine = distances[same]
+        impostor = distances[~same & np.isfinite(distances)]
+        results[profile.name] = {
+            "ms_per_face": elapsed / len(samples) * 1000,
+            "encoded": int(valid.sum()),
+            "profile_shift": float(shift.mean()) if len(shift) else None,
+            "top1_accuracy": float(np.mean(valid_labels[nearest] == valid_labels)) if valid.sum() > 1 else 0.0,
+            "genuine_mean": float(genuine.mean()) if len(genuine) else None,
+            "impostor_mean": float(impostor.mean()) if len(impostor) else None,
+            "false_accept_rate": float(np.mean(impostor <= tolerance)) if len(impostor) else None,
+            "false_reject_rate": float(np.mean(genuine > tolerance)) if len(genuine) else None,
+        }
+    return results
+
+
+def _format(value):
+    return f"{value:.3f}" if value is not None else "-"
+
+
+if __name__ == '__main__':
+    import yaml
+    from src.detectors import create_detector
+    parser = argparse.ArgumentParser(description="Compara perfis de encoding num conjunto rotulado")
+    parser.add_argument('--dataset', required=True, help="Diretório <pessoa>/<imagem>")
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--profiles', default=None, help="Perfis separados por vírgula (padrão: todos)")
+    parser.add_argument('--gallery-profile', default=None,
+                        help="Perfil que gera a galeria (padrão: o do endpoint enroll)")
+    args = parser.parse_args()
+    with open(args.config) as f:
+        cfg = yaml.safe_load(f)
+    registry = EncodingProfiles.from_config(cfg)
+    names = args.profiles.split(',') if args.profiles else list(registry.profiles)
+    samples = load_labelled_set(args.dataset)
+    print(f"[INFO] {len(samples)} imagens de {len({p for p, _ in samples})} pessoas")
+    gallery_profile = (registry.profiles[args.gallery_profile] if args.gallery_profile
+                       else registry.for_endpoint('enroll'))
+    print(f"[INFO] Galeria gerada com o perfil '{gallery_profile.name}'")
+    results = benchmark_profiles([registry.profiles[n] for n in names], samples, create_detector(cfg),
+                                 gallery_profile, tolerance=cfg.get('face_recog', {}).get('tolerance', 0.6))
+    print(f"{'perfil':<10} {'ms/face':>8} {'desvio':>7} {'top1':>6} {'genuína':>8} {'impostor':>9} "
+          f"{'FAR':>6} {'FRR':>6}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['ms_per_face']:>8.1f} {_format(r['profile_shift']):>7} {r['top1_accuracy']:>6.3f} "
+              f"{_format(r['genuine_mean']):>8} {_format(r['impostor_mean']):>9} "
+              f"{_format(r['false_accept_rate']):>6} {_format(r['false_reject_rate']):>6}")
@@ -2,11 +2,20 @@ import cv2
 import os
 import face_recognition
 import argparse
+import yaml
+from src.capture import open_capture
 from src.utils import save_encodings, load_encodings
 
-def enroll(name, samples_dir='samples', num_samples=5, model='hog'):
+def load_config(path='config.yaml'):
+    """Lê o config.yaml (dicionário vazio se o arquivo não existir)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+def enroll(name, samples_dir='samples', num_samples=5, model='hog', cam=None):
     os.makedirs(samples_dir, exist_ok=True)
-    cam = cv2.VideoCapture(0)
+    cam = cam if cam is not None else open_capture(load_config())
     count = 0
     encs = []
     while count < num_samples:
@@ -31,8 +40,9 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--name', required=True)
     parser.add_argument('--num', type=int, default=5)
+    parser.add_argument('--source', default=None, help="Câmera, vídeo ou diretório de imagens (padrão: capture.source)")
     args = parser.parse_args()
-    encs = enroll(args.name, num_samples=args.num)
+    encs = enroll(args.name, num_samples=args.num, cam=open_capture(load_config(), args.source))
     encs_old, names_old = load_encodings('src/models/encodings.pickle')
     encs_all = encs_old + encs
     names_all = names_old + [args.name]*len(encs)
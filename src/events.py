@@ -0,0 +1,176 @@
+"""
+Eventos do laço da câmera em modo headless.
+
+Sem janela, os reconhecimentos viram eventos JSON: uma linha por evento
+(stdout ou arquivo `.jsonl`) ou um POST para um endpoint local, feito numa
+thread para não atrasar o laço (com a fila cheia, o evento é descartado).
+A mesma identidade (ou o mesmo desconhecido, seguido pela posição da caixa)
+só gera um novo evento depois de `repeat_after` segundos, e um evento `stats`
+com o FPS sustentado sai a cada `report_interval` segundos.
+"""
+
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLinesSink:
+    """Escreve cada evento como uma linha JSON."""
+
+    def __init__(self, stream, close_stream=False):
+        self._stream = stream
+        self._close_stream = close_stream
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, target):
+        """`stdout` ou o caminho de um arquivo (aberto para acrescentar)."""
+        if target in (None, '-', 'stdout'):
+            return cls(sys.stdout)
+        return cls(open(target, 'a', encoding='utf-8'), close_stream=True)
+
+    def emit(self, event):
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + '\n')
+            self._stream.flush()
+
+    def close(self):
+        if self._close_stream:
+            self._stream.close()
+
+
+class HttpSink:
+    """Envia cada evento por POST (JSON) para `url`, em background."""
+
+    def __init__(self, url, timeout=2.0, queue_size=1000):
+        self.url = url
+        self.timeout = timeout
+        self.dropped = 0
+        self._session = requests.Session()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._sender, name='event-sink', daemon=True)
+        self._thread.start()
+
+    def emit(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _sender(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            try:
+                self._session.post(self.url, json=event, timeout=self.timeout).raise_for_status()
+            except Exception as e:
+                logger.error(f"Erro ao enviar evento para {self.url}: {e}")
+
+    def close(self):
+        """Envia o que estiver na fila e encerra a thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=self.timeout * 2 + 1)
+
+
+def create_sink(target, timeout=2.0):
+    """Sink para `target`: URL http(s), caminho de arquivo ou `stdout`."""
+    if target and target.startswith(('http://', 'https://')):
+        return HttpSink(target, timeout=timeout)
+    return JsonLinesSink.open(target)
+
+
+class FpsMeter:
+    """FPS da última janela de `interval` segundos e média desde o início."""
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self.frames = 0
+        self.fps = 0.0
+        self._start = self._window_start = time.perf_counter()
+        self._window_frames = 0
+
+    def tick(self):
+        """Conta um quadro; retorna as estatísticas quando a janela fecha (senão None)."""
+        self.frames += 1
+        self._window_frames += 1
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return None
+        self.fps = self._window_frames / elapsed
+        self._window_start, self._window_frames = now, 0
+        return {"fps": round(self.fps, 2), "average_fps": round(self.frames / (now - self._start), 2),
+                "frames": self.frames}
+
+    def summary(self):
+        """Quadros e FPS médio desde o início (ex.: ao fim da reprodução de uma gravação)."""
+        elapsed = time.perf_counter() - self._start
+        return {"frames": self.frames, "seconds": round(elapsed, 3),
+                "average_fps": round(self.frames / elapsed, 2) if elapsed > 0 else 0.0}
+
+
+class RecognitionEvents:
+    """Converte os resultados de cada quadro em eventos, sem repetir a identidade a cada quadro.
+
+    Rostos reconhecidos são agrupados pelo nome; desconhecidos, pela posição:
+    uma caixa cujo centro está a menos de `track_distance` (fração do lado)
+    de um desconhecido visto nos últimos `repeat_after` segundos é o mesmo
+    visitante, e visitantes diferentes no quadro geram eventos próprios.
+    """
+
+    def __init__(self, repeat_after=5.0, track_distance=0.5):
+        self.repeat_after = repeat_after
+        self.track_distance = track_distance
+        self._last = {}
+        self._unknown = []  # [centro_x, centro_y, lado, último evento, última vez visto]
+
+    def _unknown_track(self, box, now):
+        """Rastro do desconhecido mais próximo de `box` (criado se não houver)."""
+        x, y, w, h = box
+        cx, cy, side = x + w / 2, y + h / 2, max(w, h)
+        self._unknown = [t for t in self._unknown if now - t[4] < self.repeat_after]
+        best, best_distance = None, None
+        for track in self._unknown:
+            distance = ((track[0] - cx) ** 2 + (track[1] - cy) ** 2) ** 0.5
+            if distance <= self.track_distance * max(side, track[2]) and (best is None or distance < best_distance):
+                best, best_distance = track, distance
+        if best is None:
+            best = [cx, cy, side, float('-inf'), now]
+            self._unknown.append(best)
+        best[:3], best[4] = (cx, cy, side), now
+        return best
+
+    def update(self, results, now=None):
+        """`results` são `(caixa, rótulo, cor, status)`; retorna os eventos a emitir.
+
+        `now` é o tempo do quadro usado para as repetições (padrão: relógio);
+        o `timestamp` dos eventos é sempre o relógio.
+        """
+        now = time.time() if now is None else now
+        events = []
+        for box, label, _, status in results:
+            if status not in ('recognized', 'unknown'):
+                continue
+            if status == 'recognized':
+                if now - self._last.get(label, float('-inf')) < self.repeat_after:
+                    continue
+                self._last[label] = now
+            else:
+                track = self._unknown_track(box, now)
+                if now - track[3] < self.repeat_after:
+                    continue
+                track[3] = now
+            event = {"event": status, "box": [int(v) for v in box], "timestamp": time.time()}
+            if status == 'recognized':
+                event["name"] = label
+            events.append(event)
+        return events
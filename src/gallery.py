@@ -0,0 +1,237 @@
+"""
+Galeria de embeddings em memória para busca vetorizada.
+
+Os embeddings ficam numa matriz NumPy contígua (com normas ao quadrado
+pré-calculadas), em vez de uma lista de arrays, para que a comparação com
+várias faces seja uma única operação matricial. A matriz é float32 (a
+precisão do descritor do dlib) e, opcionalmente, uma cópia quantizada
+(int16/int8, ver `src.quantization`) é usada na varredura grossa.
+
+Com `mmap_dir`, a matriz fica num arquivo mapeado em memória em vez de
+memória anônima: o sistema pode descartar as páginas que não estão sendo
+varridas, o que reduz a memória residente quando a maioria das buscas é
+resolvida pela camada quente (`src.tiered`). Com quantização a matriz float32
+fica sempre em arquivo (em `mmap_dir` ou no diretório temporário): só o
+rerank a lê, e as páginas residentes são devolvidas depois de quantizar.
+"""
+
+import itertools
+import mmap
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from src.quantization import MODES, QuantizedMatrix
+from src.utils import load_encoding_matrix, save_encodings
+
+EMBEDDING_DIM = 128
+DTYPE = np.float32
+
+
+def _release_pages(matrix):
+    """Devolve ao sistema as páginas residentes de uma matriz mapeada; os dados continuam no arquivo."""
+    mapping = getattr(matrix, '_mmap', None)
+    if mapping is not None and hasattr(mmap, 'MADV_DONTNEED'):
+        mapping.madvise(mmap.MADV_DONTNEED)
+        # O rerank lê linhas espalhadas: sem leitura antecipada em volta de cada uma
+        mapping.madvise(mmap.MADV_RANDOM)
+
+
+class Gallery:
+    """Embeddings e nomes cadastrados, com crescimento amortizado.
+
+    Leitores usam `snapshot()`, que devolve visões consistentes sem cópia:
+    inserções só escrevem além do tamanho atual e remoções e trocas
+    (`swap`) criam novos buffers, então um snapshot nunca é alterado.
+    """
+
+    def __init__(self, encodings=(), names=(), quantization='none', rerank_candidates=32, mmap_dir=None):
+        if quantization not in MODES:
+            raise ValueError(f"Modo de quantização inválido: {quantization}")
+        self._lock = threading.RLock()
+        self.mmap_dir = mmap_dir
+        self.quantization = quantization
+        self.rerank_candidates = rerank_candidates
+        self._buffer_ids = itertools.count()
+        matrix = np.asarray(encodings if isinstance(encodings, np.ndarray) else list(encodings),
+                            dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+        self._reset(matrix, list(names))
+        self.generation = 0
+        self._quantized = (None, None)
+        self._labels = (None, None)
+
+    def _reset(self, matrix, names):
+        capacity = max(16, len(matrix))
+        self._buffer = self._allocate(capacity)
+        self._buffer[:len(matrix)] = matrix
+        self._sq_norms = np.empty(capacity, dtype=DTYPE)
+        self._sq_norms[:len(matrix)] = np.einsum('ij,ij->i', matrix, matrix)
+        self._names = np.empty(capacity, dtype=object)
+        self._names[:len(names)] = names
+        self._size = len(matrix)
+        # Índice de identidade: nome -> linhas da matriz
+        self._rows = {}
+        for i, name in enumerate(names):
+            self._rows.setdefault(name, []).append(i)
+
+    def _allocate(self, capacity):
+        """Buffer de `capacity` linhas: memória anônima ou um arquivo mapeado (`mmap_dir` ou quantização)."""
+        if self.mmap_dir is None and self.quantization == 'none':
+            return np.empty((capacity, EMBEDDING_DIM), dtype=DTYPE)
+        directory = self.mmap_dir or tempfile.gettempdir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"gallery-{os.getpid()}-{next(self._buffer_ids)}.npy")
+        buffer = np.lib.format.open_memmap(path, mode='w+', dtype=DTYPE, shape=(capacity, EMBEDDING_DIM))
+        # O mapeamento continua válido sem o nome; o espaço é liberado quando o último snapshot sai
+        os.unlink(path)
+        return buffer
+
+    @classmethod
+    def load(cls, path, **options):
+        matrix, names = load_encoding_matrix(path)
+        return cls(matrix, names, **options)
+
+    @classmethod
+    def from_config(cls, cfg, path):
+        """Carrega a galeria de `path` com as opções da seção `gallery` do config.yaml."""
+        g = cfg.get('gallery', {})
+        return cls.load(path, quantization=g.get('quantization', 'none'),
+                        rerank_candidates=g.get('rerank_candidates', 32), mmap_dir=g.get('mmap_dir'))
+
+    def save(self, path):
+        matrix, names, _ = self.snapshot()
+        save_encodings(matrix, names, path)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def lock(self):
+        """Lock das escritas, para sequências ler-decidir-escrever de uma identidade."""
+        return self._lock
+
+    @property
+    def names(self):
+        return list(self._names[:self._size])
+
+    @property
+    def encodings(self):
+        return list(self._buffer[:self._size])
+
+    def identities(self):
+        """Nomes cadastrados (sem repetição)."""
+        with self._lock:
+            return list(self._rows)
+
+    def rows(self, name):
+        """Índices das linhas de `name` na matriz atual."""
+        with self._lock:
+            return list(self._rows.get(name, ()))
+
+    def identity_matrix(self, name):
+        """Embeddings de `name` (cópia), sem varrer a galeria inteira."""
+        with self._lock:
+            return self._buffer[self._rows.get(name, [])]
+
+    def snapshot(self):
+        """Retorna `(matriz, nomes, normas²)` consistentes para leitura (visões, sem cópia)."""
+        with self._lock:
+            size = self._size
+            return self._buffer[:size], self._names[:size], self._sq_norms[:size]
+
+    def quantized_snapshot(self):
+        """Como `snapshot()`, mais a matriz quantizada correspondente (ou None).
+
+        A cópia quantizada é reconstruída sob demanda quando a geração muda.
+        """
+        if self.quantization == 'none':
+            return (None,) + self.snapshot()
+        with self._lock:
+            generation = self.generation
+            snapshot = self.snapshot()
+        cached_generation, quantized = self._quantized
+        if cached_generation != generation:
+            # Construída fora do lock; corridas só refazem o mesmo trabalho
+            quantized = QuantizedMatrix(snapshot[0], self.quantization)
+            self._quantized = (generation, quantized)
+            _release_pages(snapshot[0])
+        return (quantized,) + snapshot
+
+    def labeled_snapshot(self):
+        """Retorna `(matriz, normas², rótulos, identidades)` consistentes para leitura.
+
+        `rótulos[i]` é o índice em `identidades` do dono da linha `i`; o mapa é
+        refeito só quando a geração muda.
+        """
+        with self._lock:
+            matrix, _, sq_norms = self.snapshot()
+            cached_generation, cached = self._labels
+            if cached_generation != self.generation:
+                labels = np.empty(self._size, dtype=np.int64)
+                identities = list(self._rows)
+                for label, name in enumerate(identities):
+                    labels[self._rows[name]] = label
+                cached = (labels, identities)
+                self._labels = (self.generation, cached)
+            return (matrix, sq_norms) + cached
+
+    def add(self, encoding, name):
+        """Adiciona um embedding à galeria."""
+        encoding = np.asarray(encoding, dtype=DTYPE).reshape(EMBEDDING_DIM)
+        with self._lock:
+            if self._size == len(self._buffer):
+                matrix = self._buffer[:self._size]
+                buffer = self._allocate(len(self._buffer) * 2)
+                buffer[:self._size] = matrix
+                sq_norms = np.empty(len(buffer), dtype=DTYPE)
+                sq_norms[:self._size] = self._sq_norms[:self._size]
+                names = np.empty(len(buffer), dtype=object)
+                names[:self._size] = self._names[:self._size]
+                self._buffer, self._sq_norms, self._names = buffer, sq_norms, names
+            self._buffer[self._size] = encoding
+            self._sq_norms[self._size] = encoding @ encoding
+            self._names[self._size] = name
+            self._rows.setdefault(name, []).append(self._size)
+            self._size += 1
+            self.generation += 1
+
+    def swap(self, name, index, encoding):
+        """Troca a `index`-ésima linha de `name` (ordem de `identity_matrix`) sem refazer o índice."""
+        encoding = np.asarray(encoding, dtype=DTYPE).reshape(EMBEDDING_DIM)
+        with self._lock:
+            row = self._rows[name][index]
+            # Cópia na escrita: snapshots em uso (matchers sem lock) mantêm linha e norma antigas juntas
+            buffer = self._allocate(len(self._buffer))
+            buffer[:self._size] = self._buffer[:self._size]
+            buffer[row] = encoding
+            sq_norms = self._sq_norms.copy()
+            sq_norms[row] = encoding @ encoding
+            self._buffer, self._sq_norms = buffer, sq_norms
+            self.generation += 1
+
+    def remove(self, name):
+        """Remove todos os embeddings de `name`; retorna quantos foram removidos."""
+        return self.replace(name, [])
+
+    def replace(self, name, encodings):
+        """Substitui todos os embeddings de `name` por `encodings`; retorna quantos saíram."""
+        return self.replace_many({name: encodings})
+
+    def replace_many(self, changes):
+        """Como `replace` para várias identidades (`{nome: embeddings}`), refazendo a matriz uma vez."""
+        changes = {name: np.asarray(list(encodings), dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+                   for name, encodings in changes.items()}
+        with self._lock:
+            removed = sum(len(self._rows.get(name, ())) for name in changes)
+            if not removed and not any(len(encodings) for encodings in changes.values()):
+                return 0
+            keep = np.flatnonzero([name not in changes for name in self._names[:self._size]])
+            matrix = np.vstack([self._buffer[keep]] + list(changes.values()))
+            names = list(self._names[keep])
+            for name, encodings in changes.items():
+                names.extend([name] * len(encodings))
+            self._reset(matrix, names)
+            self.generation += 1
+            return removed
@@ -0,0 +1,231 @@
+"""
+Armazenamento das imagens de face cadastradas, endereçado por conteúdo.
+
+Cada recorte é identificado pelo hash dos seus pixels e gravado como
+`faces/<nome>/<hash>.<formato>`; recortes idênticos não são gravados duas
+vezes e cadastros no mesmo segundo não se sobrescrevem. A codificação
+(JPEG/PNG/WebP) e a escrita em disco rodam numa thread em background, fora
+da latência do cadastro. Cada usuário tem um `manifest.json` com suas
+imagens, mantido também em memória, então listar não exige varrer diretórios;
+uma imagem só entra no manifesto depois de gravada com sucesso.
+"""
+
+import atexit
+import bisect
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def content_hash(image):
+    """Hash (hex) dos pixels e do formato do recorte."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(image.shape).encode('ascii'))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class ImageStore:
+    """Imagens por usuário com deduplicação por hash e escrita assíncrona."""
+
+    def __init__(self, root='faces', fmt='jpg', quality=90, queue_size=256):
+        if fmt not in ('jpg', 'png', 'webp'):
+            raise ValueError(f"Formato de imagem inválido: {fmt}")
+        self.root = root
+        self.fmt = fmt
+        self.quality = quality
+        self._manifests = {}
+        self._pending = {}  # nome -> hashes agendados e ainda não gravados
+        self._sorted = (None, [])
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._load()
+        self._thread = threading.Thread(target=self._writer, name='image-store', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    @classmethod
+    def from_config(cls, cfg, root):
+        """Cria o store em `root` conforme a seção `image_store` do config.yaml."""
+        s = cfg.get('image_store', {})
+        return cls(root, fmt=s.get('format', 'jpg'), quality=s.get('quality', 90),
+                   queue_size=s.get('queue_size', 256))
+
+    def _load(self):
+        """Lê os manifestos (uma vez, na inicialização); cria os que faltarem."""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            user_dir = os.path.join(self.root, name)
+            if not os.path.isdir(user_dir):
+                continue
+            path = os.path.join(user_dir, MANIFEST_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._manifests[name] = json.load(f)
+                continue
+            # Diretório antigo (faces/<nome>/<timestamp>.jpg): registra os arquivos existentes
+            images = [
+                {"file": f, "hash": None, "created": os.path.getmtime(os.path.join(user_dir, f))}
+                for f in sorted(os.listdir(user_dir)) if f.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            self._manifests[name] = {"images": images}
+            self._write_manifest(name, self._manifests[name])
+
+    @property
+    def pending(self):
+        """Operações aguardando a thread de escrita."""
+        return self._queue.qsize()
+
+    def users(self):
+        """`{nome: quantidade de imagens}` sem acessar o disco."""
+        with self._lock:
+            return {name: len(m["images"]) for name, m in self._manifests.items()}
+
+    def has_user(self, name):
+        """Se `name` tem imagens gravadas ou aguardando gravação."""
+        with self._lock:
+            return name in self._manifests or name in self._pending
+
+    def count(self, name):
+        with self._lock:
+            return len(self._manifests.get(name, {"images": []})["images"])
+
+    def page(self, limit, after=None):
+        """Até `limit` usuários em ordem de nome, após `after`; retorna `(itens, há_mais)`.
+
+        `itens` é uma lista de `(nome, quantidade de imagens)`.
+        """
+        with self._lock:
+            generation, names = self._sorted
+            if generation != self.generation:
+                names = sorted(self._manifests)
+                self._sorted = (self.generation, names)
+            start = bisect.bisect_right(names, after) if after is not None else 0
+            chosen = names[start:start + limit]
+            items = [(name, len(self._manifests[name]["images"])) for name in chosen]
+            return items, start + limit < len(names)
+
+    def images(self, name):
+        """Entradas do manifesto de `name` (arquivo, hash, criação)."""
+        with self._lock:
+            return list(self._manifests.get(name, {"images": []})["images"])
+
+    def put(self, name, image):
+        """Agenda a gravação do recorte de `name`; retorna `(hash, adicionado)`.
+
+        A entrada do manifesto só é criada pela thread de escrita, depois que
+        o arquivo foi gravado.
+        """
+        digest = content_hash(image)
+        with self._lock:
+            manifest = self._manifests.get(name, {"images": []})
+            if digest in self._pending.get(name, ()) or any(entry["hash"] == digest for entry in manifest["images"]):
+                return digest, False
+            self._pending.setdefault(name, set()).add(digest)
+        # Cópia: o recorte costuma ser uma visão do quadro, que será reutilizado
+        self._queue.put(('write', name, digest, image.copy(), time.time()))
+        return digest, True
+
+    def delete_user(self, name):
+        """Remove `name` do índice e agenda a remoção do diretório; retorna quantas imagens tinha."""
+        with self._lock:
+            manifest = self._manifests.pop(name, None)
+            pending = self._pending.pop(name, None)
+            self.generation += 1
+        if manifest is None and not pending:
+            return 0
+        self._queue.put(('delete', name, None, None, None))
+        return len(manifest["images"]) if manifest else 0
+
+    def _record(self, name, digest, created):
+        """Inclui no manifesto uma imagem já gravada; retorna a cópia a gravar (None se `name` foi removido)."""
+        with self._lock:
+            pending = self._pending.get(name)
+            if not pending or digest not in pending:
+                return None
+            pending.discard(digest)
+            if not pending:
+                del self._pending[name]
+            manifest = self._manifests.setdefault(name, {"images": []})
+            manifest["images"].append({"file": f"{digest}.{self.fmt}", "hash": digest, "created": created})
+            self.generation += 1
+            return {"images": list(manifest["images"])}
+
+    def _discard(self, name, digest):
+        """Esquece uma gravação que falhou (o recorte pode ser enviado de novo)."""
+        with self._lock:
+            pending = self._pending.get(name)
+            if pending is not None:
+                pending.discard(digest)
+                if not pending:
+                    del self._pending[name]
+
+    def _encode(self, image):
+        if self.fmt == 'jpg':
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        elif self.fmt == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, int(self.quality)]
+        else:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, 3]
+        ok, data = cv2.imencode(f".{self.fmt}", image, params)
+        if not ok:
+            raise ValueError("Falha ao codificar a imagem")
+        return data.tobytes()
+
+    def _write_manifest(self, name, manifest):
+        user_dir = os.path.join(self.root, name)
+        os.makedirs(user_dir, exist_ok=True)
+        path = os.path.join(user_dir, MANIFEST_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _writer(self):
+        # Uma única thread: escritas e remoções do mesmo usuário ficam em ordem
+        while True:
+            op, name, digest, image, created = self._queue.get()
+            try:
+                if op == 'stop':
+                    return
+                user_dir = os.path.join(self.root, name)
+                if op == 'write':
+                    os.makedirs(user_dir, exist_ok=True)
+                    with open(os.path.join(user_dir, f"{digest}.{self.fmt}"), 'wb') as f:
+                        f.write(self._encode(image))
+                    manifest = self._record(name, digest, created)
+                    if manifest is not None:
+                        self._write_manifest(name, manifest)
+                elif op == 'delete' and os.path.isdir(user_dir):
+                    shutil.rmtree(user_dir)
+            except Exception as e:
+                if op == 'write':
+                    self._discard(name, digest)
+                logger.error(f"Erro no armazenamento de imagens ({op} {name}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Aguarda todas as gravações pendentes."""
+        self._queue.join()
+
+    def stop(self):
+        """Grava o que estiver pendente e encerra a thread."""
+        if self._thread.is_alive():
+            self._queue.put(('stop', None, None, None, None))
+            self._thread.join(timeout=30)
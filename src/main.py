@@ -1,10 +1,23 @@
+import argparse
+import signal
+import sys
 import cv2
 import yaml
 import time
-import os
-import numpy as np
-from src.detectors import HaarDetector
-from src.utils import draw_box_and_label, load_encodings, save_encodings, enroll_face_in_memory
+from src.detectors import create_detector
+from src.quality import QualityGate
+from src.motion import MotionGate, overlaps
+from src.utils import draw_box_and_label
+from src.encoding import EncodingProfiles
+from src.gallery import Gallery
+from src.tiered import TieredGallery
+from src.unknown_cache import UnknownFaceCache
+from src.matching import match_faces
+from src.compaction import EnrollmentPolicy
+from src.image_store import ImageStore
+from src.events import FpsMeter, RecognitionEvents, create_sink
+from src.capture import open_capture
+from src.preview import PreviewServer
 
 # Carrega configuração
 with open('config.yaml') as f:
@@ -12,111 +25,247 @@ with open('config.yaml') as f:
 
 FACES_DIR = 'faces'
 ENC_FILE = 'encodings/encodings.pkl'
+# Faces encodadas por cadastro antes de desistir das capturas que faltam
+ENROLL_MAX_ATTEMPTS = 50
 
-def enroll_user(cap, known_encodings, known_names):
-    """Cadastra novo usuário e salva encoding."""
+def enroll_user(cap, gallery):
+    """Cadastra novo usuário e salva encoding.
+
+    Capturas quase idênticas às já feitas são ignoradas pela política de
+    cadastro e não contam para as 5 capturas; o cadastro termina após
+    `ENROLL_MAX_ATTEMPTS` faces encodadas mesmo sem completar as 5 (ex.:
+    identidade já no limite de amostras). O que foi aceito é sempre salvo,
+    inclusive ao sair com 'q'.
+    """
     name = input("Digite o nome do usuário para cadastro: ")
-    user_dir = os.path.join(FACES_DIR, name)
-    os.makedirs(user_dir, exist_ok=True)
     count = 0
+    attempts = 0
     print(f"[INFO] Capturando 5 imagens para '{name}'...")
     
-    while count < 5:
+    while count < 5 and attempts < ENROLL_MAX_ATTEMPTS:
         ret, frame = cap.read()
         if not ret:
             break
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = haar.detect(gray)
+        faces = detector.detect(gray)
         for (x, y, w, h) in faces:
             face_crop = frame[y:y+h, x:x+w]
-            # Salva a imagem
-            cv2.imwrite(os.path.join(user_dir, f"{count+1}.jpg"), face_crop)
-            # Salva o encoding em memória
-            enroll_face_in_memory(face_crop, name, known_encodings, known_names)
+            # Ignora capturas borradas, pequenas ou mal iluminadas
+            ok, reason, _ = quality_gate.check(face_crop)
+            if not ok:
+                draw_box_and_label(frame, (x, y, w, h), reason, color=(0,255,255))
+                continue
+            # Salva o encoding em memória (se não for redundante)
+            encodings = encoders.for_endpoint('camera_enroll').encode(frame, [(x, y, w, h)])
+            attempts += 1
+            if not encodings or not enrollment_policy.enroll(gallery, encodings[0], name):
+                continue
+            # Salva a imagem (em background)
+            image_store.put(name, face_crop)
             count += 1
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
             cv2.putText(frame, f"Captura {count}/5", (x, y-10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
         cv2.imshow("Cadastro de Rosto", frame)
         if cv2.waitKey(1) & 0xFF == ord('q'):
-            return
-    print("[INFO] Cadastro concluído.")
-    save_encodings(known_encodings, known_names, ENC_FILE)  # salva os encodings no disco
+            break
+    if count < 5:
+        print(f"[INFO] Cadastro interrompido com {count}/5 capturas.")
+    else:
+        print("[INFO] Cadastro concluído.")
+    if count:
+        gallery.save(ENC_FILE)  # salva os encodings no disco
 
-def delete_user(known_encodings, known_names):
+def delete_user(gallery):
     """Exclui um usuário cadastrado."""
     name = input("Digite o nome do usuário para excluir: ")
-    user_dir = os.path.join(FACES_DIR, name)
-    if os.path.exists(user_dir):
-        for f in os.listdir(user_dir):
-            os.remove(os.path.join(user_dir, f))
-        os.rmdir(user_dir)
+    has_images = image_store.has_user(name)
+    if has_images:
+        image_store.delete_user(name)
+    # Remove da memória também (embeddings podem existir sem imagens)
+    removed = gallery.remove(name)
+    if removed:
+        gallery.save(ENC_FILE)
+    if has_images or removed:
         print(f"[INFO] Usuário '{name}' excluído.")
-        # Remove da memória também
-        indices = [i for i, n in enumerate(known_names) if n == name]
-        for i in sorted(indices, reverse=True):
-            del known_names[i]
-            del known_encodings[i]
-        save_encodings(known_encodings, known_names, ENC_FILE)
     else:
         print("[INFO] Usuário não encontrado.")
 
-def run():
-    global haar
-    cap = cv2.VideoCapture(0)
-    fps_time = time.time()
+def recognize_boxes(frame, boxes, gallery):
+    """Reconhece as faces das caixas e retorna `(caixa, rótulo, cor, status)` de cada uma.
+
+    `status` é 'recognized', 'unknown' ou 'rejected' (reprovada no filtro de qualidade).
+    """
+    results = []
+    accepted = []
+    for (x, y, w, h) in boxes:
+        face_crop = frame[y:y+h, x:x+w]
+        ok, reason, _ = quality_gate.check(face_crop)
+        if not ok:
+            results.append(((x, y, w, h), reason, (0,255,255), 'rejected'))
+        else:
+            accepted.append((x, y, w, h))
+    # Reconhecimento via face_recognition (todas as faces do quadro de uma vez)
+    encodings = encoders.for_endpoint('camera').encode(frame, accepted)
+    tolerance = cfg['face_recog']['tolerance']
+    if unknown_cache is not None:
+        # Visitante parado na frente da câmera: o mesmo desconhecido não varre a galeria a cada quadro
+        matches = unknown_cache.match(encodings, gallery, tolerance)
+    else:
+        matches = match_faces(encodings, gallery, tolerance)
+    for box, (name, _) in zip(accepted, matches):
+        if name:
+            results.append((box, name, (0,255,0), 'recognized'))  # verde
+        else:
+            results.append((box, "Rosto Desconhecido", (0,0,255), 'unknown'))  # vermelho
+    return results
+
+def detect_and_recognize(frame, gallery, motion_gate, results, timestamp=None):
+    """Detecção (limitada pelo gate de movimento) e reconhecimento de um quadro.
 
-    # Inicializa detector Haar Cascade
-    haar_cfg = cfg.get('haar', {})
-    haar = HaarDetector(
-        cascade_path='src/models/haarcascade_frontalface_default.xml',
-        scaleFactor=haar_cfg.get('scaleFactor', 1.1),
-        minNeighbors=haar_cfg.get('minNeighbors', 5),
-        minSize=tuple(haar_cfg.get('minSize', (30, 30)))
-    )
+    Retorna os resultados atualizados; quadros sem mudança mantêm `results`.
+    """
+    detect, rois = motion_gate.update(frame, timestamp)
+    if not detect:
+        return results
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if rois is None:
+        return recognize_boxes(frame, detector.detect(gray), gallery)
+    # Detecta só nas regiões alteradas e mantém os rostos parados fora delas
+    faces = detector.detect_rois(gray, rois)
+    return [r for r in results if not overlaps(r[0], rois)] + recognize_boxes(frame, faces, gallery)
 
-    # Carrega encodings cadastrados
-    known_encodings, known_names = load_encodings(ENC_FILE)
+def run_headless(cap, gallery, motion_gate, fps_meter, events, sink, preview=None):
+    """Laço sem interface: só detecção, reconhecimento e eventos.
 
+    Com `preview`, os quadros só são anotados enquanto houver espectadores.
+    """
+    results = []
     while True:
         ret, frame = cap.read()
         if not ret:
             break
+        results = detect_and_recognize(frame, gallery, motion_gate, results, cap.timestamp)
+        for event in events.update(results, cap.timestamp):
+            sink.emit(event)
+        if preview is not None and preview.active:
+            for box, label, color, _ in results:
+                draw_box_and_label(frame, box, label, color=color)
+            preview.publish(frame)
+        stats = fps_meter.tick()
+        if stats:
+            sink.emit({"event": "stats", "timestamp": time.time(), **stats})
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = haar.detect(gray)
+def run(headless=False, events_target=None, source=None, pacing=None, preview=False):
+    """Laço da câmera.
 
-        for (x, y, w, h) in faces:
-            face_crop = frame[y:y+h, x:x+w]
-            # Reconhecimento via face_recognition
-            face_rgb = face_crop[:, :, ::-1]
-            import face_recognition
-            encodings = face_recognition.face_encodings(face_rgb)
-            name = "Rosto Desconhecido"
-            color = (0,0,255)  # vermelho por padrão
-            if encodings:
-                distances = face_recognition.face_distance(known_encodings, encodings[0])
-                if len(distances) > 0:
-                    min_idx = np.argmin(distances)
-                    if distances[min_idx] <= cfg['face_recog']['tolerance']:
-                        name = known_names[min_idx]
-                        color = (0,255,0)  # verde
-            draw_box_and_label(frame, (x, y, w, h), name, color=color)
+    A fonte de quadros vem da seção `capture` do config.yaml (`source` e
+    `pacing` a substituem, ex.: para reproduzir uma gravação). Com
+    `headless`, não abre janela nem desenha nos quadros: os
+    reconhecimentos saem como eventos JSON (`events_target` ou
+    `headless.events` do config.yaml) e o FPS sustentado como eventos `stats`.
+    Com `preview` (ou `preview.enabled`), o quadro anotado também é servido
+    como stream MJPEG (src/preview.py).
+    """
+    global detector, quality_gate, enrollment_policy, image_store, encoders, unknown_cache
+    cap = open_capture(cfg, source, pacing)
+
+    # Inicializa o detector configurado em `method` (haar, lbp ou hog)
+    detector = create_detector(cfg)
+
+    # Filtro de qualidade aplicado antes do encoding
+    quality_gate = QualityGate.from_config(cfg)
+
+    # Perfis de encoding: rápido no reconhecimento, com mais jitter no cadastro
+    encoders = EncodingProfiles.from_config(cfg)
+
+    # Carrega encodings cadastrados e a política de cadastro (deduplicação/limite)
+    gallery = Gallery.from_config(cfg, ENC_FILE)
+    if cfg.get('gallery', {}).get('hot_tier', {}).get('enabled', False):
+        gallery = TieredGallery.from_config(cfg, gallery)
+    enrollment_policy = EnrollmentPolicy.from_config(cfg)
+    unknown_cache = UnknownFaceCache.from_config(cfg)
+
+    # Imagens dos cadastros, gravadas em background
+    image_store = ImageStore.from_config(cfg, FACES_DIR)
+
+    # Pula a detecção em quadros sem mudança na cena
+    motion_gate = MotionGate.from_config(cfg)
+    results = []  # (caixa, rótulo, cor, status) da última detecção
+
+    # Pré-visualização MJPEG: um JPEG por quadro, compartilhado por todos os espectadores
+    preview_server = None
+    if preview or cfg.get('preview', {}).get('enabled', False):
+        preview_server = PreviewServer.from_config(cfg).start()
+        print(f"[INFO] Pré-visualização em {preview_server.url}", file=sys.stderr)
+    broadcaster = preview_server.broadcaster if preview_server else None
+
+    headless_cfg = cfg.get('headless', {})
+    fps_meter = FpsMeter(headless_cfg.get('report_interval', 10.0) if headless else 1.0)
+    if headless:
+        sink = create_sink(events_target or headless_cfg.get('events', 'stdout'),
+                           timeout=headless_cfg.get('timeout', 2.0))
+        events = RecognitionEvents(repeat_after=headless_cfg.get('repeat_after', 5.0))
+        # Rodando como serviço: SIGTERM encerra o laço pelo mesmo caminho do Ctrl+C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            run_headless(cap, gallery, motion_gate, fps_meter, events, sink, broadcaster)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            cap.release()
+            sink.emit({"event": "summary", "timestamp": time.time(), **fps_meter.summary()})
+            sink.close()
+            if preview_server:
+                preview_server.stop()
+        return
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        results = detect_and_recognize(frame, gallery, motion_gate, results, cap.timestamp)
+
+        fps_meter.tick()
+        for box, label, color, _ in results:
+            draw_box_and_label(frame, box, label, color=color)
+        if cfg.get('show_fps', False):
+            cv2.putText(frame, f"FPS: {fps_meter.fps:.1f}", (10, 25),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
 
         cv2.putText(frame, "C: Cadastrar | D: Deletar | Q: Sair", (10, frame.shape[0]-10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
         cv2.imshow(cfg.get('window_name', 'FaceID-Local'), frame)
+        if broadcaster is not None:
+            broadcaster.publish(frame)
 
         key = cv2.waitKey(1) & 0xFF
         if key == ord('q'):
             break
         elif key == ord('c'):
-            enroll_user(cap, known_encodings, known_names)
+            enroll_user(cap, gallery)
+            motion_gate.reset()
         elif key == ord('d'):
-            delete_user(known_encodings, known_names)
+            delete_user(gallery)
+            motion_gate.reset()
 
     cap.release()
     cv2.destroyAllWindows()
+    if preview_server:
+        preview_server.stop()
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(description="Reconhecimento facial com a câmera local")
+    parser.add_argument('--headless', action='store_true', help="Sem janela; emite eventos JSON")
+    parser.add_argument('--events', default=None,
+                        help="Destino dos eventos: stdout, arquivo .jsonl ou URL http (padrão: headless.events)")
+    parser.add_argument('--source', default=None,
+                        help="Índice da câmera, arquivo de vídeo ou diretório de imagens (padrão: capture.source)")
+    parser.add_argument('--pacing', choices=('realtime', 'fast'), default=None,
+                        help="Ritmo da reprodução de gravações (padrão: capture.pacing)")
+    parser.add_argument('--preview', action='store_true',
+                        help="Serve o quadro anotado como stream MJPEG (padrão: preview.enabled)")
+    args = parser.parse_args()
+    run(headless=args.headless, events_target=args.events, source=args.source, pacing=args.pacing,
+        preview=args.preview)
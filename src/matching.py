@@ -0,0 +1,158 @@
+"""
+Comparação vetorizada de embeddings contra a galeria.
+"""
+
+import numpy as np
+
+from src.quantization import rerank
+
+# Varredura com saída antecipada: sem `block_rows`, a galeria é dividida em
+# EARLY_EXIT_BLOCKS blocos de pelo menos MIN_BLOCK_ROWS linhas
+EARLY_EXIT_BLOCKS = 8
+MIN_BLOCK_ROWS = 1024
+
+
+def distance_matrix(probes, matrix, sq_norms=None):
+    """Distâncias euclidianas entre cada probe (P x 128) e cada linha da galeria (N x 128).
+
+    Usa ||a - b||² = ||a||² + ||b||² - 2·a·b, ou seja, uma única multiplicação
+    de matrizes em vez de um laço por probe. Os probes são convertidos para o
+    dtype da galeria (float32): um probe float64 faria o NumPy promover a
+    galeria inteira para float64 a cada chamada.
+    """
+    matrix = np.asarray(matrix)
+    dtype = matrix.dtype if np.issubdtype(matrix.dtype, np.floating) else np.float64
+    probes = np.atleast_2d(np.asarray(probes, dtype=dtype))
+    if sq_norms is None:
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+    probe_norms = np.einsum('ij,ij->i', probes, probes)
+    sq = probe_norms[:, None] + sq_norms[None, :] - 2.0 * (probes @ matrix.T)
+    return np.sqrt(np.maximum(sq, 0.0))
+
+
+def scan_blocks(rows, block_rows=None):
+    """Limites `(início, fim)` dos blocos de uma varredura com saída antecipada."""
+    if block_rows is None:
+        block_rows = max(MIN_BLOCK_ROWS, -(-rows // EARLY_EXIT_BLOCKS))
+    return [(start, min(start + block_rows, rows)) for start in range(0, rows, block_rows)]
+
+
+def match_faces(probes, gallery, tolerance, early_exit=None, block_rows=None):
+    """Casa várias faces com a galeria em uma operação matricial.
+
+    Com a galeria quantizada, a varredura grossa usa a cópia int16/int8 e
+    só os `rerank_candidates` melhores de cada probe são recalculados em float32.
+    Com `early_exit`, a galeria é varrida em blocos (`scan_blocks`) e a
+    varredura para assim que todos os probes têm uma linha a essa distância
+    ou menos; a distância devolvida é então a melhor dos blocos já varridos.
+
+    Retorna, para cada probe, `(nome ou None, distância ou None)`.
+    """
+    if hasattr(gallery, 'match'):
+        # Galeria em camadas ou particionada: a busca é feita por ela
+        return gallery.match(probes, tolerance, early_exit=early_exit, block_rows=block_rows)
+    quantized, matrix, names, sq_norms = gallery.quantized_snapshot()
+    if len(probes) == 0:
+        return []
+    if len(matrix) == 0:
+        return [(None, None) for _ in probes]
+    probes = np.atleast_2d(probes)
+    blocks = scan_blocks(len(matrix), block_rows) if early_exit is not None else [(0, len(matrix))]
+    best = np.zeros(len(probes), dtype=np.int64)
+    best_distances = np.full(len(probes), np.inf)
+    for start, stop in blocks:
+        if quantized is not None and stop - start > gallery.rerank_candidates:
+            candidates = quantized.candidates(probes, gallery.rerank_candidates, start, stop)
+            idx, distances = rerank(probes, matrix, candidates)
+        else:
+            block = distance_matrix(probes, matrix[start:stop], sq_norms[start:stop])
+            idx = np.argmin(block, axis=1)
+            distances = block[np.arange(len(idx)), idx]
+            idx = idx + start
+        better = distances < best_distances
+        best[better], best_distances[better] = idx[better], distances[better]
+        if early_exit is not None and np.all(best_distances <= early_exit):
+            break
+    results = []
+    for idx, distance in zip(best, best_distances):
+        distance = float(distance)
+        results.append((names[idx] if distance <= tolerance else None, distance))
+    return results
+
+
+def _top_rows(distances, labels, k):
+    """Melhores `k` identidades de uma linha de distâncias: `[(rótulo, distância), ...]`.
+
+    Seleciona com `argpartition` só as linhas mais próximas; se elas não
+    cobrirem `k` identidades distintas, amplia a seleção. Como a menor linha
+    de cada identidade presente está entre as selecionadas, o resultado é exato.
+    """
+    n = len(distances)
+    count = min(n, 4 * k)
+    while True:
+        idx = np.argpartition(distances, count - 1)[:count] if count < n else np.arange(n)
+        idx = idx[np.argsort(distances[idx], kind='stable')]
+        found = {}
+        for i in idx:
+            label = labels[i]
+            if label not in found:
+                found[label] = float(distances[i])
+                if len(found) == k:
+                    break
+        if len(found) == k or count == n:
+            return list(found.items())
+        count = min(n, count * 4)
+
+
+def top_k_identities(probes, gallery, k=5, early_exit=None, block_rows=None):
+    """As `k` identidades mais próximas de cada probe (menor distância por identidade).
+
+    A galeria é varrida em blocos (`scan_blocks`) e os top-k de cada bloco
+    são combinados (o que é exato). Com `early_exit`, a varredura para
+    assim que todos os probes têm uma identidade a essa distância ou menos;
+    o top-k passa então a considerar só os blocos já varridos.
+
+    Retorna, para cada probe, uma lista `[(nome, distância), ...]` em ordem crescente.
+    """
+    if hasattr(gallery, 'search'):
+        # Galeria em camadas ou particionada: a busca é feita por ela
+        return gallery.search(probes, k, early_exit=early_exit, block_rows=block_rows)
+    matrix, sq_norms, labels, identities = gallery.labeled_snapshot()
+    if len(probes) == 0:
+        return []
+    if len(matrix) == 0:
+        return [[] for _ in probes]
+    k = min(k, len(identities))
+    best = [{} for _ in range(len(np.atleast_2d(probes)))]
+    for start, stop in scan_blocks(len(matrix), block_rows):
+        distances = distance_matrix(probes, matrix[start:stop], sq_norms[start:stop])
+        for found, row in zip(best, distances):
+            for label, distance in _top_rows(row, labels[start:stop], k):
+                if distance < found.get(label, np.inf):
+                    found[label] = distance
+        if early_exit is not None and all(min(found.values()) <= early_exit for found in best):
+            break
+    return [
+        [(identities[label], distance) for label, distance in sorted(found.items(), key=lambda item: item[1])[:k]]
+        for found in best
+    ]
+
+
+def identity_margin(candidates):
+    """Diferença entre a segunda e a melhor identidade (None com menos de duas)."""
+    if len(candidates) < 2:
+        return None
+    return candidates[1][1] - candidates[0][1]
+
+
+def verify_identity(probe, gallery, name, tolerance):
+    """Verificação 1:1: compara `probe` só com os embeddings de `name` (via índice de identidade).
+
+    Retorna `(corresponde, distância, margem)`; `distância` é None se `name`
+    não tiver embeddings. A margem é `tolerance - distância` (positiva = aceito).
+    """
+    rows = gallery.identity_matrix(name)
+    if len(rows) == 0:
+        return False, None, None
+    distance = float(np.min(distance_matrix(probe, rows)))
+    return distance <= tolerance, distance, tolerance - distance
@@ -0,0 +1,100 @@
+"""
+Portão de movimento para o loop da câmera.
+
+Compara cada quadro, reduzido e em tons de cinza, com um fundo de média
+móvel. Sem mudança na cena a detecção é pulada; com mudança, retorna as
+regiões alteradas para que o detector rode só nelas. Um "heartbeat"
+força a detecção no quadro inteiro periodicamente, para não perder rostos
+parados.
+"""
+
+import time
+
+import cv2
+
+
+class MotionGate:
+    """Decide, quadro a quadro, se e onde rodar a detecção de faces."""
+
+    def __init__(self, enabled=True, scale=0.25, threshold=25, min_area=0.002,
+                 learning_rate=0.05, heartbeat=2.0, padding=0.3):
+        self.enabled = enabled
+        self.scale = scale
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.heartbeat = heartbeat
+        self.padding = padding
+        self._background = None
+        self._last_full = 0.0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Cria o portão a partir da seção `motion` do config.yaml."""
+        m = cfg.get('motion', {})
+        return cls(
+            enabled=m.get('enabled', True),
+            scale=m.get('scale', 0.25),
+            threshold=m.get('threshold', 25),
+            min_area=m.get('min_area', 0.002),
+            learning_rate=m.get('learning_rate', 0.05),
+            heartbeat=m.get('heartbeat', 2.0),
+            padding=m.get('padding', 0.3)
+        )
+
+    def reset(self):
+        """Descarta o fundo; o próximo quadro roda detecção completa."""
+        self._background = None
+
+    def update(self, frame, now=None):
+        """Retorna `(detectar, rois)`.
+
+        `rois` é None quando a detecção deve usar o quadro inteiro, ou uma
+        lista de caixas (x, y, w, h) em coordenadas do quadro original.
+        `now` é o tempo do quadro (padrão: relógio); na reprodução de uma
+        gravação, o tempo do vídeo torna o heartbeat reprodutível.
+        """
+        if not self.enabled:
+            return True, None
+
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        now = time.time() if now is None else now
+        if self._background is None:
+            self._background = small.astype('float32')
+            self._last_full = now
+            return True, None
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+
+        if now - self._last_full >= self.heartbeat:
+            self._last_full = now
+            return True, None
+
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_pixels = self.min_area * small.shape[0] * small.shape[1]
+        rois = [self._to_frame_roi(cv2.boundingRect(c), frame.shape)
+                for c in contours if cv2.contourArea(c) >= min_pixels]
+        return bool(rois), rois
+
+    def _to_frame_roi(self, rect, frame_shape):
+        """Converte a caixa do quadro reduzido para o original, com margem."""
+        x, y, w, h = (v / self.scale for v in rect)
+        pad_w, pad_h = w * self.padding, h * self.padding
+        x0 = max(0, int(x - pad_w))
+        y0 = max(0, int(y - pad_h))
+        x1 = min(frame_shape[1], int(x + w + pad_w))
+        y1 = min(frame_shape[0], int(y + h + pad_h))
+        return (x0, y0, x1 - x0, y1 - y0)
+
+
+def overlaps(box, rois):
+    """Indica se a caixa (x, y, w, h) intersecta alguma das regiões."""
+    x, y, w, h = box
+    return any(x < rx + rw and rx < x + w and y < ry + rh and ry < y + h
+               for (rx, ry, rw, rh) in rois)
@@ -0,0 +1,100 @@
+"""
+Persistência da galeria em background, com escrita agrupada.
+
+Os endpoints só marcam a galeria como alterada (`mark_dirty`); uma thread
+espera `interval` segundos após a primeira alteração, para agrupar rajadas
+de cadastros/remoções, e grava uma única vez (escrita atômica em
+`utils.save_encodings`). `stop()` grava o que estiver pendente e deve rodar
+no encerramento do processo (`install_shutdown_hook`).
+"""
+
+import atexit
+import logging
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GalleryPersister:
+    """Grava a galeria em `path` no máximo uma vez a cada `interval` segundos."""
+
+    def __init__(self, gallery, path, interval=1.0, on_save=None):
+        self.gallery = gallery
+        self.path = path
+        self.interval = interval
+        self.on_save = on_save
+        self.persisted_generation = gallery.generation
+        self.writes = 0
+        self.last_error = None
+        self._dirty = threading.Event()
+        self._stopping = False
+        self._save_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name='gallery-persister', daemon=True)
+
+    @classmethod
+    def from_config(cls, cfg, gallery, path, on_save=None):
+        """Cria o persister conforme a seção `persistence` do config.yaml."""
+        p = cfg.get('persistence', {})
+        return cls(gallery, path, interval=p.get('interval', 1.0), on_save=on_save)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def pending(self):
+        """True se há alterações ainda não gravadas."""
+        return self.gallery.generation != self.persisted_generation
+
+    def mark_dirty(self):
+        """Agenda uma gravação (não bloqueia)."""
+        self._dirty.set()
+
+    def flush(self):
+        """Grava agora, se houver alterações pendentes; retorna True se gravou."""
+        with self._save_lock:
+            generation = self.gallery.generation
+            if generation == self.persisted_generation:
+                return False
+            start = time.perf_counter()
+            try:
+                self.gallery.save(self.path)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Erro ao salvar a galeria em {self.path}: {e}")
+                return False
+            # Gravou um snapshot pelo menos tão novo quanto `generation`
+            self.persisted_generation = generation
+            self.writes += 1
+            self.last_error = None
+            if self.on_save:
+                self.on_save(time.perf_counter() - start)
+            return True
+
+    def _loop(self):
+        while not self._stopping:
+            self._dirty.wait()
+            if self._stopping:
+                break
+            # Agrupa as alterações que chegarem durante o intervalo
+            time.sleep(self.interval)
+            self._dirty.clear()
+            self.flush()
+
+    def stop(self):
+        """Encerra a thread gravando o que estiver pendente."""
+        self._stopping = True
+        self._dirty.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def install_shutdown_hook(self):
+        """Grava as alterações pendentes na saída do processo (inclusive via SIGTERM)."""
+        atexit.register(self.stop)
+        if threading.current_thread() is threading.main_thread():
+            # SIGTERM vira SystemExit para que o atexit rode
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
@@ -0,0 +1,204 @@
+"""
+Pré-visualização MJPEG do laço da câmera para vários espectadores.
+
+O laço publica o quadro anotado (`publish`), o que só guarda a referência.
+Uma thread codifica em JPEG o quadro mais recente, uma vez, no tamanho e
+qualidade configurados, e só enquanto houver espectadores; todos recebem o
+mesmo buffer. Cada espectador envia sempre o JPEG mais novo quando termina o
+envio anterior, então um cliente lento pula quadros sem segurar o laço nem
+os outros espectadores. Espectadores nunca disparam reconhecimento nem
+codificação extra.
+
+    GET /preview       stream multipart/x-mixed-replace (abre no navegador)
+    GET /preview.jpg   último quadro
+
+Os quadros mostram rostos e nomes: todas as rotas exigem o token da variável
+de ambiente FACE_PREVIEW_TOKEN, no header `X-Preview-Token` ou em `?token=`
+(para abrir direto no navegador). Sem token configurado, nada é servido.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import cv2
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from src.profiling import check_admin_token
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = 'frame'
+
+
+class PreviewBroadcaster:
+    """Quadro anotado mais recente, codificado uma vez e compartilhado."""
+
+    def __init__(self, quality=70, max_width=640, max_fps=15.0):
+        self.quality = quality
+        self.max_width = max_width
+        self.max_fps = max_fps
+        self.viewers = 0
+        self.encoded = 0
+        self.skipped = 0
+        self._frame = None
+        self._frame_sequence = 0
+        self._jpeg = None
+        self._sequence = 0
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._encoder, name='preview-encoder', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Cria o broadcaster conforme a seção `preview` do config.yaml."""
+        p = cfg.get('preview', {})
+        return cls(quality=p.get('quality', 70), max_width=p.get('max_width', 640), max_fps=p.get('max_fps', 15.0))
+
+    @property
+    def active(self):
+        """True se há espectadores (o laço só precisa anotar quadros nesse caso)."""
+        return self.viewers > 0
+
+    def publish(self, frame):
+        """Oferece o quadro anotado; não copia nem codifica na thread do laço."""
+        with self._cond:
+            self._frame = frame
+            self._frame_sequence += 1
+            self._cond.notify_all()
+
+    def _encode(self, frame):
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            scale = self.max_width / width
+            frame = cv2.resize(frame, (self.max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+        ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        return data.tobytes() if ok else None
+
+    def _encoder(self):
+        encoded_sequence = 0
+        last = 0.0
+        while True:
+            with self._cond:
+                while not self._stopping and (self.viewers == 0 or self._frame_sequence == encoded_sequence):
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                frame, encoded_sequence = self._frame, self._frame_sequence
+            if self.max_fps:
+                # Limita a taxa de codificação; quadros publicados no intervalo são pulados
+                delay = last + 1.0 / self.max_fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    with self._cond:
+                        frame, encoded_sequence = self._frame, self._frame_sequence
+            last = time.monotonic()
+            jpeg = self._encode(frame)
+            if jpeg is None:
+                continue
+            with self._cond:
+                self._jpeg = jpeg
+                self._sequence += 1
+                self.encoded += 1
+                self._cond.notify_all()
+
+    def latest(self):
+        """Último JPEG codificado (ou None)."""
+        return self._jpeg
+
+    def stream(self, timeout=5.0):
+        """Gerador multipart de um espectador: sempre o JPEG mais recente."""
+        with self._cond:
+            self.viewers += 1
+            self._cond.notify_all()
+        sent = 0
+        try:
+            while not self._stopping:
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self._sequence != sent or self._stopping, timeout):
+                        continue
+                    if self._stopping:
+                        return
+                    if sent:
+                        self.skipped += self._sequence - sent - 1
+                    jpeg, sent = self._jpeg, self._sequence
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n"
+                       .encode('ascii') + jpeg + b"\r\n")
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+    def stats(self):
+        return {"viewers": self.viewers, "encoded": self.encoded, "skipped": self.skipped,
+                "quality": self.quality, "max_width": self.max_width}
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2)
+
+
+def create_preview_app(broadcaster, token):
+    """App Flask com o stream, o último quadro e as estatísticas, para quem apresentar `token`."""
+    app = Flask(__name__)
+
+    @app.before_request
+    def authorize():
+        provided = request.headers.get('X-Preview-Token') or request.args.get('token')
+        if not check_admin_token(provided, token):
+            return jsonify({"success": False, "error": "Não autorizado"}), 403
+
+    @app.route('/preview')
+    def preview():
+        return Response(broadcaster.stream(), mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+
+    @app.route('/preview.jpg')
+    def snapshot():
+        jpeg = broadcaster.latest()
+        if jpeg is None:
+            return jsonify({"success": False, "error": "Nenhum quadro disponível"}), 404
+        return Response(jpeg, mimetype='image/jpeg')
+
+    @app.route('/preview/stats')
+    def stats():
+        return jsonify(broadcaster.stats())
+
+    return app
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PreviewServer:
+    """Servidor da pré-visualização em thread daemon, ao lado do laço da câmera."""
+
+    def __init__(self, broadcaster, host='127.0.0.1', port=8090, token=None):
+        self.broadcaster = broadcaster
+        token = token or os.environ.get('FACE_PREVIEW_TOKEN')
+        if not token:
+            logger.warning("FACE_PREVIEW_TOKEN não definido: a pré-visualização recusará todos os acessos")
+        self.server = make_server(host, port, create_preview_app(broadcaster, token), threaded=True,
+                                  request_handler=_QuietHandler)
+        self.url = f"http://{host}:{self.server.server_port}/preview"
+        self._thread = threading.Thread(target=self.server.serve_forever, name='preview-server', daemon=True)
+
+    @classmethod
+    def from_config(cls, cfg):
+        p = cfg.get('preview', {})
+        return cls(PreviewBroadcaster.from_config(cfg), host=p.get('host', '127.0.0.1'), port=p.get('port', 8090))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Encerra os streams antes do servidor, senão o shutdown espera os geradores
+        self.broadcaster.stop()
+        self.server.shutdown()
+        self._thread.join(timeout=5)
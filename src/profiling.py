@@ -0,0 +1,119 @@
+"""
+Ferramentas de profiling sob demanda para o servidor de reconhecimento.
+
+- `profile_call`: executa uma única chamada sob cProfile e salva o `.prof`.
+- `SamplingProfiler`: amostrador de pilhas de baixo custo, ligado/desligado em
+  tempo de execução, que grava arquivos "collapsed stack" (uma pilha por linha,
+  frames separados por `;` e a contagem no fim) compatíveis com flamegraph.pl
+  e speedscope.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def check_admin_token(provided, expected):
+    """Compara o token informado com o configurado (tempo constante).
+
+    Sem token configurado o profiling fica desabilitado.
+    """
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(str(provided), str(expected))
+
+
+def profile_call(output_dir, label, func, *args, **kwargs):
+    """Executa `func` sob cProfile e grava as estatísticas em `output_dir`.
+
+    Retorna `(resultado, caminho_do_prof, resumo_texto)`; o resumo traz as
+    funções com maior tempo cumulativo.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+    path = os.path.join(output_dir, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(25)
+    return result, path, buffer.getvalue()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Amostra periodicamente as pilhas de todas as threads do processo.
+
+    O custo é proporcional a `1 / interval` e independe do volume de
+    requisições, por isso pode ser ligado em produção por curtos períodos.
+    """
+
+    def __init__(self, output_dir='profiles', interval=0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._stacks = Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running:
+                return False
+            if interval:
+                self.interval = interval
+            self._stacks = Counter()
+            self._samples = 0
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
+
+    def stop(self):
+        """Para a amostragem e grava o arquivo collapsed; retorna `(caminho, amostras)`."""
+        with self._lock:
+            if not self.running:
+                return None, 0
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"sample-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+            with open(path, 'w') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            return path, self._samples
@@ -0,0 +1,167 @@
+"""
+Representações quantizadas da galeria (int16 e int8) com rerank exato.
+
+A busca grossa varre a matriz quantizada (2x ou 4x menor que float32) em
+blocos e seleciona os melhores candidatos por probe; só esses candidatos são
+recalculados em float32 contra os embeddings originais. A perda de precisão
+em relação ao caminho exato pode ser medida com:
+
+    python -m src.quantization --encodings encodings/encodings.pkl --mode int8
+
+Os códigos são inteiros com escala por coluna: a conversão inteiro -> float32
+é vetorizada no NumPy, ao contrário da de float16, que deixava a varredura
+mais lenta que a exata em float32.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+MODES = ('none', 'int16', 'int8')
+
+# Tipo dos códigos e maior |código| de cada modo
+CODES = {'int16': (np.int16, 32767), 'int8': (np.int8, 127)}
+
+# Linhas convertidas para float32 por vez: o bloco (512 KB) fica no cache e
+# é reaproveitado, então a varredura lê só os códigos da memória
+BLOCK_ROWS = 1024
+
+
+class QuantizedMatrix:
+    """Matriz de embeddings quantizada para varredura grossa."""
+
+    def __init__(self, matrix, mode='int8'):
+        if mode not in CODES:
+            raise ValueError(f"Modo de quantização inválido: {mode}")
+        dtype, limit = CODES[mode]
+        self.mode = mode
+        self.rows, dim = matrix.shape
+        # Escala por dimensão: o maior |valor| de cada coluna vira `limit`
+        max_abs = np.zeros(dim, dtype=np.float32)
+        for start in range(0, self.rows, BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+            np.maximum(max_abs, np.abs(block).max(axis=0), out=max_abs)
+        self.scale = np.where(max_abs > 0, max_abs / limit, 1.0).astype(np.float32)
+        # Quantiza bloco a bloco para não criar uma cópia float32 da galeria inteira
+        self.codes = np.empty((self.rows, dim), dtype=dtype)
+        self.sq_norms = np.empty(self.rows, dtype=np.float32)
+        for start in range(0, self.rows, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, self.rows)
+            block = np.asarray(matrix[start:stop], dtype=np.float32)
+            self.codes[start:stop] = np.clip(np.rint(block / self.scale), -limit, limit)
+            decoded = self.decode(slice(start, stop))
+            self.sq_norms[start:stop] = np.einsum('ij,ij->i', decoded, decoded)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.nbytes + self.sq_norms.nbytes
+
+    def decode(self, rows):
+        """Reconstrói (aproximadamente) as linhas em float32."""
+        return self.codes[rows].astype(np.float32) * self.scale
+
+    def coarse_distances(self, probes, start=0, stop=None):
+        """Distâncias² aproximadas (P x linhas) às linhas `start:stop`, calculadas bloco a bloco."""
+        stop = self.rows if stop is None else stop
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        # A escala vai para o probe: (q·s)·c == q·(s·c)
+        scaled = probes * self.scale
+        probe_norms = np.einsum('ij,ij->i', probes, probes)
+        out = np.empty((len(probes), stop - start), dtype=np.float32)
+        block = np.empty((BLOCK_ROWS, self.codes.shape[1]), dtype=np.float32)
+        for first in range(start, stop, BLOCK_ROWS):
+            last = min(first + BLOCK_ROWS, stop)
+            rows = block[:last - first]
+            np.copyto(rows, self.codes[first:last], casting='unsafe')
+            np.matmul(scaled, rows.T, out=out[:, first - start:last - start])
+        out *= -2.0
+        out += probe_norms[:, None]
+        out += self.sq_norms[None, start:stop]
+        return out
+
+    def candidates(self, probes, count, start=0, stop=None):
+        """Índices dos `count` candidatos mais próximos de cada probe entre as linhas `start:stop` (sem ordem)."""
+        coarse = self.coarse_distances(probes, start, stop)
+        rows = coarse.shape[1]
+        if count >= rows:
+            return np.tile(np.arange(start, start + rows), (len(coarse), 1))
+        return np.argpartition(coarse, count - 1, axis=1)[:, :count] + start
+
+
+def rerank(probes, matrix, candidates):
+    """Distâncias exatas (float32) de cada probe aos seus candidatos.
+
+    Retorna `(melhor_indice, melhor_distancia)` por probe.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    best_idx = np.empty(len(probes), dtype=np.int64)
+    best_dist = np.empty(len(probes), dtype=np.float64)
+    for i, (probe, cand) in enumerate(zip(probes, candidates)):
+        rows = np.asarray(matrix[cand], dtype=np.float32)
+        d = np.sqrt(np.maximum(np.einsum('ij,ij->i', rows - probe, rows - probe), 0.0))
+        j = int(np.argmin(d))
+        best_idx[i], best_dist[i] = cand[j], d[j]
+    return best_idx, best_dist
+
+
+def evaluate(matrix, names, mode, rerank_candidates=32, tolerance=0.6, samples=500, seed=0):
+    """Compara o caminho quantizado com o exato em busca leave-one-out.
+
+    Cada probe é uma linha da galeria, excluída da própria busca. Mede a
+    concordância de identidade no top-1, a concordância da decisão
+    (reconhecido ou não) e o erro absoluto médio da distância.
+    """
+    from src.matching import distance_matrix
+    matrix = np.asarray(matrix, dtype=np.float32)
+    names = np.asarray(names, dtype=object)
+    rng = np.random.default_rng(seed)
+    probe_idx = rng.choice(len(matrix), size=min(samples, len(matrix)), replace=False)
+    probes = matrix[probe_idx]
+
+    start = time.perf_counter()
+    exact = distance_matrix(probes, matrix)
+    exact[np.arange(len(probe_idx)), probe_idx] = np.inf
+    exact_best = np.argmin(exact, axis=1)
+    exact_time = time.perf_counter() - start
+
+    quantized = QuantizedMatrix(matrix, mode)
+    start = time.perf_counter()
+    cand = quantized.candidates(probes, rerank_candidates + 1)
+    # Remove a própria linha dos candidatos (leave-one-out)
+    cand = [c[c != p] for c, p in zip(cand, probe_idx)]
+    q_best, q_dist = rerank(probes, matrix, cand)
+    quant_time = time.perf_counter() - start
+
+    exact_dist = exact[np.arange(len(probe_idx)), exact_best]
+    return {
+        "mode": mode,
+        "rows": len(matrix),
+        "probes": len(probe_idx),
+        "top1_identity_agreement": float(np.mean(names[exact_best] == names[q_best])),
+        "decision_agreement": float(np.mean((exact_dist <= tolerance) == (q_dist <= tolerance))),
+        "mean_abs_distance_error": float(np.mean(np.abs(exact_dist - q_dist))),
+        "float32_bytes": int(matrix.nbytes),
+        "quantized_bytes": int(quantized.nbytes),
+        "exact_seconds": exact_time,
+        "quantized_seconds": quant_time
+    }
+
+
+if __name__ == '__main__':
+    from src.gallery import Gallery
+    parser = argparse.ArgumentParser(description="Mede a perda de precisão da galeria quantizada")
+    parser.add_argument('--encodings', default='encodings/encodings.pkl')
+    parser.add_argument('--mode', choices=tuple(CODES), default='int8')
+    parser.add_argument('--rerank', type=int, default=32, help="Candidatos recalculados em float32")
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    matrix, names, _ = Gallery.load(args.encodings).snapshot()
+    if len(matrix) < 2:
+        print("[INFO] Galeria precisa de pelo menos 2 embeddings")
+    else:
+        report = evaluate(matrix, names, args.mode, args.rerank, args.tolerance, args.samples)
+        for key, value in report.items():
+            print(f"{key:<26} {value}")
@@ -0,0 +1,413 @@
+"""
+Galeria particionada em shards, com busca scatter-gather.
+
+Cada identidade pertence a exatamente um shard, escolhido por hashing de
+rendezvous (maior hash de `shard_id:nome`): ao adicionar ou remover um shard,
+só as identidades cujo dono mudou são movidas. O coordenador (`ShardedGallery`)
+envia cada busca a todos os shards em paralelo e junta os top-k parciais.
+
+Um shard pode ser local (`LocalShard`, no mesmo processo) ou um processo/nó
+HTTP (`HttpShard`), servido por:
+
+    FACE_SHARD_TOKEN=... python -m src.sharding serve --port 9101 --encodings encodings/shard-1.pkl
+
+Todas as rotas do shard exigem o token compartilhado de `FACE_SHARD_TOKEN`
+no header `X-Shard-Token`; o coordenador usa a mesma variável.
+
+Para testar com vários processos locais contra a galeria salva:
+
+    python -m src.sharding demo --shards 3 --encodings encodings/encodings.pkl
+"""
+
+import argparse
+import base64
+import hashlib
+import heapq
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from flask import Flask, jsonify, request
+
+from src.gallery import DTYPE, EMBEDDING_DIM, Gallery
+from src.matching import top_k_identities
+from src.profiling import check_admin_token
+
+
+def _pack(matrix):
+    """Embeddings (N x 128) em base64 de float32, para trafegar em JSON."""
+    return base64.b64encode(np.ascontiguousarray(matrix, dtype=DTYPE).tobytes()).decode('ascii')
+
+
+def _unpack(text):
+    return np.frombuffer(base64.b64decode(text), dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+
+
+def _score(shard_id, name):
+    digest = hashlib.blake2b(f"{shard_id}:{name}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def owner(name, shard_ids):
+    """Shard dono de `name` por hashing de rendezvous."""
+    return max(shard_ids, key=lambda shard_id: _score(shard_id, name))
+
+
+class LocalShard:
+    """Shard em memória no próprio processo."""
+
+    def __init__(self, shard_id, gallery=None, path=None):
+        self.shard_id = shard_id
+        self.gallery = gallery if gallery is not None else Gallery()
+        self.path = path
+
+    def search(self, probes, k):
+        return top_k_identities(probes, self.gallery, k)
+
+    def add(self, encoding, name):
+        self.gallery.add(encoding, name)
+
+    def replace(self, name, encodings):
+        return self.gallery.replace(name, encodings)
+
+    def remove(self, name):
+        return self.gallery.remove(name)
+
+    def identity_matrix(self, name):
+        return self.gallery.identity_matrix(name)
+
+    def identities(self):
+        return self.gallery.identities()
+
+    def stats(self):
+        return {"rows": len(self.gallery), "identities": len(self.gallery.identities()),
+                "generation": self.gallery.generation}
+
+    def save(self):
+        if self.path:
+            self.gallery.save(self.path)
+
+
+class HttpShard:
+    """Cliente de um shard remoto servido por `create_shard_app`."""
+
+    def __init__(self, url, timeout=5.0, token=None):
+        self.url = url.rstrip('/')
+        self.shard_id = self.url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['X-Shard-Token'] = token or os.environ.get('FACE_SHARD_TOKEN', '')
+
+    def _get(self, path, **params):
+        response = self.session.get(f"{self.url}{path}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, payload):
+        response = self.session.post(f"{self.url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, probes, k):
+        results = self._post('/shard/search', {"probes": _pack(np.atleast_2d(probes)), "k": k})["results"]
+        return [[(name, distance) for name, distance in row] for row in results]
+
+    def add(self, encoding, name):
+        self._post('/shard/add', {"name": name, "encodings": _pack(encoding)})
+
+    def replace(self, name, encodings):
+        return self._post('/shard/replace', {"name": name, "encodings": _pack(encodings)})["removed"]
+
+    def remove(self, name):
+        return self._post('/shard/replace', {"name": name, "encodings": _pack(np.empty((0, EMBEDDING_DIM)))})["removed"]
+
+    def identity_matrix(self, name):
+        return _unpack(self._get('/shard/identity', name=name)["encodings"])
+
+    def identities(self):
+        return self._get('/shard/identities')["identities"]
+
+    def stats(self):
+        return self._get('/shard/stats')
+
+    def save(self):
+        self._post('/shard/save', {})
+
+
+def create_shard_app(shard, token):
+    """App Flask que expõe um `LocalShard` ao coordenador que apresentar `token`."""
+    app = Flask('shard')
+
+    @app.before_request
+    def authorize():
+        if not check_admin_token(request.headers.get('X-Shard-Token'), token):
+            return jsonify({"success": False, "error": "Não autorizado"}), 403
+
+    @app.route('/shard/search', methods=['POST'])
+    def search():
+        data = request.get_json()
+        return jsonify({"results": shard.search(_unpack(data["probes"]), int(data.get("k", 1)))})
+
+    @app.route('/shard/add', methods=['POST'])
+    def add():
+        data = request.get_json()
+        for encoding in _unpack(data["encodings"]):
+            shard.add(encoding, data["name"])
+        return jsonify({"success": True})
+
+    @app.route('/shard/replace', methods=['POST'])
+    def replace():
+        data = request.get_json()
+        return jsonify({"removed": shard.replace(data["name"], _unpack(data["encodings"]))})
+
+    @app.route('/shard/identity', methods=['GET'])
+    def identity():
+        return jsonify({"encodings": _pack(shard.identity_matrix(request.args.get('name', '')))})
+
+    @app.route('/shard/identities', methods=['GET'])
+    def identities():
+        return jsonify({"identities": shard.identities()})
+
+    @app.route('/shard/stats', methods=['GET'])
+    def stats():
+        return jsonify(shard.stats())
+
+    @app.route('/shard/save', methods=['POST'])
+    def save():
+        shard.save()
+        return jsonify({"success": True})
+
+    return app
+
+
+class ShardedGallery:
+    """Coordenador: roteia escritas ao shard dono e faz scatter-gather nas buscas.
+
+    Expõe a mesma interface de escrita/leitura por identidade que `Gallery`,
+    então `EnrollmentPolicy` e os endpoints funcionam sem mudanças.
+    """
+
+    def __init__(self, shards, count_ttl=30.0):
+        self.shards = {shard.shard_id: shard for shard in shards}
+        self.generation = 0
+        self.count_ttl = count_ttl
+        self._count = None  # (linhas, instante da contagem)
+        self._count_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, len(self.shards)))
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Conecta aos shards HTTP listados na seção `sharding` do config.yaml."""
+        s = cfg.get('sharding', {})
+        return cls([HttpShard(url, timeout=s.get('timeout', 5.0)) for url in s.get('shards', [])],
+                   count_ttl=s.get('count_ttl', 30.0))
+
+    def _owner(self, name):
+        return self.shards[owner(name, list(self.shards))]
+
+    def _scatter(self, method, *args):
+        futures = [self._executor.submit(getattr(shard, method), *args) for shard in self.shards.values()]
+        return [f.result() for f in futures]
+
+    def __len__(self):
+        """Linhas em todos os shards: recontadas no máximo a cada `count_ttl` s e ajustadas a cada escrita."""
+        with self._count_lock:
+            if self._count is None or time.monotonic() - self._count[1] > self.count_ttl:
+                self._count = (sum(stats["rows"] for stats in self._scatter('stats')), time.monotonic())
+            return self._count[0]
+
+    def _adjust_count(self, delta=None):
+        """Soma `delta` à contagem em cache; sem `delta`, força a recontagem."""
+        with self._count_lock:
+            if self._count is not None:
+                self._count = None if delta is None else (self._count[0] + delta, self._count[1])
+
+    def identities(self):
+        return [name for names in self._scatter('identities') for name in names]
+
+    def identity_matrix(self, name):
+        return self._owner(name).identity_matrix(name)
+
+    def add(self, encoding, name):
+        self._owner(name).add(encoding, name)
+        self.generation += 1
+        self._adjust_count(1)
+
+    def replace(self, name, encodings):
+        encodings = np.asarray(encodings, dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+        removed = self._owner(name).replace(name, encodings)
+        self.generation += 1
+        self._adjust_count(len(encodings) - removed)
+        return removed
+
+    def remove(self, name):
+        return self.replace(name, [])
+
+    def save(self, path=None):
+        """Cada shard persiste a própria partição (`path` é ignorado)."""
+        self._scatter('save')
+
+    def search(self, probes, k=1, early_exit=None, block_rows=None):
+        """Top-k identidades de cada probe, juntando os top-k parciais dos shards.
+
+        Os shards varrem as suas partições inteiras, em paralelo: `early_exit`
+        e `block_rows` são aceitos pelo contrato de `top_k_identities` e ignorados.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=DTYPE))
+        if not len(probes) or not self.shards:
+            return [[] for _ in probes]
+        partials = self._scatter('search', probes, k)
+        # Cada identidade vive em um único shard, então juntar os top-k parciais é exato
+        return [heapq.nsmallest(k, (hit for part in partials for hit in part[i]), key=lambda hit: hit[1])
+                for i in range(len(probes))]
+
+    def match(self, probes, tolerance, early_exit=None, block_rows=None):
+        """Mesmo contrato de `match_faces`: `(nome ou None, distância ou None)` por probe (ver `search`)."""
+        results = []
+        for hits in self.search(probes, 1):
+            if not hits:
+                results.append((None, None))
+            else:
+                name, distance = hits[0]
+                results.append((name if distance <= tolerance else None, distance))
+        return results
+
+    def rebalance(self):
+        """Move cada identidade para o seu shard dono; retorna quantas foram movidas."""
+        moved = 0
+        for shard in list(self.shards.values()):
+            for name in shard.identities():
+                target = self._owner(name)
+                if target is not shard:
+                    target.replace(name, shard.identity_matrix(name))
+                    shard.remove(name)
+                    moved += 1
+        if moved:
+            self.generation += 1
+        return moved
+
+    def add_shard(self, shard):
+        """Adiciona um shard e move para ele as identidades que passam a ser suas."""
+        self.shards[shard.shard_id] = shard
+        previous, self._executor = self._executor, ThreadPoolExecutor(max_workers=max(4, len(self.shards)))
+        # Buscas em andamento terminam no pool antigo; as threads dele saem em seguida
+        previous.shutdown(wait=False)
+        self._adjust_count()
+        return self.rebalance()
+
+    def remove_shard(self, shard_id):
+        """Retira um shard (ainda acessível) redistribuindo as suas identidades."""
+        shard = self.shards.pop(shard_id)
+        moved = 0
+        for name in shard.identities():
+            self._owner(name).replace(name, shard.identity_matrix(name))
+            shard.remove(name)
+            moved += 1
+        self.generation += 1
+        self._adjust_count()
+        return shard, moved
+
+    def load(self, gallery):
+        """Distribui uma `Gallery` completa entre os shards; retorna linhas por shard."""
+        for name in gallery.identities():
+            self._owner(name).replace(name, gallery.identity_matrix(name))
+        self.generation += 1
+        self._adjust_count()
+        return {shard_id: stats["rows"] for shard_id, stats in zip(self.shards, self._scatter('stats'))}
+
+
+def serve_shard(host, port, path=None, token=None):
+    """Roda um shard HTTP (bloqueante), carregando/salvando a partição em `path`."""
+    from src.auth_stub import _QuietHandler
+    from werkzeug.serving import make_server
+    token = token or os.environ.get('FACE_SHARD_TOKEN')
+    if not token:
+        raise ValueError("Defina FACE_SHARD_TOKEN (token compartilhado entre o coordenador e os shards)")
+    gallery = Gallery.load(path) if path else Gallery()
+    app = create_shard_app(LocalShard(f"{host}:{port}", gallery, path), token)
+    make_server(host, port, app, threaded=True, request_handler=_QuietHandler).serve_forever()
+
+
+def start_local_shards(count, base_port=9101, host='127.0.0.1', directory=None, timeout=30.0, token=None):
+    """Inicia `count` shards em processos locais; retorna `(processos, urls)`."""
+    ctx = multiprocessing.get_context('spawn')
+    processes, urls = [], []
+    for i in range(count):
+        path = os.path.join(directory, f"shard-{i}.pkl") if directory else None
+        process = ctx.Process(target=serve_shard, args=(host, base_port + i, path, token), daemon=True)
+        process.start()
+        processes.append(process)
+        urls.append(f"http://{host}:{base_port + i}")
+    deadline = time.time() + timeout
+    for url in urls:
+        while True:
+            try:
+                HttpShard(url, timeout=1.0, token=token).stats()
+                break
+            except requests.RequestException:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Shard {url} não respondeu em {timeout}s")
+                time.sleep(0.1)
+    return processes, urls
+
+
+def _demo(args):
+    from src.matching import match_faces
+    gallery = Gallery.load(args.encodings)
+    if not len(gallery):
+        print(f"[INFO] Galeria vazia em {args.encodings}")
+        return
+    token = secrets.token_urlsafe(32)
+    processes, urls = start_local_shards(args.shards + 1, base_port=args.base_port, token=token)
+    try:
+        coordinator = ShardedGallery([HttpShard(url, token=token) for url in urls[:-1]])
+        print(f"[INFO] Linhas por shard: {coordinator.load(gallery)}")
+        matrix, _, _ = gallery.snapshot()
+        rng = np.random.default_rng(0)
+        probes = matrix[rng.choice(len(matrix), size=min(args.probes, len(matrix)), replace=False)]
+        probes = probes + rng.normal(0, 0.01, probes.shape).astype(DTYPE)
+
+        def check(label):
+            start = time.perf_counter()
+            sharded = coordinator.match(probes, args.tolerance)
+            elapsed = time.perf_counter() - start
+            single = match_faces(probes, gallery, args.tolerance)
+            agree = sum(a[0] == b[0] for a, b in zip(sharded, single))
+            print(f"[INFO] {label}: {agree}/{len(probes)} iguais ao processo único, "
+                  f"{elapsed / len(probes) * 1000:.2f} ms/probe")
+
+        check(f"{args.shards} shards")
+        moved = coordinator.add_shard(HttpShard(urls[-1], token=token))
+        print(f"[INFO] Shard adicionado: {moved} identidades movidas")
+        check(f"{args.shards + 1} shards")
+        _, moved = coordinator.remove_shard(urls[0])
+        print(f"[INFO] Shard removido: {moved} identidades movidas")
+        check(f"{args.shards} shards")
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shards da galeria de embeddings")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help="Roda um shard HTTP")
+    serve.add_argument('--host', default='127.0.0.1', help="0.0.0.0 expõe o shard na rede")
+    serve.add_argument('--port', type=int, default=9101)
+    serve.add_argument('--encodings', default=None, help="Arquivo da partição deste shard")
+    demo = sub.add_parser('demo', help="Particiona a galeria em processos locais e compara com o processo único")
+    demo.add_argument('--encodings', default='encodings/encodings.pkl')
+    demo.add_argument('--shards', type=int, default=3)
+    demo.add_argument('--base-port', type=int, default=9101)
+    demo.add_argument('--probes', type=int, default=100)
+    demo.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve_shard(args.host, args.port, args.encodings)
+    else:
+        _demo(args)
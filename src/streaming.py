@@ -0,0 +1,223 @@
+"""
+Sessões de reconhecimento em streaming (quadros binários + eventos SSE).
+
+O cliente abre a sessão com `POST /stream`, que devolve o id e um token
+aleatório exigido nas demais chamadas; envia os quadros JPEG/PNG numa única
+requisição de upload contínuo (`POST /stream/<sessão>/upload`, corpo HTTP
+chunked em que cada quadro é precedido do seu tamanho, ver `read_frames`) ou
+um por requisição (`POST /stream/<sessão>/frame`), e escuta
+`GET /stream/<sessão>/events` (Server-Sent Events em HTTP chunked).
+Cada sessão processa um quadro por vez: quadros que chegam enquanto ela está
+ocupada substituem o pendente (só o mais recente é processado) e os demais
+são descartados. A última caixa de face vira a ROI da próxima detecção, e o
+resultado é empurrado assim que houver um reconhecimento confiável.
+"""
+
+import json
+import queue
+import secrets
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.profiling import check_admin_token
+
+
+# Prefixo de cada quadro no upload contínuo: tamanho em bytes, 4 bytes big-endian
+FRAME_HEADER = struct.Struct('>I')
+
+
+def _read_exact(stream, size):
+    """Lê até `size` bytes (menos só no fim do corpo)."""
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frames(stream, max_frame_bytes=8 * 1024 * 1024):
+    """Quadros de um corpo de upload contínuo, à medida que chegam.
+
+    Cada quadro vem precedido do tamanho (`FRAME_HEADER`). Termina no fim do
+    corpo; tamanho inválido ou quadro truncado geram `ValueError`.
+    """
+    while True:
+        header = _read_exact(stream, FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("Cabeçalho de quadro truncado")
+        (size,) = FRAME_HEADER.unpack(header)
+        if not 0 < size <= max_frame_bytes:
+            raise ValueError(f"Tamanho de quadro inválido: {size}")
+        data = _read_exact(stream, size)
+        if len(data) < size:
+            raise ValueError("Quadro truncado")
+        yield data
+
+
+def expand_box(box, margin, shape):
+    """Expande `box` (x, y, w, h) em `margin` x tamanho para cada lado, limitado à imagem."""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    height, width = shape[:2]
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(width, x + w + dx), min(height, y + h + dy)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class StreamSession:
+    """Estado de uma sessão: quadro pendente, última caixa e assinantes de eventos."""
+
+    def __init__(self, session_id, token):
+        self.session_id = session_id
+        self.token = token
+        self.pending = None
+        self.busy = False
+        self.last_box = None
+        self.last_name = None
+        self.streak = 0
+        self.result = None
+        self.closed = False
+        self.received = 0
+        self.processed = 0
+        self.skipped = 0
+        self.last_seen = time.time()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.append(q)
+            # Quem chega depois do reconhecimento recebe o resultado direto
+            if self.result is not None:
+                q.put(('result', self.result))
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def publish(self, event, data):
+        with self._lock:
+            for q in self._subscribers:
+                q.put((event, data))
+
+    def stats(self):
+        return {"received": self.received, "processed": self.processed, "skipped": self.skipped}
+
+
+class StreamManager:
+    """Sessões ativas e o pool de workers que processa os quadros.
+
+    `process(session, data)` recebe os bytes do quadro e retorna um dict com
+    pelo menos `confident` (bool); pode atualizar `session.last_box`.
+    """
+
+    def __init__(self, process, workers=4, max_sessions=100, idle_timeout=30.0):
+        self.process = process
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stream')
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _expire(self, now):
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_seen > self.idle_timeout:
+                self.close(session_id)
+
+    def create(self):
+        """Abre uma sessão com id e token gerados pelo servidor; None no limite de sessões."""
+        with self._lock:
+            self._expire(time.time())
+            if len(self.sessions) >= self.max_sessions:
+                return None
+            session_id = secrets.token_urlsafe(9)
+            while session_id in self.sessions:
+                session_id = secrets.token_urlsafe(9)
+            session = self.sessions[session_id] = StreamSession(session_id, secrets.token_urlsafe(32))
+            return session
+
+    def get(self, session_id, token):
+        """Retorna a sessão se `token` for o dela; None se não existir ou o token não conferir."""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None or not check_admin_token(token, session.token):
+                return None
+            session.last_seen = time.time()
+            return session
+
+    def close(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.closed = True
+            session.publish('closed', session.stats())
+        return session
+
+    def submit(self, session, data):
+        """Entrega um quadro à sessão; retorna 'processing', 'queued' ou 'done'."""
+        with session._lock:
+            session.received += 1
+            # Um upload contínuo longo mantém a sessão viva sem outras chamadas
+            session.last_seen = time.time()
+            if session.result is not None:
+                return 'done'
+            if session.busy:
+                if session.pending is not None:
+                    session.skipped += 1
+                session.pending = data
+                return 'queued'
+            session.busy = True
+        self._executor.submit(self._run, session, data)
+        return 'processing'
+
+    def _run(self, session, data):
+        while data is not None:
+            if session.closed:
+                return
+            session.processed += 1
+            try:
+                result = self.process(session, data)
+            except Exception as e:
+                result = {"confident": False, "message": f"Erro no processamento: {e}"}
+            if result.get("confident"):
+                with session._lock:
+                    session.result = result
+                    session.pending = None
+                session.publish('result', result)
+                return
+            session.publish('progress', result)
+            with session._lock:
+                # Libera a sessão na mesma seção crítica em que vê a fila vazia
+                data, session.pending = session.pending, None
+                session.busy = data is not None
+
+    def events(self, session, heartbeat=15.0):
+        """Gerador de Server-Sent Events; termina após o resultado ou o fechamento."""
+        q = session.subscribe()
+        try:
+            yield f"event: ready\ndata: {json.dumps({'session': session.session_id})}\n\n"
+            while True:
+                try:
+                    event, data = q.get(timeout=heartbeat)
+                except queue.Empty:
+                    if session.closed:
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ('result', 'closed'):
+                    break
+        finally:
+            session.unsubscribe(q)
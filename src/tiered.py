@@ -0,0 +1,232 @@
+"""
+Galeria em duas camadas: identidades frequentes primeiro, galeria completa no erro.
+
+A camada quente é uma matriz pequena com os embeddings das identidades
+reconhecidas recentemente (LRU) ou com mais frequência (LFU). Cada busca
+compara primeiro com ela e só aceita o resultado abaixo de `hot_threshold`,
+mais rígido que a tolerância: como a camada quente não contém todo mundo,
+uma correspondência folgada poderia esconder uma identidade mais próxima na
+galeria completa. Sem acerto, a busca vai para a galeria completa (que pode
+estar em arquivo mapeado, ver `gallery.mmap_dir`, ou particionada) e a
+identidade encontrada é promovida para a camada quente.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.gallery import DTYPE, EMBEDDING_DIM
+from src.matching import distance_matrix, match_faces, top_k_identities
+
+POLICIES = ('lru', 'lfu')
+
+
+class HotTier:
+    """Embeddings de até `capacity` identidades, com despejo LRU ou LFU."""
+
+    def __init__(self, capacity=2000, policy='lru'):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de despejo inválida: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.evictions = 0
+        # nome -> [embeddings, usos]; a ordem é a do uso mais recente
+        self._entries = OrderedDict()
+        self._inserts = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def touch(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry[1] += 1
+                self._entries.move_to_end(name)
+
+    def _evict(self):
+        if self.policy == 'lru':
+            self._entries.popitem(last=False)
+        else:
+            # Empate: a identidade usada há mais tempo (primeira na ordem) sai
+            victim = min(self._entries, key=lambda name: self._entries[name][1])
+            del self._entries[victim]
+        self.evictions += 1
+
+    def put(self, name, embeddings):
+        """Insere (ou atualiza) `name`, despejando uma identidade se a camada estiver cheia."""
+        embeddings = np.asarray(embeddings, dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+        if not len(embeddings) or self.capacity <= 0:
+            return
+        with self._lock:
+            if name in self._entries:
+                self._entries[name][0] = embeddings
+                self._entries.move_to_end(name)
+            else:
+                if len(self._entries) >= self.capacity:
+                    self._evict()
+                self._entries[name] = [embeddings, 1]
+                self._inserts += 1
+                if self.policy == 'lfu' and self._inserts % self.capacity == 0:
+                    # Envelhecimento: identidades que pararam de aparecer acabam saindo
+                    for entry in self._entries.values():
+                        entry[1] //= 2
+            self._snapshot = None
+
+    def discard(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._snapshot = None
+
+    def snapshot(self):
+        """Retorna `(matriz, normas², nome de cada linha)`, refeitos só quando a camada muda."""
+        with self._lock:
+            if self._snapshot is None:
+                names = list(self._entries)
+                blocks = [self._entries[name][0] for name in names]
+                matrix = np.vstack(blocks) if blocks else np.empty((0, EMBEDDING_DIM), dtype=DTYPE)
+                row_names = np.array([name for name, block in zip(names, blocks) for _ in block], dtype=object)
+                self._snapshot = (matrix, np.einsum('ij,ij->i', matrix, matrix), row_names)
+            return self._snapshot
+
+
+class TieredGallery:
+    """Camada quente na frente de uma galeria completa (`Gallery` ou `ShardedGallery`).
+
+    Expõe a mesma interface de escrita/leitura por identidade, então os
+    endpoints, `EnrollmentPolicy` e `GalleryPersister` funcionam sem mudanças.
+    """
+
+    def __init__(self, full, capacity=2000, policy='lru', hot_threshold=0.45, promote_threshold=0.6,
+                 on_lookup=None):
+        self.full = full
+        self.hot = HotTier(capacity, policy)
+        self.hot_threshold = hot_threshold
+        self.promote_threshold = promote_threshold
+        self.on_lookup = on_lookup
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg, full, on_lookup=None):
+        """Envolve `full` conforme `gallery.hot_tier` do config.yaml."""
+        t = cfg.get('gallery', {}).get('hot_tier', {})
+        return cls(full, capacity=t.get('capacity', 2000), policy=t.get('policy', 'lru'),
+                   hot_threshold=t.get('threshold', 0.45),
+                   promote_threshold=cfg.get('face_recog', {}).get('tolerance', 0.6), on_lookup=on_lookup)
+
+    @property
+    def generation(self):
+        return self.full.generation
+
+    def __len__(self):
+        return len(self.full)
+
+    @property
+    def lock(self):
+        # AttributeError quando a galeria completa não tem lock (quem chama usa o seu)
+        return self.full.lock
+
+    def identities(self):
+        return self.full.identities()
+
+    def identity_matrix(self, name):
+        return self.full.identity_matrix(name)
+
+    def add(self, encoding, name):
+        self.full.add(encoding, name)
+        self.hot.discard(name)
+
+    def replace(self, name, encodings):
+        removed = self.full.replace(name, encodings)
+        self.hot.discard(name)
+        return removed
+
+    def swap(self, name, index, encoding):
+        if hasattr(self.full, 'swap'):
+            self.full.swap(name, index, encoding)
+        else:
+            embeddings = self.full.identity_matrix(name)
+            embeddings[index] = encoding
+            self.full.replace(name, embeddings)
+        self.hot.discard(name)
+
+    def remove(self, name):
+        return self.replace(name, [])
+
+    def save(self, path=None):
+        self.full.save(path)
+
+    def _promote(self, name):
+        generation = self.full.generation
+        embeddings = self.full.identity_matrix(name)
+        # Uma escrita concorrente em `name` pode ter tornado `embeddings` obsoleto
+        if self.full.generation == generation:
+            self.hot.put(name, embeddings)
+
+    def _record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if self.on_lookup:
+            self.on_lookup(hits, misses)
+
+    def match(self, probes, tolerance, early_exit=None, block_rows=None):
+        """Como `match_faces`: a camada quente responde quando a distância é ≤ `hot_threshold`.
+
+        `early_exit` e `block_rows` valem para a varredura da galeria completa.
+        """
+        probes = np.asarray(probes, dtype=DTYPE).reshape(-1, EMBEDDING_DIM)
+        if not len(probes):
+            return []
+        results = [None] * len(probes)
+        matrix, sq_norms, row_names = self.hot.snapshot()
+        if len(matrix):
+            threshold = min(self.hot_threshold, tolerance)
+            distances = distance_matrix(probes, matrix, sq_norms)
+            best = np.argmin(distances, axis=1)
+            for i, idx in enumerate(best):
+                distance = float(distances[i, idx])
+                if distance <= threshold:
+                    results[i] = (row_names[idx], distance)
+                    self.hot.touch(row_names[idx])
+        misses = [i for i, result in enumerate(results) if result is None]
+        self._record(len(probes) - len(misses), len(misses))
+        if misses:
+            for i, (name, distance) in zip(misses, match_faces(probes[misses], self.full, tolerance, early_exit, block_rows)):
+                results[i] = (name, distance)
+                if name is not None:
+                    self._promote(name)
+        return results
+
+    def search(self, probes, k=1, early_exit=None, block_rows=None):
+        """Top-k exato vem sempre da galeria completa; o melhor resultado alimenta a camada quente."""
+        results = top_k_identities(probes, self.full, k, early_exit, block_rows)
+        for candidates in results:
+            if candidates and candidates[0][1] <= self.promote_threshold:
+                name = candidates[0][0]
+                if name in self.hot:
+                    self.hot.touch(name)
+                else:
+                    self._promote(name)
+        return results
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.hot.policy,
+            "capacity": self.hot.capacity,
+            "identities": len(self.hot),
+            "rows": len(self.hot.snapshot()[0]),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.hot.evictions
+        }
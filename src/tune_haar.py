@@ -0,0 +1,172 @@
+"""
+Ajuste automático dos parâmetros do Haar Cascade contra um conjunto rotulado.
+
+O diretório do dataset deve conter as imagens e um `labels.json` no formato
+`{"imagem.jpg": [[x, y, w, h], ...], ...}`. Cada combinação de scaleFactor,
+minNeighbors e minSize é avaliada em paralelo (pool de processos),
+medindo recall/precisão (IoU >= 0.5) e throughput. A fronteira de Pareto
+throughput x recall é impressa e a configuração escolhida é gravada como um
+perfil nomeado em `haar_profiles.yaml`, selecionável por `haar.profile`:
+
+    python -m src.tune_haar --dataset dados/lobby --profile lobby --min-recall 0.95
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool, cpu_count
+
+import cv2
+import yaml
+
+from src.detectors import HaarDetector
+
+DEFAULT_PROFILES_FILE = 'haar_profiles.yaml'
+
+_images = None
+_cascade_path = None
+
+
+def load_dataset(dataset_dir):
+    """Lê `labels.json` e retorna lista de (caminho_da_imagem, caixas)."""
+    with open(os.path.join(dataset_dir, 'labels.json')) as f:
+        labels = json.load(f)
+    return [(os.path.join(dataset_dir, name), [tuple(b) for b in boxes]) for name, boxes in sorted(labels.items())]
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_boxes(detections, truths, threshold=0.5):
+    """Casamento guloso por IoU; retorna quantas faces rotuladas foram encontradas."""
+    remaining = list(detections)
+    hits = 0
+    for truth in truths:
+        best = max(remaining, key=lambda d: iou(d, truth), default=None)
+        if best is not None and iou(best, truth) >= threshold:
+            remaining.remove(best)
+            hits += 1
+    return hits
+
+
+def _init_worker(samples, cascade_path):
+    global _images, _cascade_path
+    # Uma thread OpenCV por processo: o paralelismo vem dos processos
+    cv2.setNumThreads(1)
+    _images = [(cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY), boxes) for path, boxes in samples]
+    _cascade_path = cascade_path
+
+
+def evaluate(params):
+    """Avalia uma combinação de parâmetros sobre todo o dataset."""
+    scale_factor, min_neighbors, min_size = params
+    detector = HaarDetector(_cascade_path, scaleFactor=scale_factor,
+                            minNeighbors=min_neighbors, minSize=(min_size, min_size))
+    hits = truths = detections = 0
+    start = time.perf_counter()
+    results = [(detector.detect(gray), boxes) for gray, boxes in _images]
+    elapsed = time.perf_counter() - start
+    for found, boxes in results:
+        found = [tuple(int(v) for v in d) for d in found]
+        hits += match_boxes(found, boxes)
+        truths += len(boxes)
+        detections += len(found)
+    return {
+        "scaleFactor": scale_factor,
+        "minNeighbors": min_neighbors,
+        "minSize": [min_size, min_size],
+        "recall": hits / truths if truths else 0.0,
+        "precision": hits / detections if detections else 0.0,
+        "images_per_second": len(_images) / elapsed if elapsed > 0 else float('inf')
+    }
+
+
+def pareto_front(results):
+    """Configurações não dominadas em (throughput, recall), da mais rápida à mais precisa."""
+    front = []
+    for r in results:
+        dominated = any(
+            o["images_per_second"] >= r["images_per_second"] and o["recall"] >= r["recall"]
+            and (o["images_per_second"] > r["images_per_second"] or o["recall"] > r["recall"])
+            for o in results
+        )
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: r["images_per_second"], reverse=True)
+
+
+def choose(front, min_recall):
+    """A configuração mais rápida que atinge `min_recall`; senão a de maior recall."""
+    eligible = [r for r in front if r["recall"] >= min_recall]
+    if eligible:
+        return max(eligible, key=lambda r: r["images_per_second"])
+    return max(front, key=lambda r: r["recall"])
+
+
+def write_profile(path, name, result):
+    """Grava/atualiza o perfil `name` no arquivo de perfis YAML."""
+    profiles = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            profiles = yaml.safe_load(f) or {}
+    profiles[name] = {
+        "scaleFactor": result["scaleFactor"],
+        "minNeighbors": result["minNeighbors"],
+        "minSize": result["minSize"],
+        "recall": round(result["recall"], 4),
+        "images_per_second": round(result["images_per_second"], 2)
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(profiles, f, default_flow_style=False, sort_keys=True)
+
+
+def _float_list(text):
+    return [float(v) for v in text.split(',')]
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ajuste dos parâmetros do Haar Cascade")
+    parser.add_argument('--dataset', required=True, help="Diretório com imagens e labels.json")
+    parser.add_argument('--cascade', default='src/models/haarcascade_frontalface_default.xml')
+    parser.add_argument('--scale-factors', type=_float_list, default=[1.05, 1.1, 1.2, 1.3, 1.4])
+    parser.add_argument('--min-neighbors', type=_int_list, default=[3, 4, 5, 6])
+    parser.add_argument('--min-sizes', type=_int_list, default=[20, 30, 40, 60, 80])
+    parser.add_argument('--min-recall', type=float, default=0.9, help="Recall mínimo desejado")
+    parser.add_argument('--processes', type=int, default=cpu_count())
+    parser.add_argument('--profile', default=None, help="Nome do perfil a gravar (ex.: tipo de câmera)")
+    parser.add_argument('--profiles-file', default=DEFAULT_PROFILES_FILE)
+    args = parser.parse_args()
+
+    samples = load_dataset(args.dataset)
+    grid = list(itertools.product(args.scale_factors, args.min_neighbors, args.min_sizes))
+    print(f"[INFO] {len(samples)} imagens, {len(grid)} combinações, {args.processes} processos")
+
+    with Pool(args.processes, initializer=_init_worker, initargs=(samples, args.cascade)) as pool:
+        results = pool.map(evaluate, grid)
+
+    front = pareto_front(results)
+    print(f"{'scale':>6} {'neigh':>6} {'minSize':>8} {'recall':>7} {'prec':>6} {'img/s':>8}")
+    for r in front:
+        print(f"{r['scaleFactor']:>6} {r['minNeighbors']:>6} {r['minSize'][0]:>8} "
+              f"{r['recall']:>7.3f} {r['precision']:>6.3f} {r['images_per_second']:>8.1f}")
+
+    chosen = choose(front, args.min_recall)
+    print(f"[INFO] Escolhido: scaleFactor={chosen['scaleFactor']} minNeighbors={chosen['minNeighbors']} "
+          f"minSize={chosen['minSize']} (recall {chosen['recall']:.3f}, {chosen['images_per_second']:.1f} img/s)")
+    if args.profile:
+        write_profile(args.profiles_file, args.profile, chosen)
+        print(f"[INFO] Perfil '{args.profile}' gravado em {args.profiles_file}; "
+              f"ative com haar.profile: {args.profile} no config.yaml")
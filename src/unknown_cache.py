@@ -0,0 +1,168 @@
+"""
+Cache de faces desconhecidas recentes, para não varrer a galeria a cada quadro.
+
+Um visitante não cadastrado na frente da câmera gera, quadro após quadro,
+embeddings quase iguais que nunca casam. Cada embedding desconhecido é
+guardado com a distância da melhor linha da galeria; pela desigualdade
+triangular, um probe a menos de `melhor - tolerância` dele também está fora
+da tolerância de toda a galeria, então o resultado "desconhecido" é exato
+sem a varredura. O alcance é calculado com a tolerância de cada busca e
+ainda limitado por `radius`.
+
+Entradas próximas (a até `radius`) formam um cluster, com até
+`members_per_cluster` representantes; um cluster sem acertos por `ttl`
+segundos expira, e o mais antigo é despejado quando o cache enche. Qualquer
+mudança na galeria (geração diferente) esvazia o cache.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from src.matching import distance_matrix, match_faces
+
+EMBEDDING_DIM = 128
+
+# Folga para o arredondamento das distâncias em float32: a borda do alcance não conta como acerto
+REACH_MARGIN = 1e-4
+
+
+class UnknownFaceCache:
+    """Embeddings desconhecidos recentes agrupados por distância, com expiração."""
+
+    def __init__(self, capacity=512, radius=0.25, ttl=30.0, members_per_cluster=4, on_lookup=None):
+        self.capacity = capacity
+        self.radius = radius
+        self.ttl = ttl
+        self.members_per_cluster = members_per_cluster
+        self.on_lookup = on_lookup
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._best = np.zeros(capacity)        # distância da melhor linha da galeria
+        self._cluster = np.full(capacity, -1)  # -1 = posição livre
+        self._seen = np.zeros(capacity)
+        self._next_cluster = 0
+        self._generation = None
+
+    @classmethod
+    def from_config(cls, cfg, on_lookup=None):
+        """Cria o cache conforme a seção `unknown_cache` do config.yaml (None se desativado)."""
+        u = cfg.get('unknown_cache', {})
+        if not u.get('enabled', True):
+            return None
+        return cls(capacity=u.get('capacity', 512), radius=u.get('radius', 0.25), ttl=u.get('ttl', 30.0),
+                   members_per_cluster=u.get('members_per_cluster', 4), on_lookup=on_lookup)
+
+    def _sync(self, generation):
+        if generation != self._generation:
+            self._cluster[:] = -1
+            self._generation = generation
+
+    def _live(self, now):
+        return (self._cluster >= 0) & (now - self._seen <= self.ttl)
+
+    def lookup(self, probes, generation, tolerance):
+        """Para cada probe, True se um desconhecido em cache garante que ele está fora de `tolerance`."""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        now = time.time()
+        with self._lock:
+            self._sync(generation)
+            live = np.flatnonzero(self._live(now))
+            results = [False] * len(probes)
+            if len(live) and len(probes):
+                distances = distance_matrix(probes, self._matrix[live])
+                reach = np.minimum(self.radius, self._best[live] - tolerance)
+                slack = reach[None, :] - distances
+                best = np.argmax(slack, axis=1)
+                for i, j in enumerate(best):
+                    if slack[i, j] > REACH_MARGIN:
+                        results[i] = True
+                        self._seen[self._cluster == self._cluster[live[j]]] = now
+            found = sum(results)
+            self.hits += found
+            self.misses += len(results) - found
+        if self.on_lookup:
+            self.on_lookup(found, len(results) - found)
+        return results
+
+    def add(self, probes, best_distances, generation, tolerance):
+        """Registra probes sem correspondência e a distância da melhor linha da galeria de cada um.
+
+        `generation` é a geração da galeria usada na busca; resultados de uma
+        geração já substituída são ignorados.
+        """
+        now = time.time()
+        with self._lock:
+            if generation != self._generation:
+                if self._generation is not None and generation < self._generation:
+                    return
+                self._sync(generation)
+            for probe, best in zip(np.asarray(probes, dtype=np.float32).reshape(-1, EMBEDDING_DIM), best_distances):
+                if best is None or best <= tolerance:
+                    continue
+                self._insert(probe, best, now)
+
+    def _insert(self, probe, best, now):
+        live = self._live(now)
+        self._cluster[~live] = -1
+        used = np.flatnonzero(live)
+        cluster = None
+        if len(used):
+            distances = distance_matrix(probe, self._matrix[used])[0]
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.radius:
+                cluster = self._cluster[used[nearest]]
+        if cluster is None:
+            cluster = self._next_cluster
+            self._next_cluster += 1
+            members = np.empty(0, dtype=np.int64)
+        else:
+            members = np.flatnonzero(self._cluster == cluster)
+        free = np.flatnonzero(self._cluster < 0)
+        if len(members) >= self.members_per_cluster:
+            slot = members[np.argmin(self._seen[members])]
+        elif len(free):
+            slot = free[0]
+        else:
+            # Cache cheio: despeja o cluster sem acertos há mais tempo
+            slot = int(np.argmin(self._seen))
+            self._cluster[self._cluster == self._cluster[slot]] = -1
+        self._matrix[slot] = probe
+        self._best[slot] = best
+        self._cluster[slot] = cluster
+        self._seen[self._cluster == cluster] = now
+
+    def match(self, probes, gallery, tolerance, matcher=match_faces):
+        """Como `match_faces`, mas só os probes fora do cache vão para `matcher`.
+
+        Probes cobertos pelo cache voltam como `(None, None)`: a distância
+        real à galeria não é calculada. Os que `matcher` não casar entram no
+        cache.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        generation = gallery.generation
+        cached = self.lookup(probes, generation, tolerance)
+        results = [(None, None)] * len(probes)
+        pending = [i for i, hit in enumerate(cached) if not hit]
+        if pending:
+            for i, result in zip(pending, matcher(probes[pending], gallery, tolerance)):
+                results[i] = result
+            unknown = [i for i in pending if results[i][0] is None and results[i][1] is not None]
+            if unknown:
+                self.add(probes[unknown], [results[i][1] for i in unknown], generation, tolerance)
+        return results
+
+    def stats(self):
+        with self._lock:
+            live = self._live(time.time())
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(live.sum()),
+                "clusters": len(set(self._cluster[live].tolist())),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None
+            }
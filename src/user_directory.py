@@ -0,0 +1,231 @@
+"""
+Réplica local do diretório de usuários do serviço de autenticação.
+
+Os usuários são puxados em lote (`GET /auth`) por uma thread em background a
+cada `sync_interval` segundos e ficam numa tabela em memória indexada por id
+e por nome normalizado (`casefold`). As leituras são atendidas só pela
+réplica, então o reconhecimento não espera o serviço Java e continua
+funcionando se ele estiver lento ou fora do ar. Com `sqlite_path`, a réplica
+também é gravada em SQLite (só quando os dados mudam) e recarregada na
+inicialização.
+
+Uma réplica mais velha que `max_staleness` continua respondendo, mas cada
+leitura é marcada (`on_stale: flag`, via `on_stale_read`) ou recusada com
+`StaleDirectoryError` (`on_stale: fail`).
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+STALE_POLICIES = ('flag', 'fail')
+
+
+class StaleDirectoryError(RuntimeError):
+    """Leitura recusada: a réplica passou de `max_staleness` com `on_stale: fail`."""
+
+
+def normalize_name(name):
+    return (name or '').casefold()
+
+
+class UserDirectory:
+    """Réplica dos usuários do serviço de auth, sincronizada em background."""
+
+    def __init__(self, auth_url, sync_interval=30.0, max_staleness=300.0, timeout=5.0,
+                 miss_refresh_interval=5.0, sqlite_path=None, on_stale='flag', on_stale_read=None):
+        if on_stale not in STALE_POLICIES:
+            raise ValueError(f"Política de réplica desatualizada inválida: {on_stale}")
+        self.auth_url = auth_url
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.on_stale = on_stale
+        self.on_stale_read = on_stale_read
+        self.timeout = timeout
+        self.miss_refresh_interval = miss_refresh_interval
+        self.sqlite_path = sqlite_path
+        self.version = 0
+        self.synced_at = None
+        self.last_error = None
+        self._by_id = {}
+        self._by_name = {}
+        self._users = []
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='user-directory', daemon=True)
+
+    @classmethod
+    def from_config(cls, cfg, auth_url, on_stale_read=None):
+        """Cria a réplica conforme a seção `user_directory` do config.yaml."""
+        d = cfg.get('user_directory', {})
+        return cls(
+            auth_url,
+            sync_interval=d.get('sync_interval', 30.0),
+            max_staleness=d.get('max_staleness', 300.0),
+            timeout=d.get('timeout', 5.0),
+            miss_refresh_interval=d.get('miss_refresh_interval', 5.0),
+            sqlite_path=d.get('sqlite_path'),
+            on_stale=d.get('on_stale', 'flag'),
+            on_stale_read=on_stale_read
+        )
+
+    def start(self):
+        """Carrega a cópia em disco (se houver), sincroniza uma vez e inicia a thread."""
+        if self.sqlite_path:
+            self._load_sqlite()
+        self.refresh()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _replace(self, users, synced_at):
+        """Troca a tabela se os usuários mudaram; retorna True nesse caso."""
+        by_id = {str(user.get('id')): user for user in users}
+        by_name = {normalize_name(user.get('nome')): user for user in users}
+        with self._lock:
+            changed = by_id != self._by_id
+            if changed:
+                self._users, self._by_id, self._by_name = list(users), by_id, by_name
+                self.version += 1
+            self.synced_at = synced_at
+            return changed
+
+    def refresh(self):
+        """Puxa todos os usuários numa chamada; retorna False se o serviço falhar.
+
+        Em caso de falha a réplica atual é mantida.
+        """
+        self._last_attempt = time.time()
+        try:
+            response = requests.get(f"{self.auth_url}/auth", timeout=self.timeout)
+            response.raise_for_status()
+            users = response.json()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Erro ao sincronizar usuários do serviço de auth: {e}")
+            return False
+        self.last_error = None
+        changed = self._replace(users, time.time())
+        if self.sqlite_path:
+            # Sem mudança, só o instante da sincronização é regravado
+            self._save_sqlite(users=changed)
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.sync_interval):
+            with self._refreshing:
+                self.refresh()
+
+    def _refresh_on_miss(self):
+        """Sincronização síncrona após uma busca sem resultado, no máximo uma por intervalo."""
+        if time.time() - self._last_attempt < self.miss_refresh_interval:
+            return False
+        with self._refreshing:
+            if time.time() - self._last_attempt < self.miss_refresh_interval:
+                return False
+            return self.refresh()
+
+    @property
+    def age(self):
+        """Segundos desde a última sincronização bem-sucedida (None se nunca sincronizou)."""
+        return None if self.synced_at is None else time.time() - self.synced_at
+
+    @property
+    def stale(self):
+        return self.synced_at is None or self.age > self.max_staleness
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _check_fresh(self):
+        """Aplica `on_stale` a uma leitura feita com a réplica desatualizada."""
+        if not self.stale:
+            return
+        if self.on_stale == 'fail':
+            if self.synced_at is None:
+                raise StaleDirectoryError("Réplica de usuários nunca sincronizada")
+            raise StaleDirectoryError(f"Réplica de usuários desatualizada ({self.age:.0f}s sem sincronizar)")
+        if self.on_stale_read:
+            self.on_stale_read()
+
+    def get_by_id(self, user_id, refresh_on_miss=False):
+        """Usuário pelo id; com `refresh_on_miss`, um id desconhecido força uma sincronização."""
+        self._check_fresh()
+        user = self._by_id.get(str(user_id))
+        if user is None and refresh_on_miss and self._refresh_on_miss():
+            user = self._by_id.get(str(user_id))
+        return user
+
+    def get_by_name(self, name):
+        self._check_fresh()
+        return self._by_name.get(normalize_name(name))
+
+    def get_by_names(self, names):
+        """Usuários encontrados, indexados pelo nome normalizado."""
+        self._check_fresh()
+        by_name = self._by_name
+        wanted = {normalize_name(name) for name in names}
+        return {key: by_name[key] for key in wanted if key in by_name}
+
+    def status(self):
+        return {
+            "users": len(self),
+            "version": self.version,
+            "age": self.age,
+            "stale": self.stale,
+            "on_stale": self.on_stale,
+            "last_error": self.last_error
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.sqlite_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, nome TEXT, nome_norm TEXT, "
+                     "email TEXT, perfil TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS users_nome_norm ON users (nome_norm)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+        return conn
+
+    def _save_sqlite(self, users=True):
+        """Grava o instante da sincronização e, com `users`, a tabela de usuários."""
+        try:
+            with self._lock:
+                rows, synced_at = list(self._users), self.synced_at
+            conn = self._connect()
+            with conn:
+                if users:
+                    conn.execute("DELETE FROM users")
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)",
+                        [(str(u.get('id')), u.get('nome'), normalize_name(u.get('nome')), u.get('email'),
+                          u.get('perfil')) for u in rows]
+                    )
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('synced_at', ?)", (synced_at,))
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar a réplica de usuários em {self.sqlite_path}: {e}")
+
+    def _load_sqlite(self):
+        try:
+            conn = self._connect()
+            rows = conn.execute("SELECT id, nome, email, perfil FROM users").fetchall()
+            meta = conn.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler a réplica de usuários em {self.sqlite_path}: {e}")
+            return
+        users = [
+            {"id": int(user_id) if user_id.isdigit() else user_id, "nome": nome, "email": email, "perfil": perfil}
+            for user_id, nome, email, perfil in rows
+        ]
+        if users:
+            self._replace(users, meta[0] if meta else None)
@@ -18,27 +18,96 @@ def draw_box_and_label(frame, box, label, color=(0,255,0), thickness=2, method='
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
 def save_encodings(encodings, names, path):
-    """Salva embeddings e nomes em arquivo."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    data = {'encodings': encodings, 'names': names}
-    with open(path, 'wb') as f:
-        pickle.dump(data, f)
+    """Salva embeddings e nomes em arquivo.
 
-def load_encodings(path):
-    """Carrega embeddings e nomes de arquivo."""
+    Os embeddings vão como uma única matriz float32 (N x 128): o descritor do
+    dlib já é float32, então não há perda, e evita-se o overhead de um array
+    pickled por embedding. A escrita é atômica (arquivo temporário, fsync e
+    rename), então uma queda no meio nunca deixa o arquivo corrompido.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+    data = {'encodings': matrix, 'names': list(names)}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Garante que o rename em si chegou ao disco
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def load_encoding_matrix(path):
+    """Carrega `(matriz float32 N x 128, nomes)`; aceita o formato antigo (lista de arrays)."""
     if not os.path.exists(path):
-        return [], []
+        return np.empty((0, 128), dtype=np.float32), []
     with open(path, 'rb') as f:
         data = pickle.load(f)
-    return data.get('encodings', []), data.get('names', [])
+    matrix = np.asarray(data.get('encodings', []), dtype=np.float32).reshape(-1, 128)
+    return matrix, list(data.get('names', []))
+
+def load_encodings(path):
+    """Carrega embeddings e nomes de arquivo."""
+    matrix, names = load_encoding_matrix(path)
+    return list(matrix), names
+
+def boxes_to_locations(boxes):
+    """Converte caixas Haar (x, y, w, h) para o formato (top, right, bottom, left) do dlib."""
+    return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in boxes]
+
+def encode_faces(image, boxes, num_jitters=1, landmark_model='small'):
+    """Gera os embeddings de todas as faces da imagem numa única chamada ao encoder.
+
+    As caixas do detector são usadas diretamente como localização das faces,
+    evitando uma segunda detecção HOG dentro de cada recorte.
+    """
+    if len(boxes) == 0:
+        return []
+    import dlib
+    from face_recognition import api as fr_api
+    rgb = np.ascontiguousarray(image[:, :, ::-1])  # BGR → RGB (dlib exige memória contígua)
+    shapes = dlib.full_object_detections()
+    shapes.extend(fr_api._raw_face_landmarks(rgb, boxes_to_locations(boxes), model=landmark_model))
+    descriptors = fr_api.face_encoder.compute_face_descriptor(rgb, shapes, num_jitters)
+    return [np.array(d) for d in descriptors]
+
+def encode_face_crops(crops, boxes, num_jitters=1, landmark_model='small'):
+    """Como `encode_faces`, para uma face por imagem (`crops[i]`, `boxes[i]`), numa única chamada ao encoder."""
+    if len(crops) == 0:
+        return []
+    import dlib
+    from face_recognition import api as fr_api
+    images, shapes = [], []
+    for crop, box in zip(crops, boxes):
+        rgb = np.ascontiguousarray(crop[:, :, ::-1])
+        detections = dlib.full_object_detections()
+        detections.extend(fr_api._raw_face_landmarks(rgb, boxes_to_locations([box]), model=landmark_model))
+        images.append(rgb)
+        shapes.append(detections)
+    descriptors = fr_api.face_encoder.compute_face_descriptor(images, shapes, num_jitters)
+    return [np.array(d[0]) for d in descriptors]
+
+def enroll_face_in_memory(face_crop, name, known_encodings, known_names, quality_gate=None):
+    """Gera embedding da face e adiciona na memória.
 
-def enroll_face_in_memory(face_crop, name, known_encodings, known_names):
-    """Gera embedding da face e adiciona na memória."""
-    face_rgb = face_crop[:, :, ::-1]  # BGR → RGB
-    encs = face_recognition.face_encodings(face_rgb)
+    Com `quality_gate`, recortes reprovados são descartados antes do encoding.
+    Retorna True se um embedding foi adicionado.
+    """
+    if quality_gate is not None and not quality_gate.check(face_crop)[0]:
+        return False
+    h, w = face_crop.shape[:2]
+    encs = encode_faces(face_crop, [(0, 0, w, h)])
     if encs:
         known_encodings.append(encs[0])
         known_names.append(name)
+        return True
+    return False
 
 def load_faces(faces_dir='faces'):
     """Carrega todos os rostos cadastrados e gera embeddings."""
@@ -50,7 +50,8 @@ def test_files():
         "src/detectors.py",
         "src/utils.py",
         "config.yaml",
-        "src/models/haarcascade_frontalface_default.xml"
+        "src/models/haarcascade_frontalface_default.xml",
+        "src/models/lbpcascade_frontalface.xml"
     ]
     
     all_exist = True
@@ -83,6 +84,306 @@ def test_directories():
     
     return all_exist
 
+def test_unknown_cache():
+    """Testa se um probe dentro do alcance do cache de desconhecidos é mesmo desconhecido."""
+    print("🔍 Testando cache de desconhecidos...")
+    import numpy as np
+    from src.gallery import Gallery
+    from src.matching import distance_matrix, match_faces
+    from src.unknown_cache import UnknownFaceCache
+
+    rng = np.random.default_rng(0)
+    tolerance = 0.6
+    gallery = Gallery(rng.normal(0, 0.09, (2000, 128)), [f"p{i}" for i in range(2000)])
+    cache = UnknownFaceCache(capacity=64, radius=0.25)
+    # Visitantes um pouco além da tolerância de alguém cadastrado (alcance menor que `radius`)
+    offsets = rng.normal(size=(32, 128))
+    offsets *= (rng.uniform(0.65, 0.8, 32) / np.linalg.norm(offsets, axis=1))[:, None]
+    visitors = gallery.snapshot()[0][:32] + offsets
+    cache.match(visitors, gallery, tolerance)
+
+    # Pior caso: probes andando do visitante em direção à linha mais próxima, até `radius`;
+    # os que o cache cobre não podem ser reconhecidos pela galeria
+    nearest = np.argmin(distance_matrix(visitors, gallery.snapshot()[0]), axis=1)
+    directions = gallery.snapshot()[0][nearest] - visitors
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    probes = np.vstack([visitors + directions * step for step in np.linspace(0, cache.radius, 8)])
+    covered = cache.lookup(probes, gallery.generation, tolerance)
+    recognized = [name is not None for name, _ in match_faces(probes, gallery, tolerance)]
+    violations = sum(hit and known for hit, known in zip(covered, recognized))
+    print(f"   {sum(covered)}/{len(probes)} probes cobertos pelo cache, {sum(recognized)} reconhecidos, "
+          f"{violations} cobertos e reconhecidos")
+    assert sum(covered) > 0 and sum(recognized) > 0 and violations == 0
+    assert all(result == (None, None) for result, hit in zip(cache.match(probes, gallery, tolerance), covered) if hit)
+    return True
+
+def test_enrollment_policy():
+    """Testa deduplicação, limite por identidade e compactação da galeria."""
+    print("🔍 Testando política de cadastro...")
+    import numpy as np
+    from src.compaction import EnrollmentPolicy, compact_gallery
+    from src.gallery import Gallery
+
+    rng = np.random.default_rng(1)
+    policy = EnrollmentPolicy(dedup_distance=0.15, max_samples=4)
+    gallery = Gallery()
+    samples = rng.normal(0, 0.3, (6, 128))
+    for sample in samples[:4]:
+        assert policy.enroll(gallery, sample, "ana")
+    # Quase idêntica a uma cadastrada: ignorada
+    assert not policy.enroll(gallery, samples[0] + 0.001, "ana")
+    # No limite: a identidade nunca passa de max_samples e um snapshot antigo não muda
+    before, _, norms = gallery.snapshot()
+    before, norms = before.copy(), norms.copy()
+    old_view = gallery.snapshot()
+    for sample in samples[4:]:
+        policy.enroll(gallery, sample, "ana")
+    assert len(gallery.identity_matrix("ana")) == 4
+    assert np.array_equal(old_view[0], before) and np.array_equal(old_view[2], norms)
+
+    # Compactação: só as identidades com redundância mudam
+    base = rng.normal(0, 0.3, (3, 128))
+    matrix = np.vstack([base[0], base[0] + 0.001, base[1], base[2]])
+    gallery = Gallery(matrix, ["a", "a", "b", "c"])
+    rows_before, rows_after = compact_gallery(gallery, policy)
+    print(f"   {rows_before} -> {rows_after} embeddings após a compactação")
+    assert (rows_before, rows_after) == (4, 3)
+    assert sorted(gallery.names) == ["a", "b", "c"]
+    assert np.allclose(gallery.identity_matrix("b"), base[1])
+    return True
+
+def test_top_k_and_early_exit():
+    """Testa o top-k contra a força bruta e a parada antecipada da varredura em blocos."""
+    print("🔍 Testando top-k e early exit...")
+    import numpy as np
+    from src.gallery import Gallery
+    from src.matching import distance_matrix, match_faces, scan_blocks, top_k_identities
+    from src.tiered import TieredGallery
+
+    rng = np.random.default_rng(2)
+    matrix = rng.normal(0, 0.09, (3000, 128)).astype(np.float32)
+    names = [f"p{i % 700}" for i in range(3000)]
+    probes = matrix[[5, 1500, 2999]] + rng.normal(0, 0.01, (3, 128)).astype(np.float32)
+
+    # Top-k exato: menor distância por identidade, igual à força bruta
+    distances = distance_matrix(probes, matrix)
+    for row, result in zip(distances, top_k_identities(probes, Gallery(matrix, names), k=5, block_rows=512)):
+        per_identity = {}
+        for name, distance in zip(names, row):
+            per_identity[name] = min(distance, per_identity.get(name, np.inf))
+        expected = sorted(per_identity.items(), key=lambda item: item[1])[:5]
+        assert [name for name, _ in result] == [name for name, _ in expected]
+        assert np.allclose([d for _, d in result], [d for _, d in expected], atol=1e-5)
+
+    # Parada antecipada: um "quase" no primeiro bloco encerra a varredura antes da cópia exata no último
+    probe = matrix[-1]
+    near = probe + 0.2 / np.sqrt(128)
+    early = np.vstack([near, matrix[1:]])
+    names_early = ["perto"] + names[1:-1] + ["exato"]
+    assert len(scan_blocks(len(early))) > 1
+    for quantization in ('none', 'int8'):
+        gallery = Gallery(early, names_early, quantization=quantization)
+        full = match_faces([probe], gallery, 0.6)[0]
+        stopped = match_faces([probe], gallery, 0.6, early_exit=0.3)[0]
+        tiered = match_faces([probe], TieredGallery(gallery), 0.6, early_exit=0.3)[0]
+        print(f"   {quantization}: completa {full[0]}, com early exit {stopped[0]}")
+        assert full[0] == "exato" and stopped[0] == "perto" and tiered[0] == "perto"
+        assert top_k_identities([probe], gallery, 1, early_exit=0.3)[0][0][0] == "perto"
+    return True
+
+def test_image_store():
+    """Testa que o manifesto só recebe imagens já gravadas."""
+    print("🔍 Testando armazenamento de imagens...")
+    import json
+    import tempfile
+    import numpy as np
+    from src.image_store import ImageStore
+
+    root = tempfile.mkdtemp()
+    store = ImageStore(root, fmt='png')
+    crop = np.random.default_rng(3).integers(0, 255, (60, 60, 3), dtype=np.uint8)
+    digest, added = store.put("ana", crop)
+    # Pendente: deduplica e conta como usuário, mas ainda não está no manifesto
+    assert added and not store.put("ana", crop)[1] and store.has_user("ana")
+    store.flush()
+    with open(os.path.join(root, "ana", "manifest.json")) as f:
+        manifest = json.load(f)
+    assert [entry["hash"] for entry in manifest["images"]] == [digest]
+    assert os.path.exists(os.path.join(root, "ana", manifest["images"][0]["file"]))
+
+    # Gravação que falha (o diretório do usuário é um arquivo): nada entra no manifesto
+    open(os.path.join(root, "bia"), 'w').close()
+    store.put("bia", crop)
+    store.flush()
+    assert not store.has_user("bia") and store.count("bia") == 0
+
+    # Remoção com gravação pendente: a gravação não ressuscita o usuário
+    store.put("caio", crop)
+    store.delete_user("caio")
+    store.flush()
+    store.stop()
+    print(f"   usuários gravados: {sorted(store.users())}")
+    assert sorted(store.users()) == ["ana"] and not os.path.exists(os.path.join(root, "caio"))
+    return True
+
+def test_stream_upload_frames():
+    """Testa a leitura dos quadros do upload contínuo de streaming."""
+    print("🔍 Testando upload contínuo de quadros...")
+    import io
+    from src.streaming import FRAME_HEADER, read_frames
+
+    frames = [b"quadro-1", b"q2", b"x" * 70000]
+    body = b"".join(FRAME_HEADER.pack(len(frame)) + frame for frame in frames)
+    assert list(read_frames(io.BufferedReader(io.BytesIO(body), buffer_size=7))) == frames
+    for broken in (body[:-1], body + b"\x00\x00", FRAME_HEADER.pack(0)):
+        try:
+            list(read_frames(io.BytesIO(broken)))
+        except ValueError:
+            continue
+        raise AssertionError("corpo inválido aceito")
+    print(f"   {len(frames)} quadros lidos de um corpo de {len(body)} bytes")
+    return True
+
+def test_quantized_gallery():
+    """Testa que a varredura int16/int8 com rerank devolve o mesmo resultado da busca exata."""
+    print("🔍 Testando galeria quantizada...")
+    import numpy as np
+    from src.gallery import Gallery
+    from src.matching import distance_matrix, match_faces
+    from src.quantization import QuantizedMatrix
+
+    rng = np.random.default_rng(4)
+    matrix = rng.normal(0, 0.09, (5000, 128)).astype(np.float32)
+    names = [f"p{i // 5}" for i in range(5000)]
+    probes = matrix[rng.choice(5000, 40, replace=False)] + rng.normal(0, 0.02, (40, 128)).astype(np.float32)
+    exact = match_faces(probes, Gallery(matrix, names), 0.6)
+    for mode in ('int16', 'int8'):
+        # Distâncias grossas próximas das exatas (em distância², escala da galeria)
+        coarse = QuantizedMatrix(matrix, mode).coarse_distances(probes[:4], 100, 300)
+        error = np.abs(coarse - distance_matrix(probes[:4], matrix[100:300]) ** 2).max()
+        results = match_faces(probes, Gallery(matrix, names, quantization=mode, rerank_candidates=16), 0.6)
+        agree = sum(r[0] == e[0] for r, e in zip(results, exact))
+        print(f"   {mode}: {agree}/{len(probes)} iguais à busca exata, erro grosso máx. {error:.4f}")
+        assert agree == len(probes) and error < 0.05
+        # O rerank devolve a distância exata em float32
+        assert np.allclose([r[1] for r in results], [e[1] for e in exact], atol=1e-5)
+    return True
+
+def test_sharded_gallery():
+    """Testa o particionamento por rendezvous: mesmo resultado da galeria única e pouca movimentação."""
+    print("🔍 Testando galeria particionada...")
+    import numpy as np
+    from src.gallery import Gallery
+    from src.matching import match_faces, top_k_identities
+    from src.sharding import LocalShard, ShardedGallery, _pack, create_shard_app, owner
+
+    rng = np.random.default_rng(5)
+    matrix = rng.normal(0, 0.09, (900, 128)).astype(np.float32)
+    names = [f"p{i // 3}" for i in range(900)]
+    single = Gallery(matrix, names)
+    sharded = ShardedGallery([LocalShard(f"s{i}") for i in range(3)])
+    sharded.load(single)
+    probes = matrix[rng.choice(900, 20, replace=False)] + rng.normal(0, 0.02, (20, 128)).astype(np.float32)
+    assert match_faces(probes, sharded, 0.6) == match_faces(probes, single, 0.6)
+    assert [[n for n, _ in c] for c in top_k_identities(probes, sharded, 3)] == \
+           [[n for n, _ in c] for c in top_k_identities(probes, single, 3)]
+    assert len(sharded) == 900 and sorted(sharded.identities()) == sorted(single.identities())
+
+    # Um shard novo recebe só as identidades que passam a ser suas; nenhuma troca entre os antigos
+    before = {name: owner(name, ["s0", "s1", "s2"]) for name in single.identities()}
+    moved = sharded.add_shard(LocalShard("s3"))
+    after = {name: owner(name, list(sharded.shards)) for name in before}
+    assert moved == sum(shard == "s3" for shard in after.values())
+    assert all(after[name] in (before[name], "s3") for name in before)
+    assert all(name in sharded.shards[after[name]].identities() for name in before)
+    print(f"   {moved}/{len(before)} identidades movidas para o shard novo")
+
+    # O app do shard exige o token compartilhado
+    client = create_shard_app(sharded.shards["s0"], "segredo").test_client()
+    body = {"probes": _pack(probes[:1]), "k": 1}
+    assert client.post('/shard/search', json=body).status_code == 403
+    assert client.post('/shard/search', json=body, headers={"X-Shard-Token": "segredo"}).status_code == 200
+    return True
+
+def test_hot_tier():
+    """Testa o despejo LRU/LFU da camada quente e os acertos da galeria em camadas."""
+    print("🔍 Testando camada quente...")
+    import numpy as np
+    from src.gallery import Gallery
+    from src.matching import match_faces
+    from src.tiered import HotTier, TieredGallery
+
+    rng = np.random.default_rng(6)
+    embedding = lambda: rng.normal(0, 0.09, (1, 128))
+    lru, lfu = HotTier(capacity=2, policy='lru'), HotTier(capacity=2, policy='lfu')
+    for tier in (lru, lfu):
+        tier.put("a", embedding())
+        tier.put("b", embedding())
+        for _ in range(3):
+            tier.touch("a")
+        tier.touch("b")
+        tier.put("c", embedding())
+    # LRU despeja o usado há mais tempo ("a"); LFU, o menos usado ("b")
+    assert "a" not in lru and {"b", "c"} <= set(lru._entries)
+    assert "b" not in lfu and {"a", "c"} <= set(lfu._entries)
+
+    matrix = rng.normal(0, 0.09, (500, 128)).astype(np.float32)
+    names = [f"p{i}" for i in range(500)]
+    full = Gallery(matrix, names)
+    tiered = TieredGallery(full, capacity=10)
+    probes = matrix[[7, 7, 42]] + rng.normal(0, 0.01, (3, 128)).astype(np.float32)
+    first = match_faces(probes, tiered, 0.6)
+    second = match_faces(probes, tiered, 0.6)
+    assert first == match_faces(probes, full, 0.6) and [r[0] for r in second] == ["p7", "p7", "p42"]
+    # A segunda rodada é respondida pela camada quente; uma escrita na identidade a tira de lá
+    assert tiered.hits >= 3 and "p7" in tiered.hot
+    tiered.replace("p7", matrix[7:8] + 0.5)
+    assert "p7" not in tiered.hot and match_faces(probes[:1], tiered, 0.6)[0][0] is None
+    print(f"   {tiered.hits} acertos e {tiered.misses} erros na camada quente")
+    return True
+
+def test_enrolled_users_pagination():
+    """Testa a paginação por cursor e o 304 de /enrolled-users (servidor em diretório temporário)."""
+    print("🔍 Testando paginação de /enrolled-users...")
+    import shutil
+    import tempfile
+    import numpy as np
+    from src.auth_stub import make_users, start_auth_stub
+
+    cwd = os.getcwd()
+    work = tempfile.mkdtemp()
+    shutil.copy("config.yaml", work)
+    os.symlink(os.path.abspath("src"), os.path.join(work, "src"))
+    os.environ["AUTH_API_URL"] = "http://127.0.0.1:8098"
+    stub = start_auth_stub(port=8098, users=make_users(3))
+    try:
+        os.chdir(work)
+        import src.api_server as api
+        crop = np.random.default_rng(7).integers(0, 255, (60, 60, 3), dtype=np.uint8)
+        for name in ("usuario1", "usuario2", "usuario3"):
+            api.image_store.put(name, crop)
+        api.image_store.flush()
+        client = api.app.test_client()
+
+        first = client.get('/enrolled-users?limit=2')
+        page = first.get_json()
+        rest = client.get(f'/enrolled-users?limit=2&cursor={page["next_cursor"]}').get_json()
+        listed = [user["nome"] for user in page["users"] + rest["users"]]
+        assert listed == ["usuario1", "usuario2", "usuario3"] and rest["next_cursor"] is None
+
+        # Nada mudou: 304; uma imagem nova muda o ETag
+        etag = first.headers["ETag"]
+        assert client.get('/enrolled-users?limit=2', headers={"If-None-Match": etag}).status_code == 304
+        api.image_store.put("usuario1", crop[::-1])
+        api.image_store.flush()
+        changed = client.get('/enrolled-users?limit=2', headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["ETag"] != etag
+        print(f"   páginas: {len(page['users'])} + {len(rest['users'])} usuários, ETag {etag}")
+    finally:
+        os.chdir(cwd)
+        stub.stop()
+    return True
+
 def main():
     print("=" * 50)
     print("🧪 TESTE BÁSICO DA APLICAÇÃO")
@@ -98,7 +399,15 @@ def main():
     dirs_ok = test_directories()
     print()
     
-    if imports_ok and files_ok and dirs_ok:
+    behaviour_ok = True
+    for test in (test_unknown_cache, test_enrollment_policy, test_top_k_and_early_exit,
+                 test_image_store, test_stream_upload_frames,
+                 test_quantized_gallery, test_sharded_gallery, test_hot_tier,
+                 test_enrolled_users_pagination):
+        behaviour_ok = test() and behaviour_ok
+        print()
+    
+    if imports_ok and files_ok and dirs_ok and behaviour_ok:
         print("🎉 Tudo está configurado corretamente!")
         print()
         print("📱 Como testar:")